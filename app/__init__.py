@@ -3,8 +3,9 @@ from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from jinja2.utils import import_string
+from sqlalchemy import event
 
-from instance.config import TestingConfig, DevelopmentConfig, ProductionConfig
+from instance.config import TestingConfig, DevelopmentConfig, ProductionConfig, BenchmarkConfig
 
 # Create a SQLAlchemy database instance
 db = SQLAlchemy()
@@ -21,6 +22,8 @@ def create_app(config_name='development'):
         return_app.config.from_object(ProductionConfig)
     elif config_name == 'testing':
         return_app.config.from_object(TestingConfig)
+    elif config_name == 'benchmark':
+        return_app.config.from_object(BenchmarkConfig)
     else:
         return_app.config.from_object(DevelopmentConfig)
 
@@ -28,6 +31,12 @@ def create_app(config_name='development'):
     db.init_app(return_app)
     migrate.init_app(return_app, db, render_as_batch=True)
 
+    # Enforce the foreign keys on every SQLite connection
+    from app.sql import enable_foreign_keys
+    with return_app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', enable_foreign_keys)
+
     # Import and register the app's API routes
     for blueprint_name in return_app.config['BLUEPRINTS']:
         blueprint = import_string(f'app.routes.{blueprint_name}:{blueprint_name}_bp')
@@ -36,6 +45,69 @@ def create_app(config_name='development'):
     # Initialize JWT
     jwt.init_app(return_app)
 
+    # Revoked tokens are rejected by every endpoint which requires a JWT
+    from app.token_blocklist import check_if_token_revoked
+    jwt.token_in_blocklist_loader(check_if_token_revoked)
+    return_app.extensions['token_blocklist'] = import_string(return_app.config['TOKEN_BLOCKLIST'])()
+
+    # Token buckets of the login attempts per client IP and per username
+    rate_limiter = import_string(return_app.config['LOGIN_RATE_LIMITER'])
+    return_app.extensions['login_ip_limiter'] = rate_limiter(
+        burst=return_app.config['LOGIN_IP_BURST'], refill=return_app.config['LOGIN_IP_REFILL'],
+        max_keys=return_app.config['LOGIN_RATE_LIMIT_MAX_KEYS'])
+    return_app.extensions['login_username_limiter'] = rate_limiter(
+        burst=return_app.config['LOGIN_USERNAME_BURST'], refill=return_app.config['LOGIN_USERNAME_REFILL'],
+        max_keys=return_app.config['LOGIN_RATE_LIMIT_MAX_KEYS'])
+
+    # Background deletion of the expired refresh tokens
+    from app.refresh_tokens import RefreshTokenPruner
+    return_app.extensions['refresh_token_pruner'] = RefreshTokenPruner(
+        return_app, interval=return_app.config['REFRESH_TOKEN_PRUNE_INTERVAL'],
+        batch_size=return_app.config['REFRESH_TOKEN_PRUNE_BATCH'])
+
+    # Compress the responses for the clients which accept it
+    from app.compression import compress_response
+    return_app.after_request(compress_response)
+
+    # Register the maintenance commands
+    from app.commands import guests_cli, households_cli, sync_cli, tokens_cli
+    return_app.cli.add_command(guests_cli)
+    return_app.cli.add_command(tokens_cli)
+    return_app.cli.add_command(households_cli)
+    return_app.cli.add_command(sync_cli)
+
+    # Store of the responses replayed for repeated Idempotency-Key headers
+    idempotency_store = import_string(return_app.config['IDEMPOTENCY_STORE'])
+    return_app.extensions['idempotency'] = idempotency_store(ttl=return_app.config['IDEMPOTENCY_KEY_TTL'],
+                                                             max_keys=return_app.config['IDEMPOTENCY_MAX_KEYS'])
+
+    # Broker of the guest change events
+    event_broker = import_string(return_app.config['EVENT_BROKER'])
+    return_app.extensions['events'] = event_broker(buffer_size=return_app.config['EVENT_BUFFER_SIZE'])
+
+    # Cache of the guests who are checked in right now
+    from app.occupancy import OccupancyCache
+    return_app.extensions['occupancy'] = OccupancyCache()
+
+    # Hit rates of the compiled statement cache
+    from app.statements import StatementCacheStats
+    statement_cache = StatementCacheStats(log_every=return_app.config['STATEMENT_CACHE_LOG_EVERY'])
+    with return_app.app_context():
+        statement_cache.attach(db.engine)
+    return_app.extensions['statement_cache'] = statement_cache
+
+    # Worker threads of the jobs deferred after the responses
+    from app.jobs import JobQueue
+    job_backend = import_string(return_app.config['JOB_BACKEND'])
+    return_app.extensions['jobs'] = JobQueue(return_app, job_backend(max_jobs=return_app.config['JOB_QUEUE_SIZE']),
+                                             workers=return_app.config['JOB_WORKERS'],
+                                             max_attempts=return_app.config['JOB_MAX_ATTEMPTS'],
+                                             retry_delay=return_app.config['JOB_RETRY_DELAY'])
+
+    # Access log of the API requests and audit log of the guest and user writes
+    from app.request_log import RequestLog
+    return_app.extensions['request_log'] = RequestLog(return_app)
+
     return return_app
 
 
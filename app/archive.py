@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+from . import db
+from .models import Guest, GuestHistory
+
+# Columns copied from the guest table to the history table
+ARCHIVED_COLUMNS = ['id', 'household_id', 'room_id', 'guest_type_id', 'inviter_id', 'coming_date', 'coming_time', 'exit_time', 'comment']
+
+
+def archive_guests(days, chunk_size=1000) -> int:
+    """
+    Move the guests who came more than the given number of days ago into the history table.
+    Every chunk of guests is moved in its own transaction, so the guest table is never locked for long
+    :param days: Archive horizon, guests of this day and later stay in the guest table
+    :type days: int
+    :param chunk_size: Number of guests moved by one transaction
+    :type chunk_size: int
+    :return: Number of moved guests
+    :rtype: int
+    """
+    before = date.today() - timedelta(days=days)
+    moved = 0
+    while True:
+        ids = db.session.scalars(db.select(Guest.id).where(Guest.coming_date < before)
+                                 .order_by(Guest.coming_date).limit(chunk_size)).all()
+        if not ids:
+            return moved
+        columns = [getattr(Guest, column) for column in ARCHIVED_COLUMNS]
+        db.session.execute(db.insert(GuestHistory).from_select(ARCHIVED_COLUMNS,
+                                                               db.select(*columns).where(Guest.id.in_(ids))))
+        db.session.execute(db.delete(Guest).where(Guest.id.in_(ids)), execution_options={'synchronize_session': False})
+        db.session.commit()
+        moved += len(ids)
+
+
+def reaches_history(household_id, start_date) -> bool:
+    """
+    Check whether a listing of the household from the date can contain archived guests
+    :param household_id: Household of the listing
+    :type household_id: int
+    :param start_date: First date of the listing, None if it isn't limited
+    :type start_date: date
+    :rtype: bool
+    """
+    last_archived = db.session.scalar(db.select(db.func.max(GuestHistory.coming_date))
+                                      .where(GuestHistory.household_id == household_id))
+    return last_archived is not None and (start_date is None or start_date <= last_archived)
+
+
+def guest_filters(model, household_id, inviter_id=None, guest_type_id=None, start_date=None, end_date=None) -> list:
+    """
+    Build the conditions of a guest listing of the household for the guest or the history table
+    :param model: Guest or GuestHistory
+    :param household_id: Household of the listing
+    :type household_id: int
+    :rtype: list
+    """
+    conditions = [model.household_id == household_id]
+    if inviter_id:
+        conditions.append(model.inviter_id == inviter_id)
+    if guest_type_id:
+        conditions.append(model.guest_type_id == guest_type_id)
+    if start_date:
+        conditions.append(model.coming_date >= start_date)
+    if end_date:
+        conditions.append(model.coming_date <= end_date)
+    return conditions
+
+
+def paginate_with_history(page, per_page, **filters) -> tuple[list, int]:
+    """
+    Get a page of the guests and the archived guests, ordered by their stays
+    :param page: Number of the page, starting from 1
+    :type page: int
+    :param per_page: Number of guests per page
+    :type per_page: int
+    :param filters: Filters of guest_filters
+    :return: Guests of the page, not attached to the session, and the total number of guests
+    :rtype: tuple[list[Guest], int]
+    """
+    guests = db.union_all(*[
+        db.select(*[getattr(model, column) for column in ARCHIVED_COLUMNS]).where(*guest_filters(model, **filters))
+        for model in (Guest, GuestHistory)
+    ]).subquery()
+    total = db.session.scalar(db.select(db.func.count()).select_from(guests))
+    rows = db.session.execute(db.select(guests).order_by(guests.c.coming_date, guests.c.coming_time, guests.c.id)
+                              .limit(per_page).offset((page - 1) * per_page))
+    return [Guest(**row._mapping) for row in rows], total
@@ -0,0 +1,58 @@
+from flask import current_app, jsonify
+
+from . import db
+
+
+def parse_ids(value) -> list[int]:
+    """
+    Parse the comma separated IDs of the ids query param, repeated IDs are kept once
+    :param value: For example 1,2,3
+    :type value: str
+    :return: The IDs in the requested order
+    :rtype: list[int]
+    :raises ValueError: When one of the IDs isn't an integer
+    """
+    ids = (int(part) for part in value.split(',') if part.strip())
+    return list(dict.fromkeys(ids))
+
+
+def get_by_ids(model, ids, chunk_size=500, *conditions) -> tuple[list, list[int]]:
+    """
+    Get the rows with the IDs, with one query per chunk_size IDs
+    :param model: Model with the integer id primary key
+    :param ids: IDs of the rows
+    :type ids: list[int]
+    :param chunk_size: Number of IDs bound to one IN list, databases limit the number of parameters
+    :type chunk_size: int
+    :param conditions: Additional conditions of the rows, the rows which don't match are missing
+    :return: The found rows in the order of ids and the IDs which weren't found
+    :rtype: tuple[list, list[int]]
+    """
+    found = {}
+    for start in range(0, len(ids), chunk_size):
+        for row in db.session.scalars(db.select(model).where(model.id.in_(ids[start:start + chunk_size]), *conditions)):
+            found[row.id] = row
+    return [found[row_id] for row_id in ids if row_id in found], [row_id for row_id in ids if row_id not in found]
+
+
+def batch_response(model, value, key, *conditions):
+    """
+    Respond to a list request with the ids query param
+    :param model: Model of the listed rows
+    :param value: Value of the ids query param
+    :type value: str
+    :param key: Key of the rows in the response, for example users
+    :type key: str
+    :param conditions: Additional conditions of the rows, for example their household
+    :return: A JSON object with the rows in the requested order and missing_ids
+    :rtype: tuple[Response, int]
+    """
+    try:
+        ids = parse_ids(value)
+    except ValueError:
+        return jsonify({'error': 'ids must be comma separated integers'}), 400
+    if len(ids) > current_app.config['BATCH_FETCH_MAX_IDS']:
+        return jsonify({'error': 'At most {} ids can be requested'.format(current_app.config['BATCH_FETCH_MAX_IDS'])}), 400
+
+    rows, missing_ids = get_by_ids(model, ids, current_app.config['BATCH_FETCH_CHUNK_SIZE'], *conditions)
+    return jsonify({key: [row.to_dict() for row in rows], 'missing_ids': missing_ids}), 200
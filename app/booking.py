@@ -0,0 +1,181 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from . import db
+from .models import BookingDay
+from .sql import insert_ignore
+
+# Lock row taken by the writes of recurring guests, they span many days at once
+SERIES_LOCK_DAY = date.min
+
+
+def _bump_day(household_id, day) -> int:
+    """
+    Bump the version of the booking day row, which locks it
+    :return: Number of the locked rows
+    :rtype: int
+    """
+    bump = db.update(BookingDay).where(BookingDay.household_id == household_id, BookingDay.day == day) \
+        .values(version=BookingDay.version + 1)
+    return db.session.execute(bump).rowcount
+
+
+def _create_day(household_id, day) -> None:
+    """
+    Create the booking day row if it doesn't exist and lock it
+    """
+    db.session.execute(insert_ignore(BookingDay).values(household_id=household_id, day=day, version=0))
+    _bump_day(household_id, day)
+
+
+def lock_booking_day(household_id, day) -> None:
+    """
+    Take the write lock on the booking day row until the end of the current transaction.
+
+    Bookings of the same day of the household queue on this row, so the overlap check and
+    the insert that follows it can't interleave with another writer. Bookings of other days
+    or other households lock other rows and don't wait for each other (SQLite has a single
+    writer for the whole database, there the lock is only held for the check-and-insert)
+    :param household_id: Household of the booking
+    :type household_id: int
+    :param day: Coming date of the booking
+    :type day: date
+    """
+    if _bump_day(household_id, day) == 0:
+        # First booking of this day. Recurring guests only lock the day rows which exist,
+        # so the new row is created under their lock to not slip past a series check
+        lock_series(household_id)
+        _create_day(household_id, day)
+
+
+def lock_stay_days(household_id, day) -> None:
+    """
+    Lock the booking days a stay coming on the day may cover. A stay lasts less than a day,
+    so two stays which overlap come on the same day or on neighbour days, and their writes
+    always share one of the locked rows. The days are locked in order
+    :param household_id: Household of the booking
+    :type household_id: int
+    :param day: Coming date of the booking
+    :type day: date
+    """
+    lock_booking_day(household_id, day)
+    lock_booking_day(household_id, day + timedelta(days=1))
+
+
+def lock_series(household_id, start=None, end=None) -> None:
+    """
+    Take the lock of the recurring guest writes of the household until the end of the current
+    transaction. With a date range it also locks every booking day of the range, so single
+    bookings of those days wait for the series check
+    :param household_id: Household of the series
+    :type household_id: int
+    :param start: (Optional) First date of the series
+    :type start: date
+    :param end: (Optional) Last date of the series, None if it never ends
+    :type end: date
+    """
+    if _bump_day(household_id, SERIES_LOCK_DAY) == 0:
+        _create_day(household_id, SERIES_LOCK_DAY)
+    if start is not None:
+        days = db.update(BookingDay).where(BookingDay.household_id == household_id, BookingDay.day >= start) \
+            .values(version=BookingDay.version + 1)
+        if end is not None:
+            days = days.where(BookingDay.day <= end)
+        db.session.execute(days, execution_options={'synchronize_session': False})
+
+
+def _within(moment, start, end):
+    """
+    Build the condition of a time of the day falling between start and end, which wrap over midnight
+    when end is before start
+    """
+    return or_(and_(start <= end, moment >= start, moment <= end),
+               and_(start > end, or_(moment >= start, moment <= end)))
+
+
+def time_overlap(model, coming_time, exit_time):
+    """
+    Build the condition of the times of the day of a stay of the model overlapping the given times.
+    A stay over midnight covers the end of its day and the start of the next one, so the condition
+    holds for the stays which may overlap on the same day or the next or previous one. Their dates
+    are compared with stay_bounds
+    :param model: Guest or GuestSeries
+    :param coming_time: Coming time of the checked stay
+    :type coming_time: time
+    :param exit_time: Exit time of the checked stay
+    :type exit_time: time
+    """
+    return or_(_within(model.coming_time, coming_time, exit_time),
+               _within(coming_time, model.coming_time, model.exit_time))
+
+
+def stay_bounds(coming_date, coming_time, exit_time):
+    """
+    Convert a stay into a datetime interval. A stay whose exit time is before its
+    coming time ends on the next day
+    :return: Start and end of the stay
+    :rtype: tuple[datetime, datetime]
+    """
+    start = datetime.combine(coming_date, coming_time)
+    end = datetime.combine(coming_date, exit_time)
+    if end < start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def peak_occupancy(stays, start, end) -> int:
+    """
+    Sweep over the sorted starts and ends of the stays and find the largest number of them
+    at the same moment between start and end. Stays touching at one moment are counted together
+    :param stays: Iterable of (start, end) datetime intervals in any order
+    :param start: Start of the checked interval
+    :type start: datetime
+    :param end: End of the checked interval
+    :type end: datetime
+    :rtype: int
+    """
+    events = []
+    for stay_start, stay_end in stays:
+        stay_start, stay_end = max(stay_start, start), min(stay_end, end)
+        if stay_start <= stay_end:
+            # At the same moment the starts (0) are swept before the ends (1)
+            events.append((stay_start, 0))
+            events.append((stay_end, 1))
+    events.sort()
+
+    peak = current = 0
+    for _, is_end in events:
+        if is_end:
+            current -= 1
+        else:
+            current += 1
+            peak = max(peak, current)
+    return peak
+
+
+def free_windows(stays, start, end, duration) -> list[tuple[datetime, datetime]]:
+    """
+    Sweep over the stays sorted by their start and collect the gaps between them
+    :param stays: Iterable of (start, end) datetime intervals sorted by start
+    :param start: Start of the searched range
+    :type start: datetime
+    :param end: End of the searched range
+    :type end: datetime
+    :param duration: Minimal length of a free window
+    :type duration: timedelta
+    :return: Free windows which are at least duration long
+    :rtype: list[tuple[datetime, datetime]]
+    """
+    windows = []
+    # End of the latest stay seen so far, everything before it is occupied
+    cursor = start
+    for stay_start, stay_end in stays:
+        if stay_start >= end:
+            break
+        if stay_start - cursor >= duration:
+            windows.append((cursor, stay_start))
+        cursor = max(cursor, stay_end)
+    if end - cursor >= duration:
+        windows.append((cursor, end))
+    return windows
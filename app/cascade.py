@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import literal
+
+from . import db
+from .models import Guest, GuestHistory, GuestSeries, GuestSeriesException, GuestStats, RefreshToken, Tombstone
+
+
+def _execute(statement):
+    return db.session.execute(statement, execution_options={'synchronize_session': False})
+
+
+def delete_user_rows(user_id) -> int:
+    """
+    Delete the rows which belong to the user with one bulk statement per table in the current
+    transaction, none of them is loaded. The foreign keys cascade the same way, the statements
+    are still issued so the deleted guests and series get tombstones
+    :param user_id: ID of the deleted user
+    :type user_id: int
+    :return: Number of deleted guests
+    :rtype: int
+    """
+    # Tombstones of the guests, the archived guests and the series, so the delta sync removes them from the clients
+    for model, table_name in ((Guest, 'guest'), (GuestHistory, 'guest'), (GuestSeries, 'guest_series')):
+        _execute(db.insert(Tombstone).from_select(
+            ['household_id', 'table_name', 'row_id', 'deleted_at'],
+            db.select(model.household_id, literal(table_name), model.id, literal(datetime.utcnow()))
+            .where(model.inviter_id == user_id)))
+
+    # Aggregates, series with their exceptions and refresh tokens of the user
+    _execute(db.delete(GuestStats).where(GuestStats.inviter_id == user_id))
+    series = db.select(GuestSeries.id).where(GuestSeries.inviter_id == user_id)
+    _execute(db.delete(GuestSeriesException).where(GuestSeriesException.series_id.in_(series)))
+    _execute(db.delete(GuestSeries).where(GuestSeries.inviter_id == user_id))
+    _execute(db.delete(RefreshToken).where(RefreshToken.user_id == user_id))
+    _execute(db.delete(GuestHistory).where(GuestHistory.inviter_id == user_id))
+
+    return _execute(db.delete(Guest).where(Guest.inviter_id == user_id)).rowcount
+
+
+def guest_type_in_use(guest_type_id) -> bool:
+    """
+    Check whether a guest, an archived guest or a series still has the type. Such types can't be deleted,
+    their guests would lose their type or would have to be deleted with it
+    :type guest_type_id: int
+    :rtype: bool
+    """
+    return db.session.scalar(db.select(
+        db.select(Guest.id).where(Guest.guest_type_id == guest_type_id).exists()
+        | db.select(GuestHistory.id).where(GuestHistory.guest_type_id == guest_type_id).exists()
+        | db.select(GuestSeries.id).where(GuestSeries.guest_type_id == guest_type_id).exists()))
+
+
+def room_in_use(room_id) -> bool:
+    """
+    Check whether a guest, an archived guest or a series still stays in the room, such rooms can't be deleted
+    :type room_id: int
+    :rtype: bool
+    """
+    return db.session.scalar(db.select(
+        db.select(Guest.id).where(Guest.room_id == room_id).exists()
+        | db.select(GuestHistory.id).where(GuestHistory.room_id == room_id).exists()
+        | db.select(GuestSeries.id).where(GuestSeries.room_id == room_id).exists()))
+
+
+def delete_guest_type_rows(guest_type_id) -> None:
+    """
+    Delete the aggregates left of the guest type in the current transaction
+    :type guest_type_id: int
+    """
+    _execute(db.delete(GuestStats).where(GuestStats.guest_type_id == guest_type_id))
@@ -0,0 +1,110 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.archive import archive_guests
+from app.households import DEFAULT_ROOM_NAME
+from app.models import Guest, GuestHistory, GuestSeries, Household, Room, User
+from app.refresh_tokens import prune_refresh_tokens
+from app.search import rebuild_search_index
+from app.stats import rebuild_stats
+from app.tombstones import prune_tombstones
+
+guests_cli = AppGroup('guests', help='Maintenance of the guest tables.')
+tokens_cli = AppGroup('tokens', help='Maintenance of the token tables.')
+households_cli = AppGroup('households', help='Management of the households.')
+sync_cli = AppGroup('sync', help='Maintenance of the delta sync.')
+
+
+@guests_cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """
+    Recompute the per day, inviter and guest type aggregates from the guest table
+    """
+    rows = rebuild_stats()
+    click.echo('Rebuilt {} aggregate rows'.format(rows))
+
+
+@guests_cli.command('rebuild-search')
+def rebuild_search_command():
+    """
+    Rebuild the full-text index of the guest comments from the guest table
+    """
+    rebuild_search_index()
+    click.echo('Rebuilt the search index')
+
+
+@guests_cli.command('archive')
+@click.option('--days', type=int, default=None, help='Archive horizon in days, GUEST_ARCHIVE_DAYS by default.')
+@click.option('--chunk-size', type=int, default=None, help='Guests moved per transaction.')
+def archive_guests_command(days, chunk_size):
+    """
+    Move the guests older than the archive horizon into the history table, meant to be run daily
+    """
+    days = current_app.config['GUEST_ARCHIVE_DAYS'] if days is None else days
+    if days < 2:
+        # The guests checked in yesterday may still be in the house
+        raise click.BadParameter('The horizon must be at least 2 days', param_hint='--days')
+    guests = archive_guests(days, chunk_size or current_app.config['GUEST_ARCHIVE_CHUNK_SIZE'])
+    click.echo('Archived {} guests'.format(guests))
+
+
+@tokens_cli.command('prune')
+def prune_tokens_command():
+    """
+    Forget the revoked and refresh tokens which have expired anyway
+    """
+    tokens = current_app.extensions['token_blocklist'].prune()
+    click.echo('Pruned {} revoked tokens'.format(tokens))
+    tokens = prune_refresh_tokens(current_app.config['REFRESH_TOKEN_PRUNE_BATCH'])
+    click.echo('Pruned {} refresh tokens'.format(tokens))
+
+
+@households_cli.command('create')
+@click.argument('name')
+def create_household_command(name):
+    """
+    Create a household with its Main room, its first user is added with move-user
+    """
+    household = Household(name=name)
+    db.session.add(household)
+    db.session.flush()
+    db.session.add(Room(name=DEFAULT_ROOM_NAME, capacity=1, household_id=household.id))
+    db.session.commit()
+    click.echo('Created household {} with ID {}'.format(household.name, household.id))
+
+
+@households_cli.command('move-user')
+@click.argument('username')
+@click.argument('household_id', type=int)
+def move_user_command(username, household_id):
+    """
+    Move the user into another household. The guests stay in the household they were booked in,
+    so only the users without guests can be moved
+    """
+    user = db.session.scalar(db.select(User).where(User.username == username))
+    if user is None:
+        raise click.BadParameter('User not found', param_hint='USERNAME')
+    if db.session.get(Household, household_id) is None:
+        raise click.BadParameter('Household not found', param_hint='HOUSEHOLD_ID')
+    has_guests = db.session.scalar(db.select(
+        db.select(Guest.id).where(Guest.inviter_id == user.id).exists()
+        | db.select(GuestHistory.id).where(GuestHistory.inviter_id == user.id).exists()
+        | db.select(GuestSeries.id).where(GuestSeries.inviter_id == user.id).exists()))
+    if has_guests:
+        raise click.ClickException('The user still has guests in their household')
+    user.household_id = household_id
+    db.session.commit()
+    click.echo('Moved {} into household {}'.format(user.username, household_id))
+
+
+@sync_cli.command('prune')
+@click.option('--days', type=int, default=None, help='Retention in days, SYNC_TOMBSTONE_RETENTION_DAYS by default.')
+def prune_tombstones_command(days):
+    """
+    Forget the deletes older than the retention, the clients which synced before then get a full resync
+    """
+    days = current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS'] if days is None else days
+    tombstones = prune_tombstones(days, current_app.config['SYNC_TOMBSTONE_PRUNE_BATCH'])
+    click.echo('Pruned {} tombstones'.format(tombstones))
@@ -0,0 +1,102 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ZlibCompressor:
+    """
+    gzip or deflate compressor with the same interface as brotli.Compressor
+    """
+
+    def __init__(self, encoding, level):
+        # gzip wraps the deflate stream into the gzip header, HTTP deflate is the zlib format
+        wbits = zlib.MAX_WBITS | 16 if encoding == 'gzip' else zlib.MAX_WBITS
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def process(self, data) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def supported_encodings() -> list[str]:
+    """
+    Content encodings in the order of preference
+    :rtype: list[str]
+    """
+    encodings = ['gzip', 'deflate']
+    if brotli is not None:
+        encodings.insert(0, 'br')
+    return encodings
+
+
+def make_compressor(encoding, config):
+    """
+    Create the compressor of the encoding with the level from the config
+    :param encoding: br, gzip or deflate
+    :type encoding: str
+    :param config: Config of the app
+    """
+    if encoding == 'br':
+        return brotli.Compressor(quality=config['COMPRESS_BROTLI_LEVEL'])
+    return ZlibCompressor(encoding, config['COMPRESS_LEVEL'])
+
+
+def _compress_stream(chunks, compressor):
+    """
+    Compress a streamed response chunk by chunk. Every chunk is flushed, so the client
+    gets it as soon as the view yields it (server-sent events rely on that)
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    After request hook which compresses the response with the best encoding accepted
+    by the client. Buffered responses smaller than COMPRESS_MIN_SIZE are sent as they are
+    :param response: Response of the view
+    :return: The same response, compressed when it is worth it
+    """
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] \
+            or response.status_code < 200 or response.status_code in (204, 304) \
+            or response.mimetype not in config['COMPRESS_MIMETYPES'] \
+            or 'Content-Encoding' in response.headers \
+            or response.direct_passthrough:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    if encoding is None:
+        return response
+
+    compressor = make_compressor(encoding, config)
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compressor.process(data) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
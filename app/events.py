@@ -0,0 +1,133 @@
+import json
+import queue
+import threading
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+
+from flask import current_app
+
+Event = namedtuple('Event', ['id', 'type', 'data', 'household_id'])
+
+
+class EventBroker(ABC):
+    """
+    Publish/subscribe of the guest changes. Published events are also kept in a ring buffer
+    of buffer_size events, so a reconnecting client can get the events it missed
+    """
+
+    def __init__(self, buffer_size=1000, subscriber_queue_size=100):
+        self.buffer_size = buffer_size
+        self.subscriber_queue_size = subscriber_queue_size
+
+    @abstractmethod
+    def publish(self, event_type, data, household_id=None) -> Event:
+        """
+        Send the event to every subscriber, the subscribers pick the events of their household
+        :param event_type: Type of the event, for example guest_created
+        :type event_type: str
+        :param data: JSON serializable payload
+        :param household_id: Household the event belongs to
+        :type household_id: int
+        :return: The published event with its ID
+        :rtype: Event
+        """
+
+    @abstractmethod
+    def subscribe(self) -> queue.Queue:
+        """
+        Start receiving the published events
+        :return: Queue the events are put into, None is put when the subscriber falls behind
+        :rtype: queue.Queue
+        """
+
+    @abstractmethod
+    def unsubscribe(self, subscription) -> None:
+        """
+        Stop receiving the published events
+        :type subscription: queue.Queue
+        """
+
+    @abstractmethod
+    def events_since(self, last_event_id):
+        """
+        Get the buffered events published after the given one
+        :type last_event_id: int
+        :return: The events, None if some of them were already dropped from the buffer
+        :rtype: list[Event]
+        """
+
+
+class MemoryEventBroker(EventBroker):
+    """
+    Broker living in the memory of the process, only the clients of this process get its events
+    """
+
+    def __init__(self, buffer_size=1000, subscriber_queue_size=100):
+        super().__init__(buffer_size, subscriber_queue_size)
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._last_id = 0
+
+    def publish(self, event_type, data, household_id=None) -> Event:
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, event_type, data, household_id)
+            self._buffer.append(event)
+            for subscription in list(self._subscribers):
+                try:
+                    subscription.put_nowait(event)
+                except queue.Full:
+                    # The client is too slow, it has to reconnect and resume from the buffer
+                    self._subscribers.discard(subscription)
+                    with subscription.mutex:
+                        subscription.queue.clear()
+                    subscription.put_nowait(None)
+        return event
+
+    def subscribe(self) -> queue.Queue:
+        subscription = queue.Queue(maxsize=self.subscriber_queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def events_since(self, last_event_id):
+        with self._lock:
+            if last_event_id > self._last_id:
+                # The ID comes from another broker, for example before a restart
+                return None
+            if last_event_id < self._last_id - len(self._buffer):
+                return None
+            return [event for event in self._buffer if event.id > last_event_id]
+
+
+def format_event(event) -> str:
+    """
+    Format the event as a server-sent event
+    :type event: Event
+    :rtype: str
+    """
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event.id, event.type, json.dumps(event.data))
+
+
+def notify_guest_change(event_type, data, household_id) -> None:
+    """
+    Drop the cached current guests of the household, push the committed change to the event stream
+    and load the current guests again in the background unless the job backend is shared
+    :param event_type: Type of the change, for example guest_created
+    :type event_type: str
+    :param data: Serialized guest or series
+    :type data: dict
+    :param household_id: Household of the changed guests
+    :type household_id: int
+    """
+    current_app.extensions['occupancy'].invalidate(household_id)
+    current_app.extensions['events'].publish(event_type, data, household_id)
+    # The cache of this process is warmed, the workers of a shared job backend may run in another one
+    jobs = current_app.extensions['jobs']
+    if jobs.accepts('warm_occupancy'):
+        jobs.enqueue('warm_occupancy', household_id=household_id)
@@ -0,0 +1,58 @@
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from . import db
+from .models import Room, User
+
+# Room of the guests booked without one, every household got it with the rooms
+DEFAULT_ROOM_NAME = 'Main room'
+
+
+def household_claims(user) -> dict:
+    """
+    Build the claims added to the tokens of the user
+    :type user: User
+    :rtype: dict
+    """
+    return {'household_id': user.household_id}
+
+
+def current_household_id() -> int:
+    """
+    Get the household of the caller from the claims of the JWT. Tokens issued before the
+    households existed don't have the claim, for them the user is looked up
+    :rtype: int
+    """
+    household_id = get_jwt().get('household_id')
+    if household_id is None:
+        household_id = db.session.scalar(db.select(User.household_id).where(User.id == get_jwt_identity()))
+    return household_id
+
+
+def get_in_household(model, row_id):
+    """
+    Get the row by its ID if it belongs to the household of the caller
+    :param model: Model with household_id
+    :param row_id: ID of the row
+    :type row_id: int
+    :return: The row, None if it doesn't exist or belongs to another household
+    """
+    row = db.session.get(model, row_id)
+    if row is None or row.household_id != current_household_id():
+        return None
+    return row
+
+
+def default_room_id(household_id):
+    """
+    Get the room of the guests booked without a room_id, the Main room of the household
+    or else its only room
+    :type household_id: int
+    :return: ID of the room, None if the household has several rooms and no Main room
+    :rtype: int
+    """
+    room_id = db.session.scalar(db.select(Room.id).where(Room.household_id == household_id,
+                                                         Room.name == DEFAULT_ROOM_NAME))
+    if room_id is None:
+        room_ids = db.session.scalars(db.select(Room.id).where(Room.household_id == household_id).limit(2)).all()
+        room_id = room_ids[0] if len(room_ids) == 1 else None
+    return room_id
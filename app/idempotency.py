@@ -0,0 +1,206 @@
+import hashlib
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import IdempotencyKey
+
+# Response stored for an idempotency key, status is None while the first request is in progress
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'status', 'body', 'mimetype'])
+
+
+class IdempotencyStore(ABC):
+    """
+    Storage of the responses replayed for repeated idempotency keys. Every key lives
+    for ttl seconds after it was reserved
+    """
+
+    def __init__(self, ttl=86400, max_keys=100000, cleanup_batch=100):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.cleanup_batch = cleanup_batch
+
+    @abstractmethod
+    def reserve(self, key, fingerprint):
+        """
+        Reserve the key for a new request
+        :param key: Idempotency key
+        :type key: str
+        :param fingerprint: Hash of the request the key is used with
+        :type fingerprint: str
+        :return: None if the key was reserved, otherwise the response stored for it
+        :rtype: StoredResponse
+        """
+
+    @abstractmethod
+    def complete(self, key, response) -> None:
+        """
+        Store the response of the request which reserved the key
+        :type key: str
+        :type response: StoredResponse
+        """
+
+    @abstractmethod
+    def release(self, key) -> None:
+        """
+        Forget the key, so the request can be retried with it
+        :type key: str
+        """
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    Keys kept in the memory of the process. All the keys share one ttl, so the insertion
+    order of the dict is also the expiry order and the expired keys are always at its front
+    """
+
+    def __init__(self, ttl=86400, max_keys=100000, cleanup_batch=100):
+        super().__init__(ttl, max_keys, cleanup_batch)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _evict(self, now) -> None:
+        """
+        Drop at most cleanup_batch expired keys and the oldest keys over max_keys
+        """
+        for _ in range(self.cleanup_batch):
+            if not self._entries:
+                break
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+        while len(self._entries) >= self.max_keys:
+            self._entries.popitem(last=False)
+
+    def reserve(self, key, fingerprint):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            self._entries.pop(key, None)
+            self._evict(now)
+            self._entries[key] = (StoredResponse(fingerprint, None, None, None), now + self.ttl)
+            return None
+
+    def complete(self, key, response) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (response, entry[1])
+
+    def release(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DatabaseIdempotencyStore(IdempotencyStore):
+    """
+    Keys kept in the idempotency_key table, shared by all the processes of the deployment
+    """
+
+    def _evict(self, now) -> None:
+        """
+        Drop at most cleanup_batch expired keys
+        """
+        expired = db.select(IdempotencyKey.key).where(IdempotencyKey.expires_at <= now).limit(self.cleanup_batch)
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)),
+                           execution_options={'synchronize_session': False})
+
+    def _insert(self, key, fingerprint, now) -> bool:
+        """
+        Insert the reservation of the key
+        :return: Whether the key was free
+        :rtype: bool
+        """
+        try:
+            db.session.execute(db.insert(IdempotencyKey).values(key=key, fingerprint=fingerprint,
+                                                                expires_at=now + timedelta(seconds=self.ttl)))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    def reserve(self, key, fingerprint):
+        now = datetime.utcnow()
+        self._evict(now)
+        if self._insert(key, fingerprint, now):
+            return None
+
+        entry = db.session.get(IdempotencyKey, key)
+        if entry is not None and entry.expires_at > now:
+            return StoredResponse(entry.fingerprint, entry.status, entry.body, entry.mimetype)
+
+        # The key expired but wasn't evicted yet
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.key == key,
+                                                           IdempotencyKey.expires_at <= now),
+                           execution_options={'synchronize_session': False})
+        if self._insert(key, fingerprint, now):
+            return None
+        # Another request reserved it in the meantime
+        return StoredResponse(fingerprint, None, None, None)
+
+    def complete(self, key, response) -> None:
+        db.session.execute(db.update(IdempotencyKey).where(IdempotencyKey.key == key)
+                           .values(status=response.status, body=response.body, mimetype=response.mimetype),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+    def release(self, key) -> None:
+        db.session.rollback()
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.key == key),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+
+def idempotent(view):
+    """
+    Replay the original response when a request is repeated with the same Idempotency-Key
+    header. The key is scoped to the caller and the endpoint, server errors are not stored
+    so the request can be retried
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return view(*args, **kwargs)
+        if len(idempotency_key) > 255:
+            return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+        store = current_app.extensions['idempotency']
+        key = '{}:{}:{}'.format(get_jwt_identity(), request.endpoint, idempotency_key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        stored = store.reserve(key, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was already used with another request'}), 422
+            if stored.status is None:
+                return jsonify({'error': 'Request with this Idempotency-Key is still in progress'}), 409
+            response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            store.release(key)
+            raise
+        if response.status_code >= 500:
+            store.release(key)
+        else:
+            store.complete(key, StoredResponse(fingerprint, response.status_code, response.get_data(),
+                                               response.mimetype))
+        return response
+
+    return wrapper
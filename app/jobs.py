@@ -0,0 +1,386 @@
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from . import db
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Job taken from a backend, attempts counts its failed runs
+Job = namedtuple('Job', ['id', 'name', 'kwargs', 'attempts'])
+
+# Registered job functions by name
+JOB_HANDLERS = {}
+
+# Due jobs a worker tries to take in one go when other workers take them first
+CLAIM_ATTEMPTS = 10
+
+
+def job(name, local=False):
+    """
+    Register the decorated function as the job of the name, it is called with the keyword
+    arguments of the enqueued job in an app context
+    :type name: str
+    :param local: (Optional) The job works on the memory of the process which enqueues it,
+        so it can't be run by the workers of another process
+    :type local: bool
+    """
+    def register(function):
+        function.local = local
+        JOB_HANDLERS[name] = function
+        return function
+
+    return register
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobBackend(ABC):
+    """
+    Storage of the enqueued jobs. At most max_jobs jobs are held at once, counting the running
+    ones and the ones waiting for a retry. The jobs of a shared backend are taken by the workers
+    of every process of the deployment
+    """
+
+    shared = False
+
+    def __init__(self, max_jobs=1000):
+        self.max_jobs = max_jobs
+
+    @abstractmethod
+    def put(self, name, kwargs) -> Job:
+        """
+        Store a new job
+        :param name: Name of the registered job
+        :type name: str
+        :param kwargs: JSON serializable keyword arguments of the job
+        :type kwargs: dict
+        :raises JobQueueFull: When max_jobs jobs are held
+        :rtype: Job
+        """
+
+    @abstractmethod
+    def take(self, timeout):
+        """
+        Take the next due job, waiting for one at most timeout seconds
+        :type timeout: float
+        :return: The job, None if there was none
+        :rtype: Job
+        """
+
+    @abstractmethod
+    def complete(self, job) -> None:
+        """
+        Forget the job which ran or failed for the last time
+        :type job: Job
+        """
+
+    @abstractmethod
+    def retry(self, job, delay) -> None:
+        """
+        Give the failed job back to be taken again after delay seconds
+        :type job: Job
+        :type delay: float
+        """
+
+    def wake(self) -> None:
+        """
+        Return from the waiting calls of take, so the workers notice they are stopped
+        """
+
+    @abstractmethod
+    def pending(self) -> int:
+        """
+        :return: Number of the held jobs
+        :rtype: int
+        """
+
+
+class MemoryJobBackend(JobBackend):
+    """
+    Jobs kept in the memory of the process, the ones left at the exit are lost
+    """
+
+    def __init__(self, max_jobs=1000):
+        super().__init__(max_jobs)
+        self._condition = threading.Condition()
+        self._ready = deque()
+        # Heap of the jobs waiting for a retry, by the moment they are due
+        self._delayed = []
+        self._held = 0
+        self._ids = itertools.count(1)
+
+    def put(self, name, kwargs) -> Job:
+        with self._condition:
+            if self._held >= self.max_jobs:
+                raise JobQueueFull
+            self._held += 1
+            new_job = Job(next(self._ids), name, kwargs, 0)
+            self._ready.append(new_job)
+            self._condition.notify()
+        return new_job
+
+    def take(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                if self._ready:
+                    return self._ready.popleft()
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self._delayed:
+                    wait = min(wait, self._delayed[0][0] - now)
+                self._condition.wait(wait)
+
+    def complete(self, job) -> None:
+        with self._condition:
+            self._held -= 1
+
+    def retry(self, job, delay) -> None:
+        with self._condition:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, job.id, job._replace(attempts=job.attempts + 1)))
+            self._condition.notify()
+
+    def wake(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def pending(self) -> int:
+        with self._condition:
+            return self._held
+
+
+class DatabaseJobBackend(JobBackend):
+    """
+    Jobs kept in the background_job table, they outlive the process and are shared by all the
+    processes of the deployment. Taking a job moves its run_at lease seconds ahead, so the job
+    of a worker which died is taken again after the lease. The workers poll the table every
+    poll_interval seconds, the jobs enqueued by this process wake them at once
+    """
+
+    shared = True
+
+    def __init__(self, max_jobs=1000, lease=300, poll_interval=1.0):
+        super().__init__(max_jobs)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+
+    def put(self, name, kwargs) -> Job:
+        # The job is written on a connection of its own, the transaction of the caller's session is
+        # neither committed nor expired. The limit counts at most max_jobs rows instead of the table,
+        # the puts of the other processes may pass it by a few jobs
+        with db.engine.begin() as connection:
+            held = db.select(BackgroundJob.id).limit(self.max_jobs).subquery()
+            if connection.scalar(db.select(db.func.count()).select_from(held)) >= self.max_jobs:
+                raise JobQueueFull
+            job_id = connection.execute(db.insert(BackgroundJob).values(
+                name=name, kwargs=json.dumps(kwargs), attempts=0, run_at=datetime.utcnow())).inserted_primary_key[0]
+        with self._condition:
+            self._condition.notify()
+        return Job(job_id, name, kwargs, 0)
+
+    def _claim(self):
+        """
+        Take the first due job. When other workers take it first the next due job is tried,
+        up to CLAIM_ATTEMPTS jobs, and then the caller polls again
+        :return: The job, None if there was none or all the tried ones were taken
+        :rtype: Job
+        """
+        for _ in range(CLAIM_ATTEMPTS):
+            now = datetime.utcnow()
+            row = db.session.execute(db.select(BackgroundJob.id, BackgroundJob.name, BackgroundJob.kwargs,
+                                               BackgroundJob.attempts, BackgroundJob.run_at)
+                                     .where(BackgroundJob.run_at <= now)
+                                     .order_by(BackgroundJob.run_at, BackgroundJob.id).limit(1)).first()
+            if row is None:
+                db.session.rollback()
+                return None
+            claimed = db.session.execute(db.update(BackgroundJob)
+                                         .where(BackgroundJob.id == row.id, BackgroundJob.run_at == row.run_at)
+                                         .values(run_at=now + timedelta(seconds=self.lease)),
+                                         execution_options={'synchronize_session': False}).rowcount
+            db.session.commit()
+            if claimed:
+                return Job(row.id, row.name, json.loads(row.kwargs), row.attempts)
+        return None
+
+    def take(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            taken = self._claim()
+            if taken is not None:
+                return taken
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+            with self._condition:
+                self._condition.wait(min(deadline - now, self.poll_interval))
+
+    def complete(self, job) -> None:
+        db.session.execute(db.delete(BackgroundJob).where(BackgroundJob.id == job.id),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+    def retry(self, job, delay) -> None:
+        db.session.execute(db.update(BackgroundJob).where(BackgroundJob.id == job.id)
+                           .values(attempts=job.attempts + 1, run_at=datetime.utcnow() + timedelta(seconds=delay)),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+
+    def wake(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def pending(self) -> int:
+        return db.session.scalar(db.select(db.func.count()).select_from(BackgroundJob))
+
+
+class JobQueue:
+    """
+    Runs the jobs which don't have to finish before the response on a pool of worker threads.
+    A failed job is retried after retry_delay seconds, doubled by every next failure, and dropped
+    after max_attempts runs. The workers are started by the first enqueued job, so the processes
+    which never enqueue one don't run them, and are stopped at the exit. Without workers the jobs
+    run inline when they are enqueued
+    """
+
+    def __init__(self, app, backend, workers=2, max_attempts=3, retry_delay=1.0, handlers=None):
+        self.app = app
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.handlers = JOB_HANDLERS if handlers is None else handlers
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def accepts(self, name) -> bool:
+        """
+        Check whether the job can be enqueued. A local job can't be given to the workers of a shared
+        backend, they may run in another process, it is accepted when the jobs run inline
+        :param name: Name of the registered job
+        :type name: str
+        :rtype: bool
+        """
+        return not (self.workers and self.backend.shared and getattr(self.handlers[name], 'local', False))
+
+    def enqueue(self, name, **kwargs):
+        """
+        Enqueue a registered job, should be called after the commit of the data it reads
+        :param name: Name of the job
+        :type name: str
+        :return: The job, None if the queue was full and the job was dropped
+        :rtype: Job
+        :raises KeyError: If no job is registered as the name
+        :raises ValueError: If the job is local and the queue doesn't accept it
+        """
+        if name not in self.handlers:
+            raise KeyError('No job is registered as {}'.format(name))
+        if not self.accepts(name):
+            raise ValueError('Job {} is local, the backend shares the jobs with other processes'.format(name))
+        if not self.workers:
+            try:
+                self.handlers[name](**kwargs)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Job %s failed', name)
+            return None
+        try:
+            new_job = self.backend.put(name, kwargs)
+        except JobQueueFull:
+            logger.warning('Job queue is full, dropped %s', name)
+            return None
+        self.start()
+        return new_job
+
+    def start(self) -> None:
+        if self._threads or not self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name='job-worker-{}'.format(number), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.stop)
+
+    def stop(self, timeout=30) -> None:
+        """
+        Let the workers run the due jobs and exit. The jobs waiting for a retry stay in the backend
+        :param timeout: Seconds to wait for the workers
+        :type timeout: float
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._stopped.set()
+            self.backend.wake()
+            deadline = time.monotonic() + timeout
+            for thread in threads:
+                thread.join(max(deadline - time.monotonic(), 0))
+            atexit.unregister(self.stop)
+        if any(thread.is_alive() for thread in threads):
+            logger.warning('Job workers are still running after %s s', timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self.app.app_context():
+                try:
+                    # A stopped worker only drains the due jobs
+                    taken = self.backend.take(0 if self._stopped.is_set() else 1.0)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Taking a job failed')
+                    taken = None
+                finally:
+                    db.session.remove()
+                if taken is None:
+                    if self._stopped.is_set():
+                        return
+                    continue
+                try:
+                    self._execute(taken)
+                finally:
+                    db.session.remove()
+
+    def _execute(self, taken) -> None:
+        """
+        Run the job in the current app context and hand it back to the backend
+        :type taken: Job
+        """
+        try:
+            self.handlers[taken.name](**taken.kwargs)
+        except Exception:
+            db.session.rollback()
+            if taken.attempts + 1 < self.max_attempts:
+                logger.warning('Job %s failed, retrying', taken.name, exc_info=True)
+                self._hand_back(self.backend.retry, taken, self.retry_delay * 2 ** taken.attempts)
+            else:
+                logger.exception('Job %s failed for the last time', taken.name)
+                self._hand_back(self.backend.complete, taken)
+        else:
+            self._hand_back(self.backend.complete, taken)
+
+    def _hand_back(self, method, taken, *args) -> None:
+        try:
+            method(taken, *args)
+        except Exception:
+            db.session.rollback()
+            logger.exception('Job %s could not be handed back', taken.name)
@@ -2,16 +2,58 @@ from datetime import datetime, timedelta
 
 import bcrypt
 from sqlalchemy import UniqueConstraint
+from sqlalchemy.orm import validates
 
 from . import db
 
 
+class Household(db.Model):
+    """
+    Flat whose members share the guests and the guest types. All the guest data is scoped
+    by household_id, which leads the indexes, so one household never scans another's rows
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    members = db.relationship('User', backref='household', lazy=True)
+
+    def to_dict(self) -> dict:
+        """
+        Convert table data to dictionary
+        :return: Dict with table data
+        :rtype: dict
+        """
+        return {
+            'id': self.id,
+            'name': self.name
+        }
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(256), nullable=False)
-    guests = db.relationship('Guest', backref='inviter', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Casefolded username and email, set with them. SQLite lower() folds only ASCII letters
+    username_key = db.Column(db.String(150), nullable=False)
+    email_key = db.Column(db.String(360), nullable=False)
+    # The guests are deleted by app.cascade.delete_user_rows, they are never loaded for that
+    guests = db.relationship('Guest', backref='inviter', lazy=True, passive_deletes=True)
+    # Usernames and emails are unique regardless of the case, login seeks their keys and the search
+    # walks the username keys of the household in order
+    __table_args__ = (db.Index('ix_user_household_id_updated_at', 'household_id', 'updated_at'),
+                      db.Index('uq_user_username_key', 'username_key', unique=True),
+                      db.Index('uq_user_email_key', 'email_key', unique=True),
+                      db.Index('ix_user_household_id_username_key', 'household_id', 'username_key'))
+
+    @validates('username', 'email')
+    def set_key(self, key, value):
+        """
+        Keep the casefolded key of the username and the email in step with them
+        """
+        setattr(self, key + '_key', value.casefold() if isinstance(value, str) else value)
+        return value
 
     def set_password(self, password: str) -> None:
         """
@@ -39,6 +81,7 @@ class User(db.Model):
         """
         return {
             'id': self.id,
+            'household_id': self.household_id,
             'username': self.username,
             'email': self.email
         }
@@ -46,8 +89,11 @@ class User(db.Model):
 
 class GuestType(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
     name = db.Column(db.String(50), nullable=False)
-    __table_args__ = (UniqueConstraint('name', name='uq_name'),)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (UniqueConstraint('household_id', 'name', name='uq_guest_type_household_id_name'),
+                      db.Index('ix_guest_type_household_id_updated_at', 'household_id', 'updated_at'))
 
     def to_dict(self) -> dict:
         """
@@ -61,23 +107,70 @@ class GuestType(db.Model):
         }
 
 
+class Room(db.Model):
+    """
+    Room of the household, capacity guests can stay in it at the same time
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    capacity = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (UniqueConstraint('household_id', 'name', name='uq_room_household_id_name'),
+                      db.Index('ix_room_household_id_updated_at', 'household_id', 'updated_at'))
+
+    def to_dict(self) -> dict:
+        """
+        Convert table data to dictionary
+        :return: Dict with table data
+        :rtype: dict
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'capacity': self.capacity
+        }
+
+
 class Guest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    guest_type_id = db.Column(db.Integer, db.ForeignKey('guest_type.id'), nullable=False)
-    guest_type = db.relationship('GuestType', backref='guests')
-    inviter_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
+    # SQLite doesn't index the foreign keys by itself
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id', ondelete='RESTRICT'), nullable=False, index=True)
+    guest_type_id = db.Column(db.Integer, db.ForeignKey('guest_type.id', ondelete='RESTRICT'), nullable=False,
+                              index=True)
+    guest_type = db.relationship('GuestType', backref=db.backref('guests', passive_deletes='all'))
+    inviter_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     coming_date = db.Column(db.Date, nullable=False)
     coming_time = db.Column(db.Time, nullable=False)
     exit_time = db.Column(db.Time, nullable=False)
     comment = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # IDs of the archived guests are never given to new guests
+    __table_args__ = (db.Index('ix_guest_household_id_coming_date_coming_time',
+                               'household_id', 'coming_date', 'coming_time'),
+                      db.Index('ix_guest_household_id_updated_at', 'household_id', 'updated_at'),
+                      {'sqlite_autoincrement': True})
 
-    def set_exit_time(self, coming_date, coming_time, stay_time):
+    @staticmethod
+    def compute_exit_time(coming_date, coming_time, stay_time):
+        """
+            Compute the exit time of a stay
+            :param coming_date: Coming date of the guest
+            :param coming_time: Coming time of the guest
+            :param stay_time: Staying time of the guest
+            :return: Exit time of the guest
+            :rtype: time
+        """
         coming_time = datetime.combine(coming_date, coming_time)
         stay_duration = timedelta(hours=stay_time.hour,
                                   minutes=stay_time.minute,
                                   seconds=stay_time.second)
         exit_time = coming_time + stay_duration
-        self.exit_time = exit_time.time()
+        return exit_time.time()
+
+    def set_exit_time(self, coming_date, coming_time, stay_time):
+        self.exit_time = self.compute_exit_time(coming_date, coming_time, stay_time)
 
     def to_dict(self):
         """
@@ -90,6 +183,7 @@ class Guest(db.Model):
         stay_time = exit_datetime - coming_datetime
         return {
             'id': self.id,
+            'room_id': self.room_id,
             'guest_type_id': self.guest_type_id,
             'inviter_id': self.inviter_id,
             'coming_date': self.coming_date.strftime('%Y-%m-%d'),
@@ -97,3 +191,258 @@ class Guest(db.Model):
             'stay_time': str(stay_time),
             'comment': self.comment
         }
+
+
+class GuestHistory(db.Model):
+    """
+    Guest whose stay is older than the archive horizon, moved out of the guest table
+    by the guests archive command with its ID kept
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
+    # The archive only grows, the deletes of the users and the in-use checks seek it by the foreign keys
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id', ondelete='RESTRICT'), nullable=False, index=True)
+    guest_type_id = db.Column(db.Integer, db.ForeignKey('guest_type.id', ondelete='RESTRICT'), nullable=False,
+                              index=True)
+    inviter_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    coming_date = db.Column(db.Date, nullable=False)
+    coming_time = db.Column(db.Time, nullable=False)
+    exit_time = db.Column(db.Time, nullable=False)
+    comment = db.Column(db.String(255))
+    __table_args__ = (db.Index('ix_guest_history_household_id_coming_date_coming_time',
+                               'household_id', 'coming_date', 'coming_time'),)
+
+    # Archived guests are listed in the same shape as the guests
+    to_dict = Guest.to_dict
+
+
+class GuestSeries(db.Model):
+    """
+    Recurring guest stored as one row. Occurrences fall on start_date and then every
+    interval days (daily) or weeks (weekly), until the until date or the count of
+    occurrences is reached, except the dates in exceptions
+    """
+    FREQUENCIES = {'daily': 1, 'weekly': 7}
+
+    id = db.Column(db.Integer, primary_key=True)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id', ondelete='RESTRICT'), nullable=False, index=True)
+    guest_type_id = db.Column(db.Integer, db.ForeignKey('guest_type.id', ondelete='RESTRICT'), nullable=False,
+                              index=True)
+    inviter_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    start_date = db.Column(db.Date, nullable=False)
+    coming_time = db.Column(db.Time, nullable=False)
+    exit_time = db.Column(db.Time, nullable=False)
+    frequency = db.Column(db.String(10), nullable=False)
+    interval = db.Column(db.Integer, nullable=False, default=1)
+    until = db.Column(db.Date)
+    count = db.Column(db.Integer)
+    comment = db.Column(db.String(255))
+    # Changed by the exceptions too, they are sent with the series
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    exceptions = db.relationship('GuestSeriesException', backref='series', lazy='selectin',
+                                 cascade='all, delete-orphan')
+    __table_args__ = (db.Index('ix_guest_series_household_id_start_date_until', 'household_id', 'start_date', 'until'),
+                      db.Index('ix_guest_series_household_id_updated_at', 'household_id', 'updated_at'))
+
+    @property
+    def step(self) -> int:
+        """
+            Number of days between two occurrences
+            :rtype: int
+        """
+        return self.FREQUENCIES[self.frequency] * self.interval
+
+    @property
+    def last_date(self):
+        """
+            Date of the last occurrence, None if the series never ends
+            :rtype: date
+        """
+        last_dates = []
+        if self.until is not None:
+            last_dates.append(self.until)
+        if self.count is not None:
+            last_dates.append(self.start_date + timedelta(days=(self.count - 1) * self.step))
+        return min(last_dates) if last_dates else None
+
+    @property
+    def excluded_dates(self) -> set:
+        """
+            Dates which are skipped by the series
+            :rtype: set[date]
+        """
+        return {exception.date for exception in self.exceptions}
+
+    def occurs_on(self, day) -> bool:
+        """
+            Check whether the series has an occurrence on the date
+            :param day: Date to check
+            :type day: date
+            :rtype: bool
+        """
+        last_date = self.last_date
+        if day < self.start_date or (last_date is not None and day > last_date):
+            return False
+        return (day - self.start_date).days % self.step == 0 and day not in self.excluded_dates
+
+    def occurrences(self, start, end) -> list:
+        """
+            Expand the occurrences which fall into the date range, the rest of the series is never built
+            :param start: First date of the range
+            :type start: date
+            :param end: Last date of the range
+            :type end: date
+            :return: Dates of the occurrences
+            :rtype: list[date]
+        """
+        step = self.step
+        last_date = self.last_date
+        if last_date is not None:
+            end = min(end, last_date)
+        # Index of the first occurrence which isn't before the range
+        first = max(0, -(-(start - self.start_date).days // step))
+        day = self.start_date + timedelta(days=first * step)
+        excluded_dates = self.excluded_dates
+        result = []
+        while day <= end:
+            if day not in excluded_dates:
+                result.append(day)
+            day += timedelta(days=step)
+        return result
+
+    def occurrence_dict(self, day) -> dict:
+        """
+            Convert one occurrence to the dictionary in the same shape as a guest
+            :param day: Date of the occurrence
+            :type day: date
+            :rtype: dict
+        """
+        coming_datetime = datetime.combine(day, self.coming_time)
+        exit_datetime = datetime.combine(day, self.exit_time)
+        return {
+            'series_id': self.id,
+            'room_id': self.room_id,
+            'guest_type_id': self.guest_type_id,
+            'inviter_id': self.inviter_id,
+            'coming_date': day.strftime('%Y-%m-%d'),
+            'coming_time': self.coming_time.strftime('%H:%M:%S'),
+            'stay_time': str(exit_datetime - coming_datetime),
+            'comment': self.comment
+        }
+
+    def to_dict(self) -> dict:
+        """
+            Convert table data to dictionary
+            :return: Dict with table data
+            :rtype: dict
+        """
+        coming_datetime = datetime.combine(self.start_date, self.coming_time)
+        exit_datetime = datetime.combine(self.start_date, self.exit_time)
+        return {
+            'id': self.id,
+            'room_id': self.room_id,
+            'guest_type_id': self.guest_type_id,
+            'inviter_id': self.inviter_id,
+            'start_date': self.start_date.strftime('%Y-%m-%d'),
+            'coming_time': self.coming_time.strftime('%H:%M:%S'),
+            'stay_time': str(exit_datetime - coming_datetime),
+            'frequency': self.frequency,
+            'interval': self.interval,
+            'until': self.until.strftime('%Y-%m-%d') if self.until else None,
+            'count': self.count,
+            'exceptions': sorted(day.strftime('%Y-%m-%d') for day in self.excluded_dates),
+            'comment': self.comment
+        }
+
+
+class GuestSeriesException(db.Model):
+    series_id = db.Column(db.Integer, db.ForeignKey('guest_series.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+
+
+class BookingDay(db.Model):
+    household_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class GuestStats(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    inviter_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    # The key leads with the date, the deletes of the guest types seek the rows by their own index
+    guest_type_id = db.Column(db.Integer, db.ForeignKey('guest_type.id', ondelete='CASCADE'), primary_key=True,
+                              index=True)
+    household_id = db.Column(db.Integer, db.ForeignKey('household.id'), nullable=False)
+    guest_count = db.Column(db.Integer, nullable=False, default=0)
+    occupied_minutes = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.Index('ix_guest_stats_inviter_id_date', 'inviter_id', 'date'),
+                      db.Index('ix_guest_stats_household_id_date', 'household_id', 'date'))
+
+    def to_dict(self) -> dict:
+        """
+            Convert table data to dictionary
+            :return: Dict with table data
+            :rtype: dict
+        """
+        return {
+            'date': self.date.strftime('%Y-%m-%d'),
+            'inviter_id': self.inviter_id,
+            'guest_type_id': self.guest_type_id,
+            'guest_count': self.guest_count,
+            'occupied_minutes': self.occupied_minutes
+        }
+
+
+class IdempotencyKey(db.Model):
+    key = db.Column(db.String(320), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    mimetype = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Tombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    household_id = db.Column(db.Integer, nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_tombstone_household_id_deleted_at', 'household_id', 'deleted_at'),)
+
+
+class RevokedToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class RefreshToken(db.Model):
+    """
+    Issued refresh token. Every refresh replaces the token with a new one of the same family,
+    used_at marks the replaced tokens, so presenting one of them again reveals a stolen token
+    """
+    jti = db.Column(db.String(36), primary_key=True)
+    family_id = db.Column(db.String(36), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    used_at = db.Column(db.DateTime)
+    revoked = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(320), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class BackgroundJob(db.Model):
+    """
+    Job of the database job backend, due at run_at. A taken job has its run_at moved past its lease
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    kwargs = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,95 @@
+import threading
+from datetime import datetime, timedelta, time
+
+from flask import current_app
+
+from . import db
+from .booking import stay_bounds
+from .jobs import job
+from .models import Guest
+from .recurrence import series_in_range, expand_series
+
+
+class OccupancyCache:
+    """
+    Guests who are checked in right now, per household. The answer can only change at the next
+    coming or exit time of a stay, or when a guest is written, so it is kept until whichever comes first
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Household ID to the guests and the moment they expire at
+        self._entries = {}
+        # Bumped by every invalidation of the household, a result computed before it is never stored
+        self._generations = {}
+
+    def invalidate(self, household_id) -> None:
+        """
+        Drop the cached answer of the household, should be called after every committed guest write
+        :type household_id: int
+        """
+        with self._lock:
+            self._generations[household_id] = self._generations.get(household_id, 0) + 1
+            self._entries.pop(household_id, None)
+
+    def get(self, household_id, now=None) -> tuple[list[dict], datetime]:
+        """
+        Get the guests of the household who are checked in at the moment
+        :param household_id: Household of the guests
+        :type household_id: int
+        :param now: (Optional) The moment to check, current time by default
+        :type now: datetime
+        :return: Serialized guests and the moment the answer expires at
+        :rtype: tuple[list[dict], datetime]
+        """
+        now = now or datetime.now()
+        with self._lock:
+            entry = self._entries.get(household_id)
+            if entry is not None and entry[1] > now:
+                return entry
+            generation = self._generations.get(household_id, 0)
+
+        guests, expires_at = self._load(household_id, now)
+
+        with self._lock:
+            if generation == self._generations.get(household_id, 0):
+                self._entries[household_id] = (guests, expires_at)
+        return guests, expires_at
+
+    @staticmethod
+    def _load(household_id, now) -> tuple[list[dict], datetime]:
+        """
+        Find the current guests and the next boundary event of the day
+        """
+        today = now.date()
+        # Nothing is known about tomorrow, so the answer expires at midnight at the latest
+        expires_at = datetime.combine(today + timedelta(days=1), time())
+
+        # Stays of yesterday may still last if they go over midnight
+        yesterday = today - timedelta(days=1)
+        query = db.select(Guest).where(Guest.household_id == household_id, Guest.coming_date.between(yesterday, today))
+        stays = [(guest.coming_date, guest.coming_time, guest.exit_time, guest.to_dict())
+                 for guest in db.session.scalars(query)]
+        series_list = db.session.scalars(series_in_range(household_id, yesterday, today))
+        for series, day in expand_series(series_list, yesterday, today):
+            stays.append((day, series.coming_time, series.exit_time, series.occurrence_dict(day)))
+
+        guests = []
+        for coming_date, coming_time, exit_time, guest_data in stays:
+            start, end = stay_bounds(coming_date, coming_time, exit_time)
+            if start <= now < end:
+                guests.append(guest_data)
+            for boundary in (start, end):
+                if now < boundary < expires_at:
+                    expires_at = boundary
+        return guests, expires_at
+
+
+@job('warm_occupancy', local=True)
+def warm_occupancy(household_id) -> None:
+    """
+    Load the current guests of the household into the cache again after a write invalidated them.
+    The cache is the one of the process, so the job is local
+    :type household_id: int
+    """
+    current_app.extensions['occupancy'].get(household_id)
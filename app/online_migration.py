@@ -0,0 +1,297 @@
+import logging
+import time
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.visitors import replacement_traverse
+
+logger = logging.getLogger(__name__)
+
+# Resume points of the rebuilds in progress, the last ID copied into each shadow table
+STATE_DDL = 'CREATE TABLE IF NOT EXISTS online_rebuild (table_name VARCHAR(100) NOT NULL PRIMARY KEY, ' \
+            'last_id INTEGER NOT NULL)'
+TRIGGER_EVENTS = ['insert', 'update', 'delete']
+
+
+@contextmanager
+def immediate_transaction(connection):
+    """
+    Run the block in a transaction which takes the write lock at once, on a connection in autocommit mode
+    """
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        connection.exec_driver_sql('ROLLBACK')
+        raise
+    connection.exec_driver_sql('COMMIT')
+
+
+@contextmanager
+def foreign_keys_off(connection):
+    """
+    Run the block with the foreign keys of the connection off, outside of a transaction. With them on,
+    renaming a table points the references of the other tables at its new name and dropping it
+    applies their ON DELETE actions
+    """
+    enabled = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+    connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+    try:
+        yield
+    finally:
+        if enabled:
+            connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+
+
+def log_progress(table_name, last_id, max_id) -> None:
+    """
+    Default progress callback of rebuild_table_online
+    """
+    logger.info('Copied %s up to ID %d of %d (%d%%)', table_name, min(last_id, max_id), max_id,
+                100 * min(last_id, max_id) // max(max_id, 1))
+
+
+def rebuild_table_online(connection, table, expressions=None, chunk_size=10000, pause=0.1,
+                         progress=log_progress) -> int:
+    """
+    Rebuild a SQLite table into a new shape without locking the writers out for the whole copy,
+    the online counterpart of batch_alter_table for the large tables.
+
+    The rows are copied into a shadow table in chunks, each in its own short transaction, while
+    triggers repeat every write of the old table on the shadow. Then the indexes are built on the
+    shadow one by one under temporary names, as the old indexes still hold their names. The swap
+    renames both tables in one transaction and creates the triggers of the old table again on the
+    new one, so the new table is searched and its unique indexes are enforced from the start. SQLite
+    can't rename an index, each one is built again under its name and its temporary copy is dropped,
+    then the old rows are dropped in chunks. An interrupted rebuild continues where it stopped when
+    it is run again. The rows are chunked by the integer primary key.
+
+    Run it in ``op.get_context().autocommit_block()``, the chunks commit on their own. The foreign keys
+    of the connection are off until it returns, the other connections keep enforcing them
+    :param connection: Connection in autocommit mode
+    :param table: New shape of the table with its indexes, named like the old table. The tables
+        its foreign keys reference are reflected
+    :type table: sa.Table
+    :param expressions: (Optional) SQL expressions over the old columns giving the new ones, by column name.
+        The columns of the old table are copied by name, the other new columns get their server defaults
+    :type expressions: dict[str, str]
+    :param chunk_size: Number of IDs copied by one transaction
+    :type chunk_size: int
+    :param pause: Seconds between the chunks. The busy handler of a waiting writer sleeps up to 100 ms
+        between its attempts, without a pause the next chunk takes the lock before the writer wakes up
+    :type pause: float
+    :param progress: Called with the table name, the last copied ID and the highest ID after every chunk
+    :type progress: callable
+    :return: Number of rows copied by the chunks, the rows written meanwhile are copied by the triggers
+    :rtype: int
+    :raises RuntimeError: If the connection isn't to SQLite
+    :raises ValueError: If the table doesn't have a single primary key column
+    """
+    if connection.dialect.name != 'sqlite':
+        raise RuntimeError('Online rebuilds are written for SQLite, not {}'.format(connection.dialect.name))
+    if len(table.primary_key.columns) != 1:
+        raise ValueError('The table needs a single integer primary key')
+
+    quote = connection.dialect.identifier_preparer.quote
+    name, shadow_name, old_name = table.name, '_new_{}'.format(table.name), '_old_{}'.format(table.name)
+    primary_key = quote(table.primary_key.columns[0].name)
+
+    with foreign_keys_off(connection):
+        # The new columns in the order of the old rows, as a SELECT from the old table
+        old_columns = {column['name'] for column in sa.inspect(connection).get_columns(name)}
+        expressions = dict(expressions or {})
+        for column in table.columns:
+            if column.name not in expressions and column.name in old_columns:
+                expressions[column.name] = quote(column.name)
+        copy = 'INTO {} ({}) SELECT {} FROM {}'.format(quote(shadow_name), ', '.join(map(quote, expressions)),
+                                                     ', '.join(expressions.values()), quote(name))
+
+        # A rebuild interrupted after the swap only has the indexes and the old rows left
+        if not sa.inspect(connection).has_table(old_name):
+            copied = backfill(connection, table, shadow_name, copy, primary_key, chunk_size, pause, progress)
+            build_shadow_indexes(connection, table, shadow_name, pause)
+            started = time.perf_counter()
+            with immediate_transaction(connection):
+                swap_tables(connection, table, shadow_name, old_name)
+                connection.execute(sa.text('DELETE FROM online_rebuild WHERE table_name = :name'), {'name': name})
+            logger.info('Swapped %s in %.2f s', name, time.perf_counter() - started)
+        else:
+            copied = 0
+
+        # Every index takes its name once the old one is out of the way, then its temporary copy is
+        # dropped. Each step has its own transaction, the copy serves the queries until the last one
+        for index in table.indexes:
+            if not index_exists(connection, index.name, name):
+                with immediate_transaction(connection):
+                    connection.exec_driver_sql('DROP INDEX IF EXISTS {}'.format(quote(index.name)))
+                time.sleep(pause)
+                started = time.perf_counter()
+                with immediate_transaction(connection):
+                    connection.execute(CreateIndex(index))
+                logger.info('Built %s in %.2f s', index.name, time.perf_counter() - started)
+                time.sleep(pause)
+            if index_exists(connection, temporary_name(index.name), name):
+                with immediate_transaction(connection):
+                    connection.exec_driver_sql('DROP INDEX {}'.format(quote(temporary_name(index.name))))
+                time.sleep(pause)
+
+        # Dropping a large table takes as long as deleting its rows, they go in chunks first
+        while connection.exec_driver_sql('DELETE FROM {} WHERE {} IN (SELECT {} FROM {} LIMIT ?)'.format(
+                quote(old_name), primary_key, primary_key, quote(old_name)), (chunk_size,)).rowcount:
+            time.sleep(pause)
+        connection.exec_driver_sql('DROP TABLE {}'.format(quote(old_name)))
+        if not connection.exec_driver_sql('SELECT count(*) FROM online_rebuild').scalar():
+            connection.exec_driver_sql('DROP TABLE online_rebuild')
+    return copied
+
+
+def backfill(connection, table, shadow_name, copy, primary_key, chunk_size, pause, progress) -> int:
+    """
+    Create the shadow table unless a previous run did, then copy the rows from the last chunk on
+    :return: Number of copied rows
+    :rtype: int
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    name = table.name
+    connection.exec_driver_sql(STATE_DDL)
+    last_id = connection.execute(sa.text('SELECT last_id FROM online_rebuild WHERE table_name = :name'),
+                                 {'name': name}).scalar()
+    if last_id is None:
+        with immediate_transaction(connection):
+            create_shadow(connection, table, shadow_name, copy, primary_key)
+            connection.execute(sa.text('INSERT INTO online_rebuild (table_name, last_id) VALUES (:name, 0)'),
+                               {'name': name})
+        last_id = 0
+
+    # The rows inserted after the highest ID was read reach the shadow through the triggers
+    max_id = connection.exec_driver_sql('SELECT max({}) FROM {}'.format(primary_key, quote(name))).scalar() or 0
+    copied = 0
+    while last_id < max_id:
+        with immediate_transaction(connection):
+            copied += connection.exec_driver_sql(
+                'INSERT OR IGNORE {} WHERE {} > ? AND {} <= ?'.format(copy, primary_key, primary_key),
+                (last_id, last_id + chunk_size)).rowcount
+            last_id += chunk_size
+            connection.execute(sa.text('UPDATE online_rebuild SET last_id = :last_id WHERE table_name = :name'),
+                               {'last_id': last_id, 'name': name})
+        progress(name, last_id, max_id)
+        time.sleep(pause)
+    return copied
+
+
+def temporary_name(index_name) -> str:
+    """
+    :return: Name of the index on the shadow table until the swap
+    :rtype: str
+    """
+    return '_new_{}'.format(index_name)
+
+
+def index_exists(connection, index_name, table_name) -> bool:
+    return bool(connection.execute(sa.text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :index "
+                                           "AND tbl_name = :name"), {'index': index_name, 'name': table_name}).scalar())
+
+
+def shadow_table(table, shadow_name) -> sa.Table:
+    """
+    Copy the new shape of the table under the name of the shadow
+    """
+    metadata = sa.MetaData()
+    shadow = table.to_metadata(metadata, name=shadow_name)
+    # The referenced tables only lend their names to the REFERENCES clauses
+    for foreign_key in shadow.foreign_keys:
+        table_name, column_name = foreign_key.target_fullname.split('.')
+        referenced = metadata.tables[table_name] if table_name in metadata.tables else sa.Table(table_name, metadata)
+        if column_name not in referenced.columns:
+            referenced.append_column(sa.Column(column_name, sa.Integer()))
+    return shadow
+
+
+def build_shadow_indexes(connection, table, shadow_name, pause) -> None:
+    """
+    Build the indexes of the new shape on the filled shadow table under their temporary names,
+    each in its own transaction, unless a previous run did
+    """
+    shadow = shadow_table(table, shadow_name)
+
+    def shadow_column(element):
+        if isinstance(element, sa.Column) and element.table is table:
+            return shadow.columns[element.key]
+        return None
+
+    for index in table.indexes:
+        name = temporary_name(index.name)
+        if index_exists(connection, name, shadow_name):
+            continue
+        shadow_index = sa.Index(name, *[replacement_traverse(expression, {}, shadow_column)
+                                        for expression in index.expressions], unique=index.unique)
+        started = time.perf_counter()
+        with immediate_transaction(connection):
+            connection.execute(CreateIndex(shadow_index))
+        logger.info('Built %s in %.2f s', name, time.perf_counter() - started)
+        time.sleep(pause)
+
+
+def create_shadow(connection, table, shadow_name, copy, primary_key) -> None:
+    """
+    Create the shadow table without indexes and the triggers repeating the writes of the old table on it
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    shadow = shadow_table(table, shadow_name)
+
+    # A shadow left by a run interrupted before the backfill holds only the rows of its triggers
+    drop_triggers(connection, shadow_name)
+    connection.exec_driver_sql('DROP TABLE IF EXISTS {}'.format(quote(shadow_name)))
+    connection.execute(CreateTable(shadow))
+
+    upsert = 'INSERT OR REPLACE {} WHERE {} = NEW.{}'.format(copy, primary_key, primary_key)
+    bodies = {'insert': upsert, 'update': upsert,
+              'delete': 'DELETE FROM {} WHERE {} = OLD.{}'.format(quote(shadow_name), primary_key, primary_key)}
+    for event in TRIGGER_EVENTS:
+        connection.exec_driver_sql('CREATE TRIGGER {} AFTER {} ON {} BEGIN {}; END'.format(
+            quote('{}_{}'.format(shadow_name, event)), event.upper(), quote(table.name), bodies[event]))
+
+
+def drop_triggers(connection, shadow_name) -> None:
+    """
+    Drop the triggers of a rebuild
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    for event in TRIGGER_EVENTS:
+        connection.exec_driver_sql('DROP TRIGGER IF EXISTS {}'.format(quote('{}_{}'.format(shadow_name, event))))
+
+
+def swap_tables(connection, table, shadow_name, old_name) -> None:
+    """
+    Put the shadow in the place of the old table, keeping the AUTOINCREMENT sequence and the other triggers.
+    Both tables are only renamed with their indexes, the old one is dropped after
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    name = table.name
+    drop_triggers(connection, shadow_name)
+    triggers = connection.execute(sa.text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                                          "AND tbl_name = :name"), {'name': name}).all()
+    sequence = None
+    if table.dialect_options['sqlite']['autoincrement']:
+        sequence = connection.execute(sa.text('SELECT seq FROM sqlite_sequence WHERE name = :name'),
+                                      {'name': name}).scalar()
+
+    # The legacy rename leaves the references of the other tables, triggers and views alone
+    for trigger_name, _ in triggers:
+        connection.exec_driver_sql('DROP TRIGGER {}'.format(quote(trigger_name)))
+    connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    try:
+        connection.exec_driver_sql('ALTER TABLE {} RENAME TO {}'.format(quote(name), quote(old_name)))
+        connection.exec_driver_sql('ALTER TABLE {} RENAME TO {}'.format(quote(shadow_name), quote(name)))
+    finally:
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    for _, trigger in triggers:
+        connection.exec_driver_sql(trigger)
+
+    # The IDs of the deleted rows above the highest copied one are never given again
+    if sequence is not None:
+        if not connection.execute(sa.text('UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name'),
+                                  {'seq': sequence, 'name': name}).rowcount:
+            connection.execute(sa.text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                               {'name': name, 'seq': sequence})
@@ -0,0 +1,85 @@
+from datetime import timedelta
+from math import gcd
+
+from . import db
+from .models import GuestSeries
+
+
+def series_in_range(household_id, start, end):
+    """
+    Build the query of the series of the household which may have occurrences in the date range
+    :param household_id: Household of the series
+    :type household_id: int
+    :param start: First date of the range
+    :type start: date
+    :param end: Last date of the range
+    :type end: date
+    """
+    return db.select(GuestSeries).where(GuestSeries.household_id == household_id,
+                                        GuestSeries.start_date <= end,
+                                        db.or_(GuestSeries.until.is_(None), GuestSeries.until >= start))
+
+
+def expand_series(series_list, start, end) -> list[tuple[GuestSeries, object]]:
+    """
+    Expand the occurrences of the series which fall into the date range
+    :param series_list: Series to expand
+    :param start: First date of the range
+    :type start: date
+    :param end: Last date of the range
+    :type end: date
+    :return: Pairs of the series and the date of its occurrence sorted by date and coming time
+    :rtype: list[tuple[GuestSeries, date]]
+    """
+    result = [(series, day) for series in series_list for day in series.occurrences(start, end)]
+    result.sort(key=lambda occurrence: (occurrence[1], occurrence[0].coming_time))
+    return result
+
+
+def series_collide(first, second, days=0) -> bool:
+    """
+    Check whether the second series has an occurrence days after an occurrence of the first one
+    without expanding them, on the same date by default. The dates of both series are arithmetic
+    progressions, so the common dates are found with the Chinese remainder theorem and only the
+    excluded ones are stepped over
+    :param first: First series
+    :type first: GuestSeries
+    :param second: Second series
+    :type second: GuestSeries
+    :param days: (Optional) Days between the occurrences, negative when the second one comes first
+    :type days: int
+    :rtype: bool
+    """
+    # The dates of the second series are moved onto the dates of the first one
+    shift = timedelta(days=days)
+    second_start = second.start_date - shift
+    second_last = second.last_date - shift if second.last_date is not None else None
+
+    first_step, second_step = first.step, second.step
+    divisor = gcd(first_step, second_step)
+    offset = (second_start - first.start_date).days
+    if offset % divisor:
+        return False
+
+    # Solve first_step * k = offset (mod second_step) to get a common date
+    modulus = second_step // divisor
+    k = (offset // divisor) * pow(first_step // divisor, -1, modulus) % modulus if modulus > 1 else 0
+    day = first.start_date + timedelta(days=k * first_step)
+    period = first_step // divisor * second_step
+
+    # Move to the first common date when both series have started
+    latest_start = max(first.start_date, second_start)
+    if day < latest_start:
+        day += timedelta(days=-(-(latest_start - day).days // period) * period)
+
+    last_dates = [last_date for last_date in (first.last_date, second_last) if last_date is not None]
+    last_date = min(last_dates) if last_dates else None
+    excluded_dates = first.excluded_dates | {excluded - shift for excluded in second.excluded_dates}
+    # Every excluded date can skip at most one common date
+    for _ in range(len(excluded_dates) + 1):
+        if last_date is not None and day > last_date:
+            return False
+        if day not in excluded_dates:
+            return True
+        day += timedelta(days=period)
+    return False
@@ -0,0 +1,117 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_jwt_extended import create_refresh_token, get_jti
+
+from . import db
+from .models import RefreshToken
+
+
+def issue_refresh_token(user_id, family_id=None) -> str:
+    """
+    Create a refresh token and track it in the current transaction
+    :param user_id: Identity of the token
+    :type user_id: int
+    :param family_id: Family of the replaced token, a new family is started for a login
+    :type family_id: str
+    :return: The encoded token
+    :rtype: str
+    """
+    refresh_token = create_refresh_token(identity=user_id)
+    expires_at = datetime.utcnow() + timedelta(seconds=current_app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    db.session.add(RefreshToken(jti=get_jti(refresh_token), family_id=family_id or str(uuid.uuid4()),
+                                user_id=user_id, expires_at=expires_at))
+    return refresh_token
+
+
+def rotate_refresh_token(jti):
+    """
+    Replace the refresh token with a new one of its family. A token which was already
+    replaced was used twice, so it is stolen and its whole family is revoked
+    :param jti: Unique ID of the presented token
+    :type jti: str
+    :return: The new encoded token, None if the presented token can't be used
+    :rtype: str
+    """
+    # Mark the token used, the condition makes only one of concurrent refreshes succeed
+    mark_used = db.update(RefreshToken).where(RefreshToken.jti == jti,
+                                              RefreshToken.used_at.is_(None),
+                                              RefreshToken.revoked.is_(False)).values(used_at=datetime.utcnow())
+    if db.session.execute(mark_used, execution_options={'synchronize_session': False}).rowcount == 1:
+        token = db.session.get(RefreshToken, jti)
+        refresh_token = issue_refresh_token(token.user_id, token.family_id)
+        db.session.commit()
+        return refresh_token
+
+    token = db.session.get(RefreshToken, jti)
+    if token is not None and token.used_at is not None:
+        revoke_family(token.family_id)
+    db.session.commit()
+    return None
+
+
+def revoke_family(family_id) -> None:
+    """
+    Revoke every token of the family in the current transaction
+    :type family_id: str
+    """
+    db.session.execute(db.update(RefreshToken).where(RefreshToken.family_id == family_id).values(revoked=True),
+                       execution_options={'synchronize_session': False})
+
+
+def prune_refresh_tokens(batch_size=1000) -> int:
+    """
+    Delete the expired tokens, every batch in its own short transaction
+    :return: Number of deleted tokens
+    :rtype: int
+    """
+    deleted = 0
+    while True:
+        expired = db.select(RefreshToken.jti).where(RefreshToken.expires_at <= datetime.utcnow()).limit(batch_size)
+        result = db.session.execute(db.delete(RefreshToken).where(RefreshToken.jti.in_(expired)),
+                                    execution_options={'synchronize_session': False})
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+class RefreshTokenPruner:
+    """
+    Daemon thread which prunes the expired refresh tokens every interval seconds. It is started
+    by the first login or refresh, so the processes which never serve them don't run it
+    """
+
+    def __init__(self, app, interval=3600, batch_size=1000):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None or not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='refresh-token-pruner', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    prune_refresh_tokens(self.batch_size)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Pruning of the refresh tokens failed')
+                finally:
+                    db.session.remove()
@@ -0,0 +1,321 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect
+
+from . import db
+from .models import Guest, GuestHistory, GuestSeries, GuestSeriesException, GuestStats, User
+
+# Models whose writes through the session are audited row by row
+AUDITED_MODELS = (Guest, GuestSeries, User)
+# Models whose bulk updates and deletes through the session are audited by statement, like the
+# deletes of the users and the archive. The aggregates are bumped by every guest write, only the
+# deletes of theirs are audited, like the ones of the guest types
+BULK_AUDITED_MODELS = AUDITED_MODELS + (GuestHistory, GuestSeriesException)
+BULK_DELETE_AUDITED_MODELS = BULK_AUDITED_MODELS + (GuestStats,)
+
+
+class FieldsRecord(logging.LogRecord):
+    """
+    Record of a log of fields. It skips the caller, thread and process details a LogRecord collects,
+    which cost more than the rest of the logging on the request thread
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.created = time.time()
+        self.levelno = logging.INFO
+        self.levelname = 'INFO'
+        self.msg = ''
+        self.args = ()
+        self.exc_info = None
+        self.exc_text = None
+        self.stack_info = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the fields of a record as one JSON line with the time and the name of the log
+    """
+
+    def format(self, record) -> str:
+        return json.dumps(dict(time=datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                               log=record.name, **record.fields), default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Puts the records into a bounded queue. When the queue is full the 'drop' policy drops the
+    record at once and the 'block' policy waits up to block_timeout seconds for room before dropping it
+    """
+
+    def __init__(self, record_queue, policy='drop', block_timeout=1.0):
+        super().__init__(record_queue)
+        if policy not in ('drop', 'block'):
+            raise ValueError('Unknown policy {}'.format(policy))
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The records are formatted by the listener thread
+        return record
+
+    def enqueue(self, record) -> None:
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+
+class JsonLinesHandler(logging.StreamHandler):
+    """
+    Writes a batch of records with one write and one flush
+    """
+
+    def emit_batch(self, records) -> None:
+        try:
+            lines = ''.join(self.format(record) + self.terminator for record in records)
+            with self.lock:
+                self.stream.write(lines)
+                self.flush()
+        except Exception:
+            self.handleError(records[0])
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    Hands the records to its handlers in batches of up to batch_size. After the queue runs empty
+    the listener waits flush_interval seconds past the next record, so a busy queue wakes it once
+    per interval instead of once per record
+    """
+
+    def __init__(self, record_queue, *handlers, batch_size=100, flush_interval=0.5):
+        super().__init__(record_queue, *handlers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._batch = []
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            self.flush()
+        record = self.queue.get()
+        if record is not self._sentinel:
+            time.sleep(self.flush_interval)
+        return record
+
+    def handle(self, record) -> None:
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        batch, self._batch = self._batch, []
+        if batch:
+            for handler in self.handlers:
+                handler.emit_batch(batch)
+
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full, the sentinel waits for room
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        super().stop()
+        self.flush()
+
+
+class RequestLog:
+    """
+    JSON access log of the API requests and audit log of the guest and user writes. The request
+    threads only put the records into a bounded queue, a listener thread formats and writes them.
+    It is started by the first record with the REQUEST_LOG_* settings and stopped at the exit
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._handler = None
+        self._listener = None
+        self._stream = None
+        app.before_request(start_timer)
+        app.after_request(log_request)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    @property
+    def dropped(self) -> int:
+        """
+        :return: Number of the records dropped by the current queue
+        :rtype: int
+        """
+        handler = self._handler
+        return handler.dropped if handler is not None else 0
+
+    def start(self) -> BoundedQueueHandler:
+        handler = self._handler
+        if handler is not None:
+            return handler
+        with self._lock:
+            if self._handler is not None:
+                return self._handler
+            config = self.app.config
+            path = config['REQUEST_LOG_FILE']
+            self._stream = open(path, 'a', encoding='utf-8') if path else sys.stderr
+            writer = JsonLinesHandler(self._stream)
+            writer.setFormatter(JsonFormatter())
+            handler = BoundedQueueHandler(queue.Queue(config['REQUEST_LOG_QUEUE_SIZE']),
+                                          policy=config['REQUEST_LOG_FULL_POLICY'],
+                                          block_timeout=config['REQUEST_LOG_BLOCK_TIMEOUT'])
+            self._listener = BatchingQueueListener(handler.queue, writer, batch_size=config['REQUEST_LOG_BATCH_SIZE'],
+                                                   flush_interval=config['REQUEST_LOG_FLUSH_INTERVAL'])
+            self._listener.start()
+            self._handler = handler
+            atexit.register(self.stop)
+            return handler
+
+    def stop(self) -> None:
+        """
+        Write the queued records and close the log, the next record starts it again
+        """
+        with self._lock:
+            if self._handler is None:
+                return
+            self._handler = None
+            self._listener.stop()
+            if self._stream is not sys.stderr:
+                self._stream.close()
+            atexit.unregister(self.stop)
+
+    def log(self, name, fields) -> None:
+        """
+        Queue a record of the log
+        :param name: Name of the log, access or audit
+        :type name: str
+        :param fields: JSON serializable fields of the record
+        :type fields: dict
+        """
+        self.start().emit(FieldsRecord(name, fields))
+
+
+def current_user_id():
+    """
+    :return: Identity of the JWT of the request, None when the endpoint didn't verify one
+    :rtype: int
+    """
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def logging_enabled() -> bool:
+    return current_app.config['REQUEST_LOG_ENABLED']
+
+
+def start_timer() -> None:
+    if logging_enabled() and request.path.startswith('/api/'):
+        g.request_log_started = time.perf_counter()
+        g.request_log_queries = 0
+
+
+def count_query(*args) -> None:
+    if has_request_context() and 'request_log_queries' in g:
+        g.request_log_queries += 1
+
+
+def log_request(response):
+    """
+    Queue the access record of the API request
+    """
+    started = g.pop('request_log_started', None)
+    if started is not None:
+        current_app.extensions['request_log'].log('access', {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'user_id': current_user_id(),
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+            'queries': g.pop('request_log_queries', 0)
+        })
+    return response
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_audit(session, flush_context) -> None:
+    """
+    Keep the audit records of the flushed writes until the transaction ends
+    """
+    if not has_app_context() or not logging_enabled():
+        return
+    user_id = current_user_id() if has_request_context() else None
+    for action, rows in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for row in rows:
+            if not isinstance(row, AUDITED_MODELS):
+                continue
+            fields = {'action': action, 'table': row.__tablename__, 'row_id': row.id,
+                      'household_id': row.household_id, 'user_id': user_id}
+            if action == 'update':
+                fields['changed'] = [attribute.key for attribute in inspect(row).attrs
+                                     if attribute.history.has_changes()]
+                if not fields['changed']:
+                    continue
+            session.info.setdefault('audit', []).append(fields)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def collect_bulk_audit(execute_state):
+    """
+    Keep the audit record of a bulk update or delete until the transaction ends, one per statement
+    with its filter and the number of the rows it wrote
+    """
+    if not (execute_state.is_update or execute_state.is_delete) or not has_app_context() or not logging_enabled():
+        return None
+    mapper = execute_state.bind_mapper
+    audited = BULK_DELETE_AUDITED_MODELS if execute_state.is_delete else BULK_AUDITED_MODELS
+    if mapper is None or not issubclass(mapper.class_, audited):
+        return None
+    result = execute_state.invoke_statement()
+    if result.rowcount:
+        where = execute_state.statement.whereclause
+        compiled = where.compile(dialect=execute_state.session.get_bind(mapper=mapper).dialect) \
+            if where is not None else None
+        execute_state.session.info.setdefault('audit', []).append({
+            'action': 'bulk_update' if execute_state.is_update else 'bulk_delete',
+            'table': mapper.local_table.name,
+            'filter': str(compiled) if compiled is not None else None,
+            'params': compiled.params if compiled is not None else {},
+            'rowcount': result.rowcount,
+            'user_id': current_user_id() if has_request_context() else None
+        })
+    return result
+
+
+@event.listens_for(db.session, 'after_commit')
+def log_audit(session) -> None:
+    records = session.info.pop('audit', None)
+    if records:
+        request_log = current_app.extensions['request_log']
+        for fields in records:
+            request_log.log('audit', fields)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_audit(session) -> None:
+    session.info.pop('audit', None)
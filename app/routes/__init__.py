@@ -1,4 +1,6 @@
 from .users import users_bp
 from .guests import guests_bp
 from .guest_types import guest_types_bp
+from .rooms import rooms_bp
 from .authentication import authentication_bp
+from .sync import sync_bp
@@ -1,8 +1,14 @@
-from flask import Blueprint, jsonify, request, Response
-from flask_jwt_extended import get_jwt_identity, create_access_token, jwt_required, create_refresh_token
+import math
+
+from flask import Blueprint, current_app, jsonify, request, Response
+from flask_jwt_extended import get_jwt_identity, create_access_token, jwt_required, get_jwt, decode_token
+from jwt import InvalidTokenError
 
 from app import db
-from app.models import User
+from app.households import household_claims
+from app.models import RefreshToken, User
+from app.refresh_tokens import issue_refresh_token, revoke_family, rotate_refresh_token
+from app.statements import USER_BY_LOGIN
 
 authentication_bp = Blueprint('authentication', __name__)
 
@@ -10,12 +16,15 @@ authentication_bp = Blueprint('authentication', __name__)
 @authentication_bp.route('/login', methods=['POST'])
 def login() -> tuple[Response, int]:
     """
-    API endpoint to authenticate a user based on their username and password.
+    API endpoint to authenticate a user based on their username or email and password, the
+    username and the email match in any case.
+    Attempts are limited per client IP and per username, over the limit the request is
+    rejected with 429 before the password is checked.
 
     POST /api/authentication/login?username=<username>&password=<password>
 
     Query Params:
-    1. username (str): The username of the user.
+    1. username (str): The username or the email of the user.
     2. password (str): The password of the user.
     :return: A JSON object with access_token and refresh_token
     :rtype: tuple[Response, int]
@@ -24,12 +33,23 @@ def login() -> tuple[Response, int]:
     username = request.json.get('username')
     password = request.json.get('password')
 
-    user = db.session.scalar(db.select(User).where(User.username == username))
+    # Throttle the attempts before the user is queried and the password hashed
+    retry_after = current_app.extensions['login_ip_limiter'].consume('ip:{}'.format(request.remote_addr)) \
+        or current_app.extensions['login_username_limiter'].consume('username:{}'.format(str(username).casefold()))
+    if retry_after:
+        response = jsonify({'error': 'Too many login attempts, try again later'})
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response, 429
+
+    # The username or the email, in any case, each of them is a seek of its lower() index
+    user = db.session.scalar(USER_BY_LOGIN, {'login': username.casefold()}) if isinstance(username, str) else None
     # Check if password is correct
     if user is not None and user.check_password(password):
-        # Create access and refresh tokens
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
+        # Create access and refresh tokens, the refresh token starts a new family
+        current_app.extensions['refresh_token_pruner'].start()
+        access_token = create_access_token(identity=user.id, additional_claims=household_claims(user))
+        refresh_token = issue_refresh_token(user.id)
+        db.session.commit()
 
         # Return tokens in response
         return jsonify({'access_token': access_token, 'refresh_token': refresh_token, 'user_id': user.id}), 200
@@ -41,7 +61,8 @@ def login() -> tuple[Response, int]:
 @jwt_required(refresh=True)
 def refresh() -> tuple[Response, int]:
     """
-    API endpoint to authenticate a user based on their username and password
+    API endpoint to exchange a refresh token for new tokens. The presented refresh token is
+    replaced and can't be used again, using it again revokes all the tokens of its login
 
     GET /api/authentication/refresh
 
@@ -51,12 +72,19 @@ def refresh() -> tuple[Response, int]:
     :return: A JSON object with access_token and refresh_token
     :rtype: tuple[Response, int]
     """
-    # Get current user
-    current_user = get_jwt_identity()
+    # Get current user, the claims of the new access token are read from the fresh row
+    user = db.session.get(User, get_jwt_identity())
+    if user is None:
+        return jsonify({'message': 'User not found.'}), 404
 
-    # Create new tokens
-    access_token = create_access_token(identity=current_user)
-    refresh_token = create_refresh_token(identity=current_user)
+    # Replace the refresh token
+    current_app.extensions['refresh_token_pruner'].start()
+    refresh_token = rotate_refresh_token(get_jwt()['jti'])
+    if refresh_token is None:
+        return jsonify({'error': 'Refresh token was revoked or already used'}), 401
+
+    # Create new access token
+    access_token = create_access_token(identity=user.id, additional_claims=household_claims(user))
 
     # Return tokens
     return jsonify({'access_token': access_token, 'refresh_token': refresh_token}), 200
@@ -66,13 +94,17 @@ def refresh() -> tuple[Response, int]:
 @jwt_required(refresh=True)
 def logout() -> tuple[Response, int]:
     """
-    API endpoint to logout user with refresh_token
+    API endpoint to logout user with refresh_token. All the refresh tokens of the login are revoked,
+    and so is the access token from the request body if it is given
 
     POST /api/authentication/logout
 
     Headers:
     1. Authorization: refresh_token
 
+    Request Body Parameters (optional):
+    1. access_token (str): The access token to revoke together with the refresh token.
+
     :return: A JSON object with result of logout
     :rtype: tuple[Response, int]
     """
@@ -82,6 +114,21 @@ def logout() -> tuple[Response, int]:
 
     # Return result
     if user:
+        token = db.session.get(RefreshToken, get_jwt()['jti'])
+        if token is not None:
+            revoke_family(token.family_id)
+            db.session.commit()
+
+        access_token = (request.get_json(silent=True) or {}).get('access_token')
+        if access_token:
+            try:
+                access_token = decode_token(access_token)
+            except InvalidTokenError:
+                # An expired or foreign token can't be used anyway
+                access_token = None
+            if access_token is not None and str(access_token['sub']) == str(current_user):
+                current_app.extensions['token_blocklist'].revoke(access_token['jti'], access_token['exp'])
+
         return jsonify({'message': 'Successfully logged out.'}), 200
     else:
         return jsonify({'message': 'User not found.'}), 404
@@ -3,7 +3,10 @@ from flask_jwt_extended import jwt_required
 from sqlalchemy.exc import IntegrityError
 
 from app import db
-from app.models import GuestType
+from app.batch import batch_response
+from app.cascade import delete_guest_type_rows, guest_type_in_use
+from app.households import current_household_id, get_in_household
+from app.models import GuestType, Tombstone
 from schemas.guest_type_schema import GuestTypeSchema
 
 guest_types_bp = Blueprint('guest_types', __name__)
@@ -15,22 +18,30 @@ guest_type_schema = GuestTypeSchema()
 @jwt_required()
 def get_guest_types():
     """
-    API endpoint for getting a list of guest types
+    API endpoint for getting a list of guest types of the household
 
     GET /api/guest_types?page=<page_number>&per_page=<per_page_number>
 
     Query Params:
     1. page (int): (Optional, default = 1) The page number of the guest types list
     2. per_page (int): (Optional, default = 10) The number of the guest types per page
+    3. ids (str): (Optional, default = None) Comma separated IDs of the guest types to get instead of a page.
+        The response has the found guest types in the requested order and missing_ids
     :return: A JSON object with page and additional data about
     :rtype: dict
     """
+    # Getting only the requested guest types when ids are given
+    household_id = current_household_id()
+    ids = request.args.get('ids')
+    if ids is not None:
+        return batch_response(GuestType, ids, 'guest_types', GuestType.household_id == household_id)
+
     # Getting query params
     page_number = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
 
     # Getting page and additional information
-    resulting_page = db.paginate(db.select(GuestType), page=page_number, per_page=per_page)
+    resulting_page = db.paginate(db.select(GuestType).where(GuestType.household_id == household_id), page=page_number, per_page=per_page)
     guest_types = resulting_page.items
     total_guest_types = resulting_page.total
     prev_page = None
@@ -63,7 +74,7 @@ def create_guest_type():
     POST /api/guest_types
 
     Request Body Parameters:
-    1. name (str): The name of the new guest type. Should be unique
+    1. name (str): The name of the new guest type. Should be unique in the household
     :return: A JSON object containing data of the new guest type
     :rtype: dict
     :raises IntegrityError: If the guest type with such name already exist
@@ -75,7 +86,7 @@ def create_guest_type():
         return jsonify(errors), 400
 
     # Creating new row in GuestType table in the database
-    new_guest_type = GuestType(name=data['name'])
+    new_guest_type = GuestType(name=data['name'], household_id=current_household_id())
     db.session.add(new_guest_type)
     try:
         db.session.commit()
@@ -101,7 +112,7 @@ def get_guest_type(guest_id):
     :rtype: dict
     """
     # Retrieve the guest type from the database
-    guest_type = db.session.get(GuestType, {'id': guest_id})
+    guest_type = get_in_household(GuestType, guest_id)
 
     if not guest_type:
         # If guest type doesn't exist return 404 response
@@ -120,7 +131,7 @@ def update_guest_type(guest_type_id):
     PUT /api/guest_types/<guest_type_id>
 
     Request Body Parameters:
-    1. name (str): The name of the guest type. Should be unique
+    1. name (str): The name of the guest type. Should be unique in the household
 
     :param guest_type_id: The unique ID of the guest type to update
     :type guest_type_id: int
@@ -135,7 +146,7 @@ def update_guest_type(guest_type_id):
         return jsonify(errors), 400
 
     # Get the guest type from the database
-    guest_type = db.session.get(GuestType, {'id': guest_type_id})
+    guest_type = get_in_household(GuestType, guest_type_id)
     if not guest_type:
         # If the guest type doesn't exist return 404 response status code
         return jsonify({'error': 'Guest type not found'}), 404
@@ -158,7 +169,8 @@ def update_guest_type(guest_type_id):
 @jwt_required()
 def delete_guest_type(guest_type_id):
     """
-       API endpoint to delete the guest type with the requested id
+       API endpoint to delete the guest type with the requested id.
+       A type which still has guests or series can't be deleted
 
        DELETE /api/guest_type/<guest_type_id>
        :param guest_type_id: The unique id of the guest type to delete
@@ -167,15 +179,26 @@ def delete_guest_type(guest_type_id):
        :rtype: dict
        """
     # Get the guest type from the database
-    guest_type = db.session.get(GuestType, {'id': guest_type_id})
+    guest_type = get_in_household(GuestType, guest_type_id)
 
     if not guest_type:
         # If the guest type doesn't exist return 404 response status code
-        return jsonify({'error': 'Guest type not found'})
+        return jsonify({'error': 'Guest type not found'}), 404
+
+    # Check if the guest type is still used
+    if guest_type_in_use(guest_type.id):
+        return jsonify({'error': 'Guest type is used by guests'}), 409
 
     # Delete the guest type from the database
+    delete_guest_type_rows(guest_type.id)
     db.session.delete(guest_type)
-    db.session.commit()
+    db.session.add(Tombstone(household_id=guest_type.household_id, table_name='guest_type', row_id=guest_type.id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A guest of the type was created in the meantime, the foreign key refused the delete
+        db.session.rollback()
+        return jsonify({'error': 'Guest type is used by guests'}), 409
 
     # Return 204 status code
     from flask import make_response
@@ -1,14 +1,28 @@
-from datetime import datetime, time
+import queue
+from datetime import datetime, time, timedelta
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, abort, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import ValidationError
 
 from app import db
-from app.models import Guest
+from app.archive import paginate_with_history, reaches_history
+from app.batch import batch_response
+from app.idempotency import idempotent
+from app.booking import free_windows, stay_bounds
+from app.events import format_event, notify_guest_change
+from app.households import current_household_id, get_in_household
+from app.models import Guest, GuestHistory, GuestStats, GuestSeries, GuestSeriesException, Tombstone
+from app.recurrence import series_in_range, expand_series
+from app.search import search_guests, search_terms
+from app.statements import guest_page_statements
+from app.stats import add_stay, series_stats
 from schemas.guest_schema import GuestSchema
+from schemas.guest_series_schema import GuestSeriesSchema
 
 guests_bp = Blueprint('guests', __name__)
 guest_schema = GuestSchema()
+guest_series_schema = GuestSeriesSchema()
 
 
 @guests_bp.route('/', methods=['GET'])
@@ -22,49 +36,64 @@ def get_guests():
 
     Query Params:
     1. page (int): (Optional, default = 1) The page number of the guest list.
-    2. per_page (int): (Optional, default = 10) The number of guests per page
+    2. per_page (int): (Optional, default = 10) The number of guests per page, at most GUEST_PAGE_MAX_SIZE
     3. inviter_id (int): (Optional, default = None) The unique ID of inviter
     4. start_date (str): (Optional, default = None) The date where search date starts
     5. end_date (str): (Optional, default = None) The date where search date ends
     6. guest_type_id (int): (Optional, default = None) The unique ID of guest type
+    7. ids (str): (Optional, default = None) Comma separated IDs of the guests to get instead of a page.
+        The response has the found guests in the requested order and missing_ids
     :return: A JSON object with page and additional data about
-        list (total number of guests, prev page number and next page number)
+        list (total number of guests, prev page number and next page number).
+        When both start_date and end_date are given, occurrences of the recurring
+        guests in this range are listed in recurring_guests. Archived guests are listed
+        too when start_date reaches the archived days, ordered by their stays
     :rtype: dict
     """
-    # Getting pagination query params
+    # Getting only the requested guests when ids are given
+    household_id = current_household_id()
+    ids = request.args.get('ids')
+    if ids is not None:
+        return batch_response(Guest, ids, 'guests', Guest.household_id == household_id)
+
+    # Getting pagination query params, the pages are at most GUEST_PAGE_MAX_SIZE guests long
     page_number = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    if page_number < 1 or per_page < 1:
+        abort(404)
+    per_page = min(per_page, current_app.config['GUEST_PAGE_MAX_SIZE'])
 
-    # Getting filter query params and add it in SQL query depending on it's value
-    select_result = db.select(Guest)
+    # Getting filter query params
     inviter_id = request.args.get('inviter_id', None, type=int)
-    if inviter_id:
-        select_result = select_result.where(Guest.inviter_id == inviter_id)
-
     guest_type_id = request.args.get('guest_type_id', None, type=int)
-    if guest_type_id:
-        select_result = select_result.where(Guest.guest_type_id == guest_type_id)
 
+    start_date = None
     start_date_str = request.args.get('start_date', None, type=str)
     if start_date_str:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        select_result = select_result.where(Guest.start_date >= start_date)
 
+    end_date = None
     end_date_str = request.args.get('end_date', None, type=str)
-    if start_date_str:
+    if end_date_str:
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        select_result = select_result.where(Guest.start_date <= end_date)
-
-    # Getting page and additional data from database
-    resulting_page = db.paginate(select_result, page=page_number, per_page=per_page)
-    guests = resulting_page.items
-    total_guests = resulting_page.total
-    prev_page = None
-    next_page = None
-    if resulting_page.has_prev:
-        prev_page = resulting_page.prev_num
-    if resulting_page.has_next:
-        next_page = resulting_page.next_num
+
+    filters = {'household_id': household_id, 'inviter_id': inviter_id, 'guest_type_id': guest_type_id, 'start_date': start_date,
+               'end_date': end_date}
+    if reaches_history(household_id, start_date):
+        # Getting page from the guests and the archived guests
+        guests, total_guests = paginate_with_history(page_number, per_page, **filters)
+        prev_page = page_number - 1 if page_number > 1 else None
+        next_page = page_number + 1 if page_number * per_page < total_guests else None
+    else:
+        # Getting page and additional data from database, with the cached statements of the listing
+        items, total, params = guest_page_statements(limit=per_page, offset=(page_number - 1) * per_page,
+                                                     **filters)
+        guests = db.session.scalars(items, params).all()
+        if not guests and page_number != 1:
+            abort(404)
+        total_guests = db.session.scalar(total, params)
+        prev_page = page_number - 1 if page_number > 1 else None
+        next_page = page_number + 1 if page_number * per_page < total_guests else None
 
     # Translating page from the database to the dictionary
     output = []
@@ -72,13 +101,294 @@ def get_guests():
         guest_data = guest.to_dict()
         output.append(guest_data)
 
+    # Expanding the recurring guests only for the requested date range
+    recurring_output = []
+    if start_date and end_date:
+        series_query = series_in_range(household_id, start_date, end_date)
+        if inviter_id:
+            series_query = series_query.where(GuestSeries.inviter_id == inviter_id)
+        if guest_type_id:
+            series_query = series_query.where(GuestSeries.guest_type_id == guest_type_id)
+        for series, day in expand_series(db.session.scalars(series_query), start_date, end_date):
+            recurring_output.append(series.occurrence_dict(day))
+
+    # Returning a JSON object with requesting data
+    return jsonify({'guests': output, 'total_guests': total_guests, 'prev_page': prev_page, 'next_page': next_page,
+                    'recurring_guests': recurring_output})
+
+
+@guests_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_guest_comments():
+    """
+    API endpoint for searching the guests by the words of their comments, the best matches first
+
+    GET /api/guests/search?q=<words>&limit=<limit>&cursor=<cursor>
+
+    Query Params:
+    1. q (str): The searched words, a comment matches when it has words starting with all of them
+    2. limit (int): (Optional, default = 10) The number of guests per page, at most 100
+    3. cursor (str): (Optional, default = None) The next_cursor of the previous page
+    4. inviter_id (int): (Optional, default = None) The unique ID of inviter
+    5. guest_type_id (int): (Optional, default = None) The unique ID of guest type
+    6. start_date (str): (Optional, default = None) The date where search date starts
+    7. end_date (str): (Optional, default = None) The date where search date ends
+    :return: A JSON object with the found guests and the cursor of the next page, None on the last page
+    :rtype: dict
+    """
+    terms = search_terms(request.args.get('q', '', type=str))
+    if not terms:
+        return jsonify({'error': 'q should contain at least one word'}), 400
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit should be between 1 and 100'}), 400
+
+    # Getting filter query params
+    start_date = None
+    start_date_str = request.args.get('start_date', None, type=str)
+    if start_date_str:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+
+    end_date = None
+    end_date_str = request.args.get('end_date', None, type=str)
+    if end_date_str:
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+
+    # Getting the page after the cursor
+    try:
+        guests, next_cursor = search_guests(terms, limit, request.args.get('cursor'),
+                                            household_id=current_household_id(),
+                                            inviter_id=request.args.get('inviter_id', None, type=int),
+                                            guest_type_id=request.args.get('guest_type_id', None, type=int),
+                                            start_date=start_date, end_date=end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Returning a JSON object with requesting data
+    return jsonify({'guests': [guest.to_dict() for guest in guests], 'next_cursor': next_cursor})
+
+
+@guests_bp.route('/free_slots', methods=['GET'])
+@jwt_required()
+def get_free_slots():
+    """
+    API endpoint for getting the time windows where nobody is checked in
+
+    GET /api/guests/free_slots?start_date=<date>&end_date=<date>&duration=<duration>
+
+    Query Params:
+    1. start_date (str): The first date of the searched range
+    2. end_date (str): The last date of the searched range
+    3. duration (str): Minimal length of a window, for example 02:30:00
+    4. page (int): (Optional, default = 1) The page number of the window list
+    5. per_page (int): (Optional, default = 10) The number of windows per page
+    :return: A JSON object with page and additional data about
+        list (total number of windows, prev page number and next page number)
+    :rtype: dict
+    """
+    # Getting pagination query params
+    page_number = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    if page_number < 1 or per_page < 1:
+        return jsonify({'error': 'Page and per_page should be positive'}), 400
+
+    # Getting the searched range
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+        duration_time = time.fromisoformat(request.args['duration'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start_date, end_date and duration are required'}), 400
+    if end_date < start_date:
+        return jsonify({'error': 'end_date cannot be before start_date'}), 400
+    duration = timedelta(hours=duration_time.hour, minutes=duration_time.minute, seconds=duration_time.second)
+    if not duration:
+        return jsonify({'error': 'Duration should be positive'}), 400
+
+    # Windows in the past can't be booked
+    range_start = max(datetime.combine(start_date, time()), datetime.now().replace(microsecond=0))
+    range_end = datetime.combine(end_date + timedelta(days=1), time())
+
+    # Load the stays in one indexed range query, the previous day is included for the stays over midnight
+    household_id = current_household_id()
+    query = db.select(Guest.coming_date, Guest.coming_time, Guest.exit_time) \
+        .where(Guest.household_id == household_id,
+               Guest.coming_date.between(start_date - timedelta(days=1), end_date)) \
+        .order_by(Guest.coming_date, Guest.coming_time)
+    stays = [stay_bounds(*row) for row in db.session.execute(query)]
+    series = db.session.scalars(series_in_range(household_id, start_date - timedelta(days=1), end_date))
+    occurrences = expand_series(series, start_date - timedelta(days=1), end_date)
+    if occurrences:
+        stays.extend(stay_bounds(day, series.coming_time, series.exit_time) for series, day in occurrences)
+        stays.sort()
+    windows = free_windows(stays, range_start, range_end, duration)
+
+    # Translating the requested page into the dictionary
+    total_windows = len(windows)
+    first = (page_number - 1) * per_page
+    output = [{'start': window_start.strftime('%Y-%m-%d %H:%M:%S'),
+               'end': window_end.strftime('%Y-%m-%d %H:%M:%S'),
+               'duration': str(window_end - window_start)}
+              for window_start, window_end in windows[first:first + per_page]]
+    prev_page = page_number - 1 if page_number > 1 else None
+    next_page = page_number + 1 if first + per_page < total_windows else None
+
+    # Returning a JSON object with requesting data
+    return jsonify({'free_slots': output, 'total_free_slots': total_windows,
+                    'prev_page': prev_page, 'next_page': next_page})
+
+
+@guests_bp.route('/now', methods=['GET'])
+@jwt_required()
+def get_current_guests():
+    """
+    API endpoint for getting the guests who are checked in right now
+
+    GET /api/guests/now
+
+    The answer is cached until the next coming or exit time of the day or the next guest write
+    :return: A JSON object with the current guests and the moment the answer is valid until
+    :rtype: dict
+    """
+    guests, valid_until = current_app.extensions['occupancy'].get(current_household_id())
+    return jsonify({'guests': guests, 'total_guests': len(guests),
+                    'valid_until': valid_until.strftime('%Y-%m-%d %H:%M:%S')})
+
+
+@guests_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def get_guest_stats():
+    """
+    API endpoint for getting the number of guests and the occupied time in a date range,
+    the occurrences of the recurring guests are counted as guests
+
+    GET /api/guests/stats?start_date=<date>&end_date=<date>&group_by=<fields>
+
+    Query Params:
+    1. start_date (str): The first date of the report
+    2. end_date (str): The last date of the report
+    3. group_by (str): (Optional, default = inviter_id) Comma separated fields to group by,
+        any of date, inviter_id and guest_type_id
+    4. inviter_id (int): (Optional, default = None) The unique ID of inviter
+    5. guest_type_id (int): (Optional, default = None) The unique ID of guest type
+    :return: A JSON object with guest count and occupied minutes of every group
+    :rtype: dict
+    """
+    # Getting the report range
+    try:
+        start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start_date and end_date are required'}), 400
+
+    # Getting the grouping fields
+    group_by = request.args.get('group_by', 'inviter_id', type=str).split(',')
+    columns = {'date': GuestStats.date, 'inviter_id': GuestStats.inviter_id,
+               'guest_type_id': GuestStats.guest_type_id}
+    if not set(group_by) <= columns.keys():
+        return jsonify({'error': 'Stats can be grouped only by date, inviter_id and guest_type_id'}), 400
+    group_columns = [columns[field] for field in group_by]
+
+    # Summing the aggregates of the range
+    query = db.select(*group_columns,
+                      db.func.sum(GuestStats.guest_count),
+                      db.func.sum(GuestStats.occupied_minutes)) \
+        .where(GuestStats.household_id == current_household_id(),
+               GuestStats.date.between(start_date, end_date)) \
+        .group_by(*group_columns)
+    inviter_id = request.args.get('inviter_id', None, type=int)
+    if inviter_id:
+        query = query.where(GuestStats.inviter_id == inviter_id)
+    guest_type_id = request.args.get('guest_type_id', None, type=int)
+    if guest_type_id:
+        query = query.where(GuestStats.guest_type_id == guest_type_id)
+
+    totals = {}
+    for row in db.session.execute(query):
+        *keys, guest_count, occupied_minutes = row
+        totals[tuple(keys)] = (guest_count or 0, occupied_minutes or 0)
+
+    # Adding the occurrences of the recurring guests to their groups
+    fields = ('date', 'inviter_id', 'guest_type_id')
+    for key, (guest_count, occupied_minutes) in series_stats(current_household_id(), start_date, end_date,
+                                                             inviter_id, guest_type_id).items():
+        group_key = tuple(key[fields.index(field)] for field in group_by)
+        total_count, total_minutes = totals.get(group_key, (0, 0))
+        totals[group_key] = (total_count + guest_count, total_minutes + occupied_minutes)
+
+    # Translating the groups into the dictionary, empty groups are left out
+    output = []
+    for keys, (guest_count, occupied_minutes) in sorted(totals.items()):
+        if not guest_count:
+            continue
+        group = dict(zip(group_by, keys))
+        if 'date' in group:
+            group['date'] = group['date'].strftime('%Y-%m-%d')
+        group.update({'guest_count': int(guest_count), 'occupied_minutes': int(occupied_minutes)})
+        output.append(group)
+
     # Returning a JSON object with requesting data
-    return jsonify({'guests': output, 'total_guests': total_guests, 'prev_page': prev_page, 'next_page': next_page})
+    return jsonify({'stats': output})
+
+
+@guests_bp.route('/events', methods=['GET'])
+@jwt_required()
+def get_guest_events():
+    """
+    API endpoint for the stream of guest changes as server-sent events
+
+    GET /api/guests/events
+
+    Headers:
+    1. Last-Event-ID: (Optional) ID of the last received event, the missed events are sent first.
+        If they are no longer buffered, a reset event is sent and the client should reload the guests
+
+    Event types: guest_created, guest_updated, guest_deleted, series_created, series_updated, series_deleted
+    :return: The text/event-stream response
+    :rtype: Response
+    """
+    broker = current_app.extensions['events']
+    keepalive = current_app.config['EVENT_KEEPALIVE']
+    last_event_id = request.headers.get('Last-Event-ID', None, type=int)
+    household_id = current_household_id()
+
+    # Subscribe before reading the buffer, so no event is lost between them
+    subscription = broker.subscribe()
+    missed = broker.events_since(last_event_id) if last_event_id is not None else []
+
+    def stream():
+        try:
+            sent_id = last_event_id or 0
+            if missed is None:
+                yield 'event: reset\ndata: {}\n\n'
+            else:
+                for event in missed:
+                    sent_id = event.id
+                    if event.household_id == household_id:
+                        yield format_event(event)
+            while True:
+                try:
+                    event = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    # The client fell behind, it reconnects with Last-Event-ID
+                    return
+                if event.id > sent_id:
+                    sent_id = event.id
+                    if event.household_id == household_id:
+                        yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 
 @guests_bp.route('/', methods=['POST'])
 @guests_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_guest():
     """
     API endpoint for creating a new guest
@@ -87,12 +397,16 @@ def create_guest():
 
     Request Body Parameters:
     1. guest_type_id (int): The unique ID for guest type
-    2. inviter_id (int): The unique ID for guest type
-    3. coming_date (str): Coming date of the guest
-    4. coming_time (str): Coming time of the guest
-    5. stay_time (str): Staying time of the guest
-    6. comment (str): Comment for guest
+    2. room_id (int): (Optional) The unique ID of the room the guest stays in, the room should have
+        a free place for the whole stay. The Main room or the only room of the household by default
+    3. inviter_id (int): The unique ID for guest type
+    4. coming_date (str): Coming date of the guest
+    5. coming_time (str): Coming time of the guest
+    6. stay_time (str): Staying time of the guest
+    7. comment (str): Comment for guest
 
+    Headers:
+    1. Idempotency-Key: (Optional) Unique key of the request, a retry with the same key replays the first response
 
     :return: A JSON object containing data of new guest
     :rtype: dict
@@ -100,22 +414,26 @@ def create_guest():
     # Getting data from request and validate it
     data = request.get_json()
     data['inviter_id'] = get_jwt_identity()
-    errors = guest_schema.validate(data)
-    if errors:
-        return jsonify(errors), 400
+    data['household_id'] = current_household_id()
+    try:
+        data = guest_schema.load(data)
+    except ValidationError as err:
+        db.session.rollback()
+        return jsonify(err.messages), 400
 
     # Creating new row in Guest table in the database
-    coming_date = datetime.strptime(data['coming_date'], '%Y-%m-%d').date()
-    coming_time = time.fromisoformat(data['coming_time'])
-    stay_time = time.fromisoformat(data['stay_time'])
-    new_guest = Guest(guest_type_id=data['guest_type_id'],
+    new_guest = Guest(household_id=data['household_id'],
+                      room_id=data['room_id'],
+                      guest_type_id=data['guest_type_id'],
                       inviter_id=data['inviter_id'],
-                      coming_date=coming_date,
-                      coming_time=coming_time,
-                      comment=data['comment'])
-    new_guest.set_exit_time(coming_date, coming_time, stay_time)
+                      coming_date=data['coming_date'],
+                      coming_time=data['coming_time'],
+                      exit_time=data['exit_time'],
+                      comment=data.get('comment'))
     db.session.add(new_guest)
+    add_stay(new_guest)
     db.session.commit()
+    notify_guest_change('guest_created', new_guest.to_dict(), new_guest.household_id)
 
     # Serialize object to JSON and return it
     return jsonify(new_guest.to_dict()), 201
@@ -133,8 +451,8 @@ def get_guest(guest_id):
     :return: A JSON object containing data of the guest with the requested ID
     :rtype: dict
     """
-    # Retrieve guest with the specified id from the database
-    guest = db.session.get(Guest, {"id": guest_id})
+    # Retrieve guest with the specified id from the database, it may be archived already
+    guest = get_in_household(Guest, guest_id) or get_in_household(GuestHistory, guest_id)
 
     if not guest:
         # If guest doesn't exist return 404 response
@@ -154,11 +472,13 @@ def update_guest(guest_id):
 
     Request Body Parameters:
     1. guest_type_id (int): The unique ID for guest type
-    2. inviter_id (int): The unique ID for guest type
-    3. coming_date (str): Coming date of the guest
-    4. coming_time (str): Coming time of the guest
-    5. stay_time (str): Staying time of the guest
-    6. comment (str): Comment for guest
+    2. room_id (int): (Optional) The unique ID of the room the guest stays in, the room should have
+        a free place for the whole stay. The room of the guest by default
+    3. inviter_id (int): The unique ID for guest type
+    4. coming_date (str): Coming date of the guest
+    5. coming_time (str): Coming time of the guest
+    6. stay_time (str): Staying time of the guest
+    7. comment (str): Comment for guest
 
     :param guest_id: The unique ID of the guest to update
     :type guest_id: int
@@ -166,7 +486,7 @@ def update_guest(guest_id):
     :rtype: dict
     """
     # Retrieve guest with the specified id from the database
-    guest = db.session.get(Guest, {'id': guest_id})
+    guest = get_in_household(Guest, guest_id)
 
     if not guest:
         # If guest doesn't exist return 404 response
@@ -179,23 +499,27 @@ def update_guest(guest_id):
 
     # Getting data from request and validate it
     data = request.get_json()
-    errors = guest_schema.validate(data, existing_guest_id=guest_id)
-    if errors:
-        return jsonify(errors), 400
-
-    # Update the guest
-    coming_date = datetime.strptime(data['coming_date'], '%Y-%m-%d').date()
-    coming_time = time.fromisoformat(data['coming_time'])
-    stay_time = time.fromisoformat(data['stay_time'])
+    data['household_id'] = guest.household_id
+    try:
+        data = guest_schema.load(data, existing_guest=guest)
+    except ValidationError as err:
+        db.session.rollback()
+        return jsonify(err.messages), 400
+
+    # Update the guest and move its stay in the aggregates
+    add_stay(guest, sign=-1)
+    guest.room_id = data['room_id']
     guest.guest_type_id = data['guest_type_id']
     guest.inviter_id = data['inviter_id']
-    guest.coming_date = datetime.strptime(data['coming_date'], '%Y-%m-%d').date()
-    guest.coming_time = time.fromisoformat(data['coming_time'])
-    guest.set_exit_time(coming_date=coming_date, coming_time=coming_time,stay_time=stay_time)
-    guest.comment = data['comment']
+    guest.coming_date = data['coming_date']
+    guest.coming_time = data['coming_time']
+    guest.exit_time = data['exit_time']
+    guest.comment = data.get('comment')
+    add_stay(guest)
 
     # Commit the changes to the database
     db.session.commit()
+    notify_guest_change('guest_updated', guest.to_dict(), guest.household_id)
 
     # Serialize the object and return it
     return jsonify(guest.to_dict())
@@ -213,7 +537,7 @@ def delete_guest(guest_id):
     :return: A JSON containing error message if it is and status code
     :rtype: dict
     """
-    guest = db.session.get(Guest, {"id": guest_id})
+    guest = get_in_household(Guest, guest_id)
 
     if not guest:
         # If guest doesn't exist return 404 status code
@@ -225,8 +549,167 @@ def delete_guest(guest_id):
         return jsonify({'error': 'Access denied'}), 403
 
     # Delete guest from database
+    add_stay(guest, sign=-1)
     db.session.delete(guest)
+    db.session.add(Tombstone(household_id=guest.household_id, table_name='guest', row_id=guest.id))
+    db.session.commit()
+    notify_guest_change('guest_deleted', {'id': guest_id}, guest.household_id)
+
+    # Return  204 status code
+    from flask import make_response
+    return make_response('', 204)
+
+
+@guests_bp.route('/series', methods=['POST'])
+@jwt_required()
+def create_guest_series():
+    """
+    API endpoint for creating a new recurring guest
+
+    POST /api/guests/series
+
+    Request Body Parameters:
+    1. guest_type_id (int): The unique ID for guest type
+    2. room_id (int): (Optional) The unique ID of the room the guest stays in, the Main room
+        or the only room of the household by default
+    3. start_date (str): Date of the first occurrence
+    4. coming_time (str): Coming time of the guest
+    5. stay_time (str): Staying time of the guest
+    6. frequency (str): daily or weekly
+    7. interval (int): (Optional, default = 1) Number of days or weeks between occurrences
+    8. until (str): (Optional) Date of the last possible occurrence
+    9. count (int): (Optional) Number of occurrences
+    10. comment (str): Comment for guest
+
+    :return: A JSON object containing data of new recurring guest
+    :rtype: dict
+    """
+    # Getting data from request and validate it
+    data = request.get_json()
+    data['inviter_id'] = get_jwt_identity()
+    data['household_id'] = current_household_id()
+    try:
+        data = guest_series_schema.load(data)
+    except ValidationError as err:
+        db.session.rollback()
+        return jsonify(err.messages), 400
+
+    # Creating one row for the whole series
+    new_series = GuestSeries(household_id=data['household_id'],
+                             room_id=data['room_id'],
+                             guest_type_id=data['guest_type_id'],
+                             inviter_id=data['inviter_id'],
+                             start_date=data['start_date'],
+                             coming_time=data['coming_time'],
+                             exit_time=data['exit_time'],
+                             frequency=data['frequency'],
+                             interval=data['interval'],
+                             until=data['until'],
+                             count=data['count'],
+                             comment=data.get('comment'))
+    db.session.add(new_series)
+    db.session.commit()
+    notify_guest_change('series_created', new_series.to_dict(), new_series.household_id)
+
+    # Serialize object to JSON and return it
+    return jsonify(new_series.to_dict()), 201
+
+
+@guests_bp.route('/series/<int:series_id>', methods=['GET'])
+@jwt_required()
+def get_guest_series(series_id):
+    """
+    API endpoint for getting information of a specific recurring guest
+
+    GET /api/guests/series/<series_id>
+    :param series_id: The unique ID of the recurring guest to retrieve
+    :type series_id: int
+    :return: A JSON object containing data of the recurring guest with the requested ID
+    :rtype: dict
+    """
+    series = get_in_household(GuestSeries, series_id)
+
+    if not series:
+        # If series doesn't exist return 404 response
+        return jsonify({'error': 'Recurring guest not found'}), 404
+
+    # Serialize object to JSON and return it
+    return jsonify(series.to_dict())
+
+
+@guests_bp.route('/series/<int:series_id>/exceptions', methods=['POST'])
+@jwt_required()
+def create_guest_series_exception(series_id):
+    """
+    API endpoint to cancel one occurrence of the recurring guest
+
+    POST /api/guests/series/<series_id>/exceptions
+
+    Request Body Parameters:
+    1. date (str): Date of the cancelled occurrence
+
+    :param series_id: The unique ID of the recurring guest
+    :type series_id: int
+    :return: A JSON object containing data of the updated recurring guest
+    :rtype: dict
+    """
+    series = get_in_household(GuestSeries, series_id)
+
+    if not series:
+        # If series doesn't exist return 404 response
+        return jsonify({'error': 'Recurring guest not found'}), 404
+
+    # Check if user tries to edit his guest
+    current_user_id = get_jwt_identity()
+    if current_user_id != series.inviter_id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    # Getting the date and check that the series has an occurrence on it
+    try:
+        day = datetime.strptime(request.get_json()['date'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'date is required'}), 400
+    if not series.occurs_on(day):
+        return jsonify({'error': 'Recurring guest has no occurrence on this date'}), 400
+
+    # Cancelling the occurrence frees its time, so no overlap check is needed
+    series.exceptions.append(GuestSeriesException(date=day))
+    series.updated_at = datetime.utcnow()
+    db.session.commit()
+    notify_guest_change('series_updated', series.to_dict(), series.household_id)
+
+    # Serialize the object and return it
+    return jsonify(series.to_dict())
+
+
+@guests_bp.route('/series/<int:series_id>', methods=['DELETE'])
+@jwt_required()
+def delete_guest_series(series_id):
+    """
+    API endpoint to delete the recurring guest with the requested id
+
+    DELETE /api/guests/series/<series_id>
+    :param series_id: The unique id of the recurring guest to delete
+    :type series_id: int
+    :return: A JSON containing error message if it is and status code
+    :rtype: dict
+    """
+    series = get_in_household(GuestSeries, series_id)
+
+    if not series:
+        # If series doesn't exist return 404 status code
+        return jsonify({'error': 'Recurring guest not found'}), 404
+
+    # Check if user tries to delete his guest
+    current_user_id = get_jwt_identity()
+    if current_user_id != series.inviter_id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    # Delete series with its exceptions from database
+    db.session.delete(series)
+    db.session.add(Tombstone(household_id=series.household_id, table_name='guest_series', row_id=series.id))
     db.session.commit()
+    notify_guest_change('series_deleted', {'id': series_id}, series.household_id)
 
     # Return  204 status code
     from flask import make_response
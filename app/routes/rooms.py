@@ -0,0 +1,192 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.batch import batch_response
+from app.cascade import room_in_use
+from app.households import current_household_id, get_in_household
+from app.models import Room, Tombstone
+from schemas.room_schema import RoomSchema
+
+rooms_bp = Blueprint('rooms', __name__)
+room_schema = RoomSchema()
+
+
+@rooms_bp.route('/', methods=['GET'])
+@rooms_bp.route('', methods=['GET'])
+@jwt_required()
+def get_rooms():
+    """
+    API endpoint for getting a list of rooms of the household
+
+    GET /api/rooms?page=<page_number>&per_page=<per_page_number>
+
+    Query Params:
+    1. page (int): (Optional, default = 1) The page number of the room list
+    2. per_page (int): (Optional, default = 10) The number of the rooms per page
+    3. ids (str): (Optional, default = None) Comma separated IDs of the rooms to get instead of a page.
+        The response has the found rooms in the requested order and missing_ids
+    :return: A JSON object with page and additional data about
+        list (total number of rooms, prev page number and next page number)
+    :rtype: dict
+    """
+    # Getting only the requested rooms when ids are given
+    household_id = current_household_id()
+    ids = request.args.get('ids')
+    if ids is not None:
+        return batch_response(Room, ids, 'rooms', Room.household_id == household_id)
+
+    # Getting query params
+    page_number = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+
+    # Getting page and additional information
+    resulting_page = db.paginate(db.select(Room).where(Room.household_id == household_id).order_by(Room.id),
+                                 page=page_number, per_page=per_page)
+    prev_page = resulting_page.prev_num if resulting_page.has_prev else None
+    next_page = resulting_page.next_num if resulting_page.has_next else None
+
+    # Return a JSON object with requesting data
+    return jsonify({'rooms': [room.to_dict() for room in resulting_page.items],
+                    'total_rooms': resulting_page.total,
+                    'prev_page': prev_page,
+                    'next_page': next_page})
+
+
+@rooms_bp.route('/', methods=['POST'])
+@rooms_bp.route('', methods=['POST'])
+@jwt_required()
+def create_room():
+    """
+    API endpoint for creating a new room of the household
+
+    POST /api/rooms
+
+    Request Body Parameters:
+    1. name (str): The name of the new room. Should be unique in the household
+    2. capacity (int): The number of guests who can stay in the room at the same time
+    :return: A JSON object containing data of the new room
+    :rtype: dict
+    """
+    # Getting data from request and validate it
+    data = request.get_json()
+    errors = room_schema.validate(data)
+    if errors:
+        return jsonify(errors), 400
+
+    # Creating new row in Room table in the database
+    new_room = Room(name=data['name'], capacity=data['capacity'], household_id=current_household_id())
+    db.session.add(new_room)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # If the room with such name already exist rollback and return 409
+        db.session.rollback()
+        return jsonify({'error': 'This room already exists'}), 409
+
+    # Serialize object to JSON and return it
+    return jsonify(new_room.to_dict()), 201
+
+
+@rooms_bp.route('/<int:room_id>', methods=['GET'])
+@jwt_required()
+def get_room(room_id):
+    """
+    API endpoint for getting information of a specific room
+
+    GET /api/rooms/<room_id>
+    :param room_id: The unique ID of the room to retrieve
+    :type room_id: int
+    :return: A JSON object containing data of the room with the requested ID
+    :rtype: dict
+    """
+    room = get_in_household(Room, room_id)
+
+    if not room:
+        # If room doesn't exist return 404 response
+        return jsonify({'error': 'Room not found'}), 404
+
+    # Serialize object to JSON and return it
+    return jsonify(room.to_dict())
+
+
+@rooms_bp.route('/<int:room_id>', methods=['PUT'])
+@jwt_required()
+def update_room(room_id):
+    """
+    API endpoint to update the room with the requested ID. A smaller capacity applies
+    to the bookings made after the change
+
+    PUT /api/rooms/<room_id>
+
+    Request Body Parameters:
+    1. name (str): The name of the room. Should be unique in the household
+    2. capacity (int): The number of guests who can stay in the room at the same time
+
+    :param room_id: The unique ID of the room to update
+    :type room_id: int
+    :return: A JSON object containing data of the updated room
+    :rtype: dict
+    """
+    # Get data from request and validate it
+    data = request.get_json()
+    errors = room_schema.validate(data)
+    if errors:
+        return jsonify(errors), 400
+
+    room = get_in_household(Room, room_id)
+    if not room:
+        # If the room doesn't exist return 404 response status code
+        return jsonify({'error': 'Room not found'}), 404
+
+    # Update the room
+    room.name = data['name']
+    room.capacity = data['capacity']
+
+    # Try to commit changes to the database
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'This room already exists'}), 409
+
+    # Serialize the object and return it
+    return jsonify(room.to_dict())
+
+
+@rooms_bp.route('/<int:room_id>', methods=['DELETE'])
+@jwt_required()
+def delete_room(room_id):
+    """
+    API endpoint to delete the room with the requested id. A room which still has guests or series can't be deleted
+
+    DELETE /api/rooms/<room_id>
+    :param room_id: The unique id of the room to delete
+    :type room_id: int
+    :return: A JSON containing error message if it is and status code
+    :rtype: dict
+    """
+    room = get_in_household(Room, room_id)
+
+    if not room:
+        # If the room doesn't exist return 404 response status code
+        return jsonify({'error': 'Room not found'}), 404
+
+    # Check if the room is still used
+    if room_in_use(room.id):
+        return jsonify({'error': 'Room is used by guests'}), 409
+
+    # Delete the room from the database
+    db.session.delete(room)
+    db.session.add(Tombstone(household_id=room.household_id, table_name='room', row_id=room.id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A guest was booked into the room in the meantime, the foreign key refused the delete
+        db.session.rollback()
+        return jsonify({'error': 'Room is used by guests'}), 409
+
+    # Return 204 status code
+    from flask import make_response
+    return make_response('', 204)
@@ -0,0 +1,196 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request, current_app
+from flask_jwt_extended import jwt_required
+
+from app import db
+from app.households import current_household_id
+from app.models import User, GuestType, Guest, GuestSeries, Room, Tombstone
+from app.tombstones import tombstone_horizon
+
+sync_bp = Blueprint('sync', __name__)
+
+# Tables sent to the clients, keyed by the name used in the response, in the order the pages walk them.
+# The tombstones of the deletes are walked after them
+SYNCED_MODELS = {'guests': Guest, 'guest_series': GuestSeries, 'users': User, 'guest_types': GuestType, 'rooms': Room}
+EPOCH = datetime(1970, 1, 1)
+
+# Position of a paged sync: the rows changed after since and up to until are sent, the page continues
+# in the table of the index after the (change time, ID) key, the table after the last model is the tombstones
+SyncPosition = namedtuple('SyncPosition', ['since', 'until', 'table', 'after'])
+
+
+def to_microseconds(moment) -> int:
+    """
+    :type moment: datetime
+    :rtype: int
+    """
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_microseconds(microseconds):
+    """
+    :type microseconds: int
+    :rtype: datetime
+    """
+    return EPOCH + timedelta(microseconds=int(microseconds))
+
+
+def encode_token(moment) -> str:
+    """
+    Encode the moment of a sync into the token returned to the client
+    :type moment: datetime
+    :rtype: str
+    """
+    return str(to_microseconds(moment))
+
+
+def decode_token(token):
+    """
+    Decode the token sent by the client
+    :type token: str
+    :rtype: datetime
+    :raises ValueError: If the token is malformed
+    """
+    return from_microseconds(token)
+
+
+def encode_page_token(position) -> str:
+    """
+    Encode the position of a paged sync into the token of its next page, unlike the sync
+    tokens it is never all digits
+    :type position: SyncPosition
+    :rtype: str
+    """
+    since = to_microseconds(position.since) if position.since is not None else None
+    after = [to_microseconds(position.after[0]), position.after[1]] if position.after is not None else None
+    payload = [since, to_microseconds(position.until), position.table, after]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_page_token(token):
+    """
+    Decode the token of the next page sent by the client
+    :type token: str
+    :rtype: SyncPosition
+    :raises ValueError: If the token is malformed
+    """
+    try:
+        since, until, table, after = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return SyncPosition(from_microseconds(since) if since is not None else None, from_microseconds(until),
+                            int(table), (from_microseconds(after[0]), int(after[1])) if after is not None else None)
+    except (binascii.Error, TypeError, UnicodeDecodeError, IndexError) as err:
+        raise ValueError('Invalid page token') from err
+
+
+def after_key(changed_at, row_id, after):
+    """
+    Conditions of the rows past the key of the last row of the previous page, the range of the
+    change times is seeked in the index and the ID only breaks the ties
+    :param changed_at: Change time column
+    :param row_id: ID column
+    :param after: (Change time, ID) of the last sent row, None on the first page of the table
+    :type after: tuple[datetime, int]
+    :rtype: list
+    """
+    if after is None:
+        return []
+    return [changed_at >= after[0], db.or_(changed_at > after[0], row_id > after[1])]
+
+
+@sync_bp.route('/', methods=['GET'])
+@sync_bp.route('', methods=['GET'])
+@jwt_required()
+def sync():
+    """
+    API endpoint for getting the changes of the household since the previous sync
+
+    GET /api/sync?since=<token>
+
+    Query Params:
+    1. since (str): (Optional, default = None) The token returned by the previous sync,
+        without it every row is returned
+
+    Rows changed shortly before the token are sent again, so a row written by a transaction
+    which committed after the previous sync is never missed. Clients should upsert rows by ID.
+    The deletes are kept for SYNC_TOMBSTONE_RETENTION_DAYS, an older token is refused with 410
+    and full_resync_required, the client should then drop its rows and sync without a token.
+    A response has at most SYNC_PAGE_SIZE rows and deleted IDs. With has_more the client should
+    sync again with next_token right away, the rows changed meanwhile come with a later sync
+    :return: A JSON object with changed rows of every table, IDs of the deleted rows,
+        has_more and the token of the next page or of the next sync
+    :rtype: dict
+    """
+    # The next sync starts from the moment before anything is read by the first page
+    position = SyncPosition(None, datetime.utcnow(), 0, None)
+    token = request.args.get('since', None, type=str)
+    if token:
+        try:
+            if token.isdigit():
+                since = decode_token(token) - timedelta(seconds=current_app.config['SYNC_TOKEN_OVERLAP'])
+                position = position._replace(since=since)
+            else:
+                position = decode_page_token(token)
+        except (ValueError, OverflowError):
+            return jsonify({'error': 'Invalid sync token'}), 400
+        # The tombstones of the deletes since then may be pruned already
+        if position.since is not None and \
+                position.since < tombstone_horizon(current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS']):
+            return jsonify({'error': 'Sync token is too old, full resync required', 'full_resync_required': True}), 410
+
+    # Collecting the changed rows and then the deleted ones with range reads over the indexes of the change
+    # times, until the page is full. Nothing was deleted before the first sync
+    household_id = current_household_id()
+    names = list(SYNCED_MODELS)
+    table_names = {model.__tablename__: name for name, model in SYNCED_MODELS.items()}
+    tables = len(names) + (1 if position.since is not None else 0)
+    output = {name: [] for name in names}
+    deleted = {name: [] for name in names}
+    left = current_app.config['SYNC_PAGE_SIZE']
+    has_more = False
+    while position.table < tables:
+        if position.table < len(names):
+            model = SYNCED_MODELS[names[position.table]]
+            changed_at, row_id = model.updated_at, model.id
+            query = db.select(model)
+        else:
+            model = Tombstone
+            changed_at, row_id = Tombstone.deleted_at, Tombstone.id
+            query = db.select(Tombstone.table_name, Tombstone.row_id, Tombstone.deleted_at, Tombstone.id)
+        query = query.where(model.household_id == household_id, changed_at <= position.until,
+                            *after_key(changed_at, row_id, position.after))
+        if position.since is not None:
+            query = query.where(changed_at > position.since)
+        query = query.order_by(changed_at, row_id).limit(left + 1)
+        rows = (db.session.scalars(query) if model is not Tombstone else db.session.execute(query)).all()
+
+        # One row more than fits tells whether the page is full before the table ends
+        has_more = len(rows) > left
+        rows = rows[:left]
+        if model is Tombstone:
+            for row in rows:
+                if row.table_name in table_names:
+                    deleted[table_names[row.table_name]].append(row.row_id)
+            last = (rows[-1].deleted_at, rows[-1].id) if rows else None
+        else:
+            output[names[position.table]] = [row.to_dict() for row in rows]
+            last = (rows[-1].updated_at, rows[-1].id) if rows else None
+        if has_more:
+            position = position._replace(after=last)
+            break
+        left -= len(rows)
+        position = position._replace(table=position.table + 1, after=None)
+        if not left:
+            has_more = position.table < tables
+            break
+
+    output['deleted'] = deleted
+    output['has_more'] = has_more
+    output['next_token'] = encode_page_token(position) if has_more else encode_token(position.until)
+
+    # Returning a JSON object with requesting data
+    return jsonify(output)
@@ -3,7 +3,13 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
 
 from app import db
-from app.models import User
+from app.batch import batch_response
+from app.cascade import delete_user_rows
+from app.events import notify_guest_change
+from app.households import current_household_id, get_in_household
+from app.idempotency import idempotent
+from app.models import User, Tombstone
+from app.search import starts_with
 from schemas.user_schema import UserSchema
 
 users_bp = Blueprint('users', __name__)
@@ -15,23 +21,31 @@ user_schema = UserSchema()
 @jwt_required()
 def get_users():
     """
-    API endpoint for getting a list of users
+    API endpoint for getting a list of users of the household
 
     GET /api/users?page=<page_number>&per_page=<per_page_number>
 
     Query Params:
     1. page (int): (Optional, default = 1) The page number of the user list.
     2. per_page (int): (Optional, default = 10) The number of users per page
+    3. ids (str): (Optional, default = None) Comma separated IDs of the users to get instead of a page.
+        The response has the found users in the requested order and missing_ids
     :return: A JSON object with page and additional data about
         list (total number of users, prev page number and next page number)
     :rtype: dict
     """
+    # Getting only the requested users when ids are given
+    household_id = current_household_id()
+    ids = request.args.get('ids')
+    if ids is not None:
+        return batch_response(User, ids, 'users', User.household_id == household_id)
+
     # Getting query params
     page_number = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
 
     # Getting page and additional data from database
-    resulting_page = db.paginate(db.select(User), page=page_number, per_page=per_page)
+    resulting_page = db.paginate(db.select(User).where(User.household_id == household_id), page=page_number, per_page=per_page)
     users = resulting_page.items
     total_users = resulting_page.total
     prev_page = None
@@ -51,12 +65,46 @@ def get_users():
     return jsonify({'users': output, 'total_users': total_users, 'prev_page': prev_page, 'next_page': next_page})
 
 
+@users_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_users():
+    """
+    API endpoint for finding the users of the household whose username or email starts with a prefix,
+    in any case
+
+    GET /api/users/search?prefix=<prefix>&limit=<limit>
+
+    Query Params:
+    1. prefix (str): The start of the username or the email
+    2. limit (int): (Optional, default = 10) The maximum number of users, at most 100
+    :return: A JSON object with the found users ordered by username
+    :rtype: dict
+    """
+    prefix = request.args.get('prefix', '', type=str).casefold()
+    if not prefix:
+        return jsonify({'error': 'prefix should not be empty'}), 400
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit should be between 1 and 100'}), 400
+
+    # The prefixes are ranges of the casefolded keys, the usernames of the household are read in order
+    users = db.session.scalars(db.select(User)
+                               .where(User.household_id == current_household_id(),
+                                      db.or_(starts_with(User.username_key, prefix),
+                                             starts_with(User.email_key, prefix)))
+                               .order_by(User.username_key).limit(limit))
+
+    # Returning a JSON object with requesting data
+    return jsonify({'users': [user.to_dict() for user in users]})
+
+
 @users_bp.route('/', methods=['POST'])
 @users_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_user():
     """
-    API endpoint for creating a new user
+    API endpoint for creating a new user, the user joins the household of the caller
 
     POST /api/users
 
@@ -65,6 +113,9 @@ def create_user():
     2. email (str): The email of the new user. Should be unique
     3. password (str): The password of the new user
 
+    Headers:
+    1. Idempotency-Key: (Optional) Unique key of the request, a retry with the same key replays the first response
+
     :return: A JSON object containing data of new user
     :rtype: dict
     :raises IntegrityError: If the user with such email or username already exists
@@ -76,7 +127,7 @@ def create_user():
         return jsonify(errors), 400
 
     # Creating new row in User table in the database
-    new_user = User(username=data['username'], email=data['email'])
+    new_user = User(username=data['username'], email=data['email'], household_id=current_household_id())
     new_user.set_password(data['password'])
     db.session.add(new_user)
     try:
@@ -106,7 +157,7 @@ def get_user(user_id):
     :rtype: dict
     """
     # Retrieve user with the specified id from the database
-    user = db.session.get(User, {"id": user_id})
+    user = get_in_household(User, user_id)
 
     if not user:
         # If user doesn't exist return 404 response
@@ -232,7 +283,7 @@ def patch_user(user_id):
 @jwt_required()
 def delete_user(user_id):
     """
-    API endpoint to delete the user with the requested id
+    API endpoint to delete the user with the requested id, together with their guests and series
 
     DELETE /api/users/<user_id>
     :param user_id: The unique id of the user to delete
@@ -251,9 +302,12 @@ def delete_user(user_id):
         # If user doesn't exist return 404 status code
         return jsonify({'error': 'User not found'}), 404
 
-    # Delete user from database
+    # Delete the rows of the user with bulk statements, then the user from database
+    delete_user_rows(user.id)
     db.session.delete(user)
+    db.session.add(Tombstone(household_id=user.household_id, table_name='user', row_id=user.id))
     db.session.commit()
+    notify_guest_change('guests_deleted', {'inviter_id': user_id}, user.household_id)
 
     # Return  204 status code
     from flask import make_response
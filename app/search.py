@@ -0,0 +1,121 @@
+import base64
+import binascii
+import json
+import re
+
+from sqlalchemy import DDL, event, literal_column
+
+from . import db
+from .archive import guest_filters
+from .models import Guest
+
+# FTS5 index of the guest comments. It is an external content table, the comments are stored
+# only in the guest table and the triggers keep the index in step with every write, the bulk
+# deletes of app.cascade and app.archive included. A migration which recreates the guest table
+# in batch mode drops the triggers and has to create them again, app.online_migration keeps them
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE guest_fts USING fts5(comment, content='guest', content_rowid='id')",
+    "CREATE TRIGGER guest_fts_insert AFTER INSERT ON guest BEGIN "
+    "INSERT INTO guest_fts(rowid, comment) VALUES (new.id, new.comment); END",
+    "CREATE TRIGGER guest_fts_delete AFTER DELETE ON guest BEGIN "
+    "INSERT INTO guest_fts(guest_fts, rowid, comment) VALUES ('delete', old.id, old.comment); END",
+    "CREATE TRIGGER guest_fts_update AFTER UPDATE OF comment ON guest BEGIN "
+    "INSERT INTO guest_fts(guest_fts, rowid, comment) VALUES ('delete', old.id, old.comment); "
+    "INSERT INTO guest_fts(rowid, comment) VALUES (new.id, new.comment); END",
+]
+
+for statement in SEARCH_DDL:
+    event.listen(Guest.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Guest.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS guest_fts').execute_if(dialect='sqlite'))
+
+guest_fts = db.table('guest_fts', db.column('rowid'))
+
+
+def search_terms(query) -> list[str]:
+    """
+    Split the search query into words, the FTS5 query syntax isn't exposed to the clients
+    :type query: str
+    :rtype: list[str]
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def starts_with(expression, prefix):
+    """
+    Condition of the expression starting with the prefix written as a range, so an index of the
+    expression is seeked instead of scanned like it is for LIKE
+    :param expression: Column or expression, usually a casefolded key
+    :param prefix: Non-empty prefix, folded the same way as the expression
+    :type prefix: str
+    """
+    return db.and_(expression >= prefix, expression < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def encode_cursor(rank, guest_id) -> str:
+    """
+    Encode the position after the last guest of a page into the cursor returned to the client
+    :type rank: float
+    :type guest_id: int
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(json.dumps([rank, guest_id]).encode()).decode()
+
+
+def decode_cursor(cursor) -> tuple[float, int]:
+    """
+    Decode the cursor sent by the client
+    :type cursor: str
+    :rtype: tuple[float, int]
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        rank, guest_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(guest_id)
+    except (binascii.Error, TypeError, UnicodeDecodeError) as err:
+        raise ValueError('Invalid cursor') from err
+
+
+def search_guests(terms, limit, cursor=None, **filters) -> tuple[list[Guest], str]:
+    """
+    Find the guests whose comment contains words starting with every term, the best matches first.
+    SQLite ranks them by bm25 of the FTS5 index, other databases fall back to LIKE, unranked
+    :param terms: Words of search_terms
+    :type terms: list[str]
+    :param limit: Number of guests per page
+    :type limit: int
+    :param cursor: (Optional) Cursor returned with the previous page
+    :type cursor: str
+    :param filters: Filters of guest_filters, household_id is required
+    :return: Guests of the page and the cursor of the next page, None on the last page
+    :rtype: tuple[list[Guest], str]
+    :raises ValueError: If the cursor is malformed
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # The table name stands for all its columns in MATCH and in the auxiliary functions
+        rank = db.func.bm25(literal_column('guest_fts'))
+        match = ' '.join('"{}"*'.format(term) for term in terms)
+        query = db.select(Guest, rank).join(guest_fts, guest_fts.c.rowid == Guest.id) \
+            .where(literal_column('guest_fts').op('MATCH')(match))
+    else:
+        rank = db.literal(0.0)
+        query = db.select(Guest, rank).where(*[Guest.comment.icontains(term, autoescape=True) for term in terms])
+    query = query.where(*guest_filters(Guest, **filters))
+
+    # The page continues after the last guest of the previous one, lower ranks are better matches
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor)
+        query = query.where(db.or_(rank > last_rank, db.and_(rank == last_rank, Guest.id > last_id)))
+
+    rows = db.session.execute(query.order_by(rank, Guest.id).limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0].id) if len(rows) > limit else None
+    return [guest for guest, _ in rows[:limit]], next_cursor
+
+
+def rebuild_search_index() -> None:
+    """
+    Rebuild the FTS5 index from the guest table, for example after the triggers were lost
+    """
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return
+    db.session.execute(db.text("INSERT INTO guest_fts(guest_fts) VALUES ('rebuild')"))
+    db.session.commit()
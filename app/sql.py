@@ -0,0 +1,27 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+
+
+def insert_ignore(table):
+    """
+    Build an INSERT statement which silently skips rows that already exist
+    :param table: Table to insert into
+    :return: Dialect specific insert statement
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return db.insert(table).prefix_with('IGNORE')
+
+
+def enable_foreign_keys(dbapi_connection, connection_record) -> None:
+    """
+    Turn on the foreign keys of a new SQLite connection, SQLite leaves them unenforced
+    and ignores their ON DELETE actions unless every connection asks for them
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
@@ -0,0 +1,110 @@
+import logging
+import threading
+from functools import lru_cache
+
+from sqlalchemy import Select, bindparam, event
+from sqlalchemy.engine.interfaces import CacheStats
+
+from . import db
+from .models import Guest, User
+
+logger = logging.getLogger(__name__)
+
+# The statements of the hot paths are built once with bound parameters and executed with their
+# values. A statement built per call generates its cache key on every execution before the compiled
+# cache of the engine can answer, a reused statement keeps its key, see benchmarks/statement_cache.py
+
+# Stays in the room coming between the two dates, without and with the updated guest
+ROOM_STAYS = db.select(Guest.coming_date, Guest.coming_time, Guest.exit_time) \
+    .where(Guest.household_id == bindparam('household_id'),
+           Guest.room_id == bindparam('room_id'),
+           Guest.coming_date.between(bindparam('first_date'), bindparam('last_date')))
+OTHER_ROOM_STAYS = ROOM_STAYS.where(Guest.id != bindparam('guest_id'))
+
+# The user whose username or email is the login, in any case. The login is bound casefolded
+USER_BY_LOGIN = db.select(User).where(db.or_(User.username_key == bindparam('login'),
+                                             User.email_key == bindparam('login')))
+
+
+@lru_cache(maxsize=None)
+def guest_page_templates(filters) -> tuple[Select, Select]:
+    """
+    Build the statements of a page of the guest listing and of its total for a combination of the filters,
+    once per combination
+    :param filters: Names of the given filters of guest_page_statements, sorted
+    :type filters: tuple[str]
+    :rtype: tuple[Select, Select]
+    """
+    conditions = [Guest.household_id == bindparam('household_id')]
+    if 'inviter_id' in filters:
+        conditions.append(Guest.inviter_id == bindparam('inviter_id'))
+    if 'guest_type_id' in filters:
+        conditions.append(Guest.guest_type_id == bindparam('guest_type_id'))
+    if 'start_date' in filters:
+        conditions.append(Guest.coming_date >= bindparam('start_date'))
+    if 'end_date' in filters:
+        conditions.append(Guest.coming_date <= bindparam('end_date'))
+    return db.select(Guest).where(*conditions).limit(bindparam('limit')).offset(bindparam('offset')), \
+        db.select(db.func.count(Guest.id)).where(*conditions)
+
+
+def guest_page_statements(household_id, limit, offset, inviter_id=None, guest_type_id=None, start_date=None,
+                          end_date=None) -> tuple[Select, Select, dict]:
+    """
+    Get the statements of a page of the guest listing and of the total number of its guests,
+    with the same filters as app.archive.guest_filters
+    :param limit: Number of guests per page
+    :type limit: int
+    :param offset: Number of guests before the page
+    :type offset: int
+    :return: Statement of the guests of the page, statement of their total and the parameters of both
+    :rtype: tuple[Select, Select, dict]
+    """
+    filters = {name: value for name, value in (('inviter_id', inviter_id), ('guest_type_id', guest_type_id),
+                                               ('start_date', start_date), ('end_date', end_date)) if value}
+    items, total = guest_page_templates(tuple(sorted(filters)))
+    return items, total, dict(filters, household_id=household_id, limit=limit, offset=offset)
+
+
+class StatementCacheStats:
+    """
+    Counts how the executed statements got their SQL: from the compiled cache of the engine (hits),
+    compiled for the first time (misses) or compiled on every execution because they have no cache
+    key, like DDL and driver level SQL (uncached). The counts are logged every log_every statements
+    """
+
+    def __init__(self, log_every=0):
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0, 'uncached': 0}
+        self._log_every = log_every
+
+    def attach(self, engine) -> None:
+        """
+        Start counting the statements executed by the engine
+        """
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        if context.cache_hit == CacheStats.CACHE_HIT:
+            key = 'hits'
+        elif context.cache_hit == CacheStats.CACHE_MISS:
+            key = 'misses'
+        else:
+            key = 'uncached'
+        with self._lock:
+            self._counts[key] += 1
+            counted = sum(self._counts.values())
+        if self._log_every and counted % self._log_every == 0:
+            logger.info('Statement cache: %(hits)d hits, %(misses)d misses, %(uncached)d uncached', self.snapshot())
+
+    def snapshot(self) -> dict:
+        """
+        :return: Counts of the hits, misses and uncached statements and the hit rate of the cacheable ones,
+            None before the first of them
+        :rtype: dict
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        cacheable = counts['hits'] + counts['misses']
+        counts['hit_rate'] = counts['hits'] / cacheable if cacheable else None
+        return counts
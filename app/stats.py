@@ -0,0 +1,101 @@
+from . import db
+from .booking import stay_bounds
+from .models import Guest, GuestHistory, GuestSeries, GuestStats
+from .recurrence import series_in_range, expand_series
+from .sql import insert_ignore
+
+
+def stay_minutes(coming_date, coming_time, exit_time) -> int:
+    """
+    Count the whole minutes of a stay
+    :rtype: int
+    """
+    start, end = stay_bounds(coming_date, coming_time, exit_time)
+    return int((end - start).total_seconds() // 60)
+
+
+def add_stay(guest, sign=1) -> None:
+    """
+    Add the stay of the guest to the aggregates of its day, inviter and type in the current
+    transaction. Call it with sign=-1 to remove the stay, for example before it is changed
+    :param guest: The guest whose stay is counted
+    :type guest: Guest
+    :param sign: 1 to add the stay, -1 to remove it
+    :type sign: int
+    """
+    minutes = sign * stay_minutes(guest.coming_date, guest.coming_time, guest.exit_time)
+    key = (GuestStats.date == guest.coming_date,
+           GuestStats.inviter_id == guest.inviter_id,
+           GuestStats.guest_type_id == guest.guest_type_id)
+    bump = db.update(GuestStats).where(*key).values(guest_count=GuestStats.guest_count + sign,
+                                                    occupied_minutes=GuestStats.occupied_minutes + minutes)
+    if db.session.execute(bump, execution_options={'synchronize_session': False}).rowcount == 0:
+        # First stay of this key, create the row and count the stay in it
+        db.session.execute(insert_ignore(GuestStats).values(date=guest.coming_date,
+                                                            inviter_id=guest.inviter_id,
+                                                            guest_type_id=guest.guest_type_id,
+                                                            household_id=guest.household_id,
+                                                            guest_count=0,
+                                                            occupied_minutes=0))
+        db.session.execute(bump, execution_options={'synchronize_session': False})
+
+
+def series_stats(household_id, start_date, end_date, inviter_id=None, guest_type_id=None) -> dict:
+    """
+    Count the occurrences of the recurring guests in the date range like the aggregates count the guests.
+    A series may never end, so its occurrences are counted for the requested range instead of being stored
+    :param household_id: Household of the series
+    :type household_id: int
+    :param start_date: First date of the range
+    :type start_date: date
+    :param end_date: Last date of the range
+    :type end_date: date
+    :param inviter_id: (Optional) Inviter of the counted series
+    :type inviter_id: int
+    :param guest_type_id: (Optional) Guest type of the counted series
+    :type guest_type_id: int
+    :return: Guest count and occupied minutes by date, inviter ID and guest type ID
+    :rtype: dict[tuple[date, int, int], tuple[int, int]]
+    """
+    query = series_in_range(household_id, start_date, end_date)
+    if inviter_id:
+        query = query.where(GuestSeries.inviter_id == inviter_id)
+    if guest_type_id:
+        query = query.where(GuestSeries.guest_type_id == guest_type_id)
+    totals = {}
+    for series, day in expand_series(db.session.scalars(query), start_date, end_date):
+        key = (day, series.inviter_id, series.guest_type_id)
+        guest_count, occupied_minutes = totals.get(key, (0, 0))
+        totals[key] = (guest_count + 1, occupied_minutes + stay_minutes(day, series.coming_time, series.exit_time))
+    return totals
+
+
+def rebuild_stats() -> int:
+    """
+    Recompute all the aggregates from the guest and the history tables in one transaction.
+    The recurring guests have no aggregates, see series_stats
+    :return: Number of aggregate rows
+    :rtype: int
+    """
+    totals = {}
+    query = db.union_all(*[
+        db.select(model.coming_date, model.inviter_id, model.guest_type_id, model.household_id,
+                  model.coming_time, model.exit_time)
+        for model in (Guest, GuestHistory)
+    ])
+    for coming_date, inviter_id, guest_type_id, household_id, coming_time, exit_time in \
+            db.session.execute(query.execution_options(yield_per=1000)):
+        key = (coming_date, inviter_id, guest_type_id, household_id)
+        guest_count, occupied_minutes = totals.get(key, (0, 0))
+        totals[key] = (guest_count + 1, occupied_minutes + stay_minutes(coming_date, coming_time, exit_time))
+
+    db.session.execute(db.delete(GuestStats))
+    if totals:
+        db.session.execute(db.insert(GuestStats), [
+            {'date': coming_date, 'inviter_id': inviter_id, 'guest_type_id': guest_type_id,
+             'household_id': household_id, 'guest_count': guest_count, 'occupied_minutes': occupied_minutes}
+            for (coming_date, inviter_id, guest_type_id, household_id), (guest_count, occupied_minutes)
+            in totals.items()
+        ])
+    db.session.commit()
+    return len(totals)
@@ -0,0 +1,109 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import RateLimitBucket
+
+
+class RateLimiter(ABC):
+    """
+    Token buckets keyed by an arbitrary string. A bucket holds at most burst tokens and gets
+    one back every refill seconds, every request takes one token
+    """
+
+    def __init__(self, burst=10, refill=1.0, max_keys=100000, cleanup_batch=100):
+        self.burst = burst
+        self.refill = refill
+        self.max_keys = max_keys
+        self.cleanup_batch = cleanup_batch
+
+    def _take(self, tokens, elapsed):
+        """
+        Refill the bucket for the elapsed seconds and take one token
+        :return: Tokens left in the bucket and seconds to wait when it was empty
+        :rtype: tuple[float, float]
+        """
+        tokens = min(self.burst, tokens + max(0.0, elapsed) / self.refill)
+        if tokens < 1:
+            return tokens, (1 - tokens) * self.refill
+        return tokens - 1, 0.0
+
+    @abstractmethod
+    def consume(self, key) -> float:
+        """
+        Take a token from the bucket of the key
+        :type key: str
+        :return: 0 if the request is allowed, otherwise seconds until it would be
+        :rtype: float
+        """
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    Buckets kept in the memory of the process. At most max_keys buckets are kept, the least
+    recently used ones are dropped first, which only forgets buckets that were idle the longest
+    """
+
+    def __init__(self, burst=10, refill=1.0, max_keys=100000, cleanup_batch=100):
+        super().__init__(burst, refill, max_keys, cleanup_batch)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens, retry_after = self._take(tokens, now - updated_at)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class DatabaseRateLimiter(RateLimiter):
+    """
+    Buckets kept in the rate_limit_bucket table, shared by all the processes of the deployment.
+    A bucket which is full again holds no information, so such rows are deleted in batches
+    """
+
+    def _evict(self, now) -> None:
+        """
+        Drop at most cleanup_batch buckets which have refilled completely
+        """
+        full = db.select(RateLimitBucket.key) \
+            .where(RateLimitBucket.updated_at <= now - timedelta(seconds=self.burst * self.refill)) \
+            .limit(self.cleanup_batch)
+        db.session.execute(db.delete(RateLimitBucket).where(RateLimitBucket.key.in_(full)),
+                           execution_options={'synchronize_session': False})
+
+    def consume(self, key) -> float:
+        now = datetime.utcnow()
+        self._evict(now)
+        for _ in range(3):
+            bucket = db.session.execute(db.select(RateLimitBucket.tokens, RateLimitBucket.updated_at)
+                                        .where(RateLimitBucket.key == key)).first()
+            try:
+                if bucket is None:
+                    tokens, retry_after = self._take(self.burst, 0)
+                    db.session.execute(db.insert(RateLimitBucket).values(key=key, tokens=tokens, updated_at=now))
+                else:
+                    tokens, retry_after = self._take(bucket.tokens, (now - bucket.updated_at).total_seconds())
+                    # Compare and set, a concurrent request may have taken a token in the meantime
+                    update = db.update(RateLimitBucket).where(RateLimitBucket.key == key,
+                                                              RateLimitBucket.updated_at == bucket.updated_at,
+                                                              RateLimitBucket.tokens == bucket.tokens) \
+                        .values(tokens=tokens, updated_at=now)
+                    if db.session.execute(update, execution_options={'synchronize_session': False}).rowcount == 0:
+                        db.session.rollback()
+                        continue
+                db.session.commit()
+                return retry_after
+            except IntegrityError:
+                db.session.rollback()
+        # The bucket is too contended to update, which only happens under a flood
+        return self.refill
@@ -0,0 +1,187 @@
+import hashlib
+import heapq
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from . import db
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Set of strings which answers "definitely not in the set" without false negatives
+    and "maybe in the set" with the false positive rate error_rate at capacity items
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenBlocklist(ABC):
+    """
+    Revoked JWTs keyed by their jti. A token stays revoked until the moment it would expire anyway
+    """
+
+    @abstractmethod
+    def revoke(self, jti, expires_at) -> None:
+        """
+        Revoke the token
+        :param jti: Unique ID of the token
+        :type jti: str
+        :param expires_at: Unix time of the token expiry, the exp claim
+        :type expires_at: int
+        """
+
+    @abstractmethod
+    def is_revoked(self, jti) -> bool:
+        """
+        Check whether the token was revoked, called for every authenticated request
+        :type jti: str
+        :rtype: bool
+        """
+
+    @abstractmethod
+    def prune(self) -> int:
+        """
+        Forget the revoked tokens which have expired
+        :return: Number of forgotten tokens
+        :rtype: int
+        """
+
+
+class MemoryTokenBlocklist(TokenBlocklist):
+    """
+    Revoked tokens kept in the memory of the process. A lookup is one dict access, which is
+    already cheaper than hashing the jti for a Bloom filter, so this store doesn't need one
+    """
+
+    def __init__(self, cleanup_batch=100):
+        self.cleanup_batch = cleanup_batch
+        self._lock = threading.Lock()
+        self._revoked = {}
+        # Expiry times of the revoked tokens, the earliest one first
+        self._expiry = []
+
+    def _evict(self, now, limit) -> int:
+        """
+        Forget at most limit tokens which have expired
+        """
+        evicted = 0
+        while evicted < limit and self._expiry and self._expiry[0][0] <= now:
+            _, jti = heapq.heappop(self._expiry)
+            self._revoked.pop(jti, None)
+            evicted += 1
+        return evicted
+
+    def revoke(self, jti, expires_at) -> None:
+        with self._lock:
+            self._evict(time.time(), self.cleanup_batch)
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiry, (expires_at, jti))
+
+    def is_revoked(self, jti) -> bool:
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._evict(time.time(), len(self._expiry))
+
+
+class DatabaseTokenBlocklist(TokenBlocklist):
+    """
+    Revoked tokens kept in the revoked_token table, shared by all the processes of the deployment.
+
+    Every process mirrors the revoked jtis into a Bloom filter, pulling the new rows at most once
+    per sync_interval seconds, so most tokens, which were never revoked, are let through without
+    a query. A token revoked by another process is noticed after sync_interval seconds at the latest
+    """
+
+    def __init__(self, sync_interval=1.0, capacity=100000, error_rate=0.001, cleanup_batch=1000):
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cleanup_batch = cleanup_batch
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._last_row_id = 0
+        self._synced_at = None
+
+    def _sync(self) -> None:
+        """
+        Add the rows revoked since the previous sync to the Bloom filter
+        """
+        query = db.select(RevokedToken.id, RevokedToken.jti).where(RevokedToken.id > self._last_row_id) \
+            .order_by(RevokedToken.id)
+        for row_id, jti in db.session.execute(query):
+            self._bloom.add(jti)
+            self._last_row_id = row_id
+        self._synced_at = time.monotonic()
+
+    def revoke(self, jti, expires_at) -> None:
+        db.session.add(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(expires_at)))
+        db.session.commit()
+        with self._lock:
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti) -> bool:
+        with self._lock:
+            if self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval:
+                self._sync()
+            if jti not in self._bloom:
+                return False
+
+        # Maybe revoked, confirm it with the primary key lookup
+        expires_at = db.session.scalar(db.select(RevokedToken.expires_at).where(RevokedToken.jti == jti))
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def prune(self) -> int:
+        """
+        Delete the expired rows in batches and rebuild the Bloom filter from the rest,
+        which also drops the false positives of the expired tokens
+        """
+        deleted = 0
+        while True:
+            expired = db.select(RevokedToken.id).where(RevokedToken.expires_at <= datetime.utcnow()) \
+                .limit(self.cleanup_batch)
+            result = db.session.execute(db.delete(RevokedToken).where(RevokedToken.id.in_(expired)),
+                                        execution_options={'synchronize_session': False})
+            db.session.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.cleanup_batch:
+                break
+
+        with self._lock:
+            self._bloom = BloomFilter(self.capacity, self.error_rate)
+            self._last_row_id = 0
+            self._sync()
+        return deleted
+
+
+def check_if_token_revoked(jwt_header, jwt_payload) -> bool:
+    """
+    token_in_blocklist_loader of flask_jwt_extended
+    """
+    from flask import current_app
+
+    return current_app.extensions['token_blocklist'].is_revoked(jwt_payload['jti'])
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from . import db
+from .models import Tombstone
+
+
+def tombstone_horizon(retention_days) -> datetime:
+    """
+    :param retention_days: Days the tombstones are kept
+    :type retention_days: int
+    :return: Moment before which the tombstones may be pruned, the sync needs a full resync from earlier tokens
+    :rtype: datetime
+    """
+    return datetime.utcnow() - timedelta(days=retention_days)
+
+
+def prune_tombstones(retention_days, batch_size=1000) -> int:
+    """
+    Delete the tombstones older than the retention, every batch in its own short transaction.
+    The oldest tombstones have the lowest IDs, so the batches are found at the start of the table
+    :param retention_days: Days the tombstones are kept
+    :type retention_days: int
+    :param batch_size: Tombstones deleted per transaction
+    :type batch_size: int
+    :return: Number of deleted tombstones
+    :rtype: int
+    """
+    horizon = tombstone_horizon(retention_days)
+    deleted = 0
+    while True:
+        expired = db.select(Tombstone.id).where(Tombstone.deleted_at < horizon).order_by(Tombstone.id).limit(batch_size)
+        result = db.session.execute(db.delete(Tombstone).where(Tombstone.id.in_(expired)),
+                                    execution_options={'synchronize_session': False})
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
@@ -0,0 +1,83 @@
+"""
+Booking throughput against the number of distinct booking days
+
+Every booking locks the row of its coming_date, so concurrent writers only queue behind
+bookings of the same day. Run it on a throwaway database of the engine you deploy on, e.g.
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=postgresql://localhost/roommates_benchmark \
+        python -m benchmarks.booking_throughput
+
+On SQLite the whole database has a single writer, so the numbers stay flat there.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, Room
+
+BOOKINGS = 400
+WORKERS = 16
+
+
+def run(app, headers, guest_type_id, room_id, days) -> float:
+    """
+    Post BOOKINGS non-overlapping guests spread over the given number of days
+    :return: Bookings per second
+    :rtype: float
+    """
+    first_day = date.today() + timedelta(days=1)
+    bookings = []
+    for i in range(BOOKINGS):
+        slot = i // days
+        bookings.append({
+            'guest_type_id': guest_type_id,
+            'room_id': room_id,
+            'coming_date': (first_day + timedelta(days=i % days)).strftime('%Y-%m-%d'),
+            'coming_time': '{:02d}:{:02d}:00'.format(slot * 2 // 60, slot * 2 % 60),
+            'stay_time': '00:01:00',
+            'comment': 'benchmark'
+        })
+
+    def book(data):
+        return app.test_client().post('/api/guests', json=data, headers=headers).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        statuses = list(executor.map(book, bookings))
+    elapsed = time.perf_counter() - started
+
+    assert statuses.count(201) == BOOKINGS, 'Some of the bookings were rejected'
+    return BOOKINGS / elapsed
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        household = Household(name='Benchmark')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='benchmark_user', email='benchmark@example.com', password='0000',
+                    household_id=household.id)
+        guest_type = GuestType(name='Benchmark', household_id=household.id)
+        room = Room(name='Benchmark', capacity=1, household_id=household.id)
+        db.session.add_all([user, guest_type, room])
+        db.session.commit()
+        headers = {'Authorization': 'Bearer {}'.format(create_access_token(identity=user.id))}
+
+        try:
+            for days in (1, 2, 4, 8, 16):
+                throughput = run(app, headers, guest_type.id, room.id, days)
+                print('{:>3} days: {:8.1f} bookings/s'.format(days, throughput))
+                db.session.execute(db.delete(Guest).where(Guest.inviter_id == user.id))
+                db.session.commit()
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
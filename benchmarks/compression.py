@@ -0,0 +1,57 @@
+"""
+CPU time against bytes saved for the compression of a guest listing
+
+    python -m benchmarks.compression
+
+Prints the time to compress one listing and its compressed size for every encoding
+and level, so COMPRESS_LEVEL and COMPRESS_BROTLI_LEVEL can be picked for the deployment.
+"""
+import json
+import time
+from datetime import date, timedelta
+
+from app.compression import ZlibCompressor, brotli
+
+REPEATS = 20
+
+
+def guest_listing(guests) -> bytes:
+    """
+    Build the body of GET /api/guests with the given number of guests per page
+    """
+    first_day = date.today()
+    output = [{
+        'id': i,
+        'guest_type_id': i % 5 + 1,
+        'inviter_id': i % 7 + 1,
+        'coming_date': (first_day + timedelta(days=i // 10)).strftime('%Y-%m-%d'),
+        'coming_time': '{:02d}:00:00'.format(i % 24),
+        'stay_time': '2:00:00',
+        'comment': 'Visit number {}'.format(i)
+    } for i in range(guests)]
+    return json.dumps({'guests': output, 'total_guests': guests, 'prev_page': None, 'next_page': 2}).encode()
+
+
+def measure(name, data, make_compressor) -> None:
+    started = time.process_time()
+    for _ in range(REPEATS):
+        compressor = make_compressor()
+        compressed = compressor.process(data) + compressor.finish()
+    elapsed = (time.process_time() - started) / REPEATS
+    print('{:>10}: {:8.3f} ms CPU, {:>8} bytes, {:5.1f}% saved'.format(
+        name, elapsed * 1000, len(compressed), (1 - len(compressed) / len(data)) * 100))
+
+
+def main():
+    for guests in (10, 100, 1000):
+        data = guest_listing(guests)
+        print('{} guests, {} bytes'.format(guests, len(data)))
+        for level in (1, 6, 9):
+            measure('gzip {}'.format(level), data, lambda: ZlibCompressor('gzip', level))
+        if brotli is not None:
+            for quality in (1, 4, 11):
+                measure('br {}'.format(quality), data, lambda: brotli.Compressor(quality=quality))
+
+
+if __name__ == '__main__':
+    main()
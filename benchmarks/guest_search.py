@@ -0,0 +1,76 @@
+"""
+Latency of the guest comment search against a substring scan of the comments
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=sqlite:////tmp/search.db python -m benchmarks.guest_search
+
+The FTS5 index answers a search from the posting lists of its words, so the latency
+follows the number of matches instead of the number of guests, while LIKE reads every
+comment of the household.
+"""
+import random
+import statistics
+import time
+from datetime import date, time as day_time, timedelta
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, Room
+from app.search import search_guests
+
+GUESTS = 200000
+SEARCHES = 200
+WORDS = ['birthday', 'party', 'board', 'games', 'movie', 'night', 'dinner', 'study', 'group', 'cousin',
+         'visit', 'weekend', 'parents', 'football', 'match', 'rehearsal', 'band', 'late', 'early', 'quiet']
+
+
+def percentiles(timings) -> str:
+    """
+    :return: p50 and p95 of the timings in milliseconds
+    :rtype: str
+    """
+    cuts = statistics.quantiles(timings, n=20)
+    return 'p50 {:7.2f} ms, p95 {:7.2f} ms'.format(cuts[9] * 1000, cuts[18] * 1000)
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        household = Household(name='Benchmark')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='benchmark_user', email='benchmark@example.com', password='0000',
+                    household_id=household.id)
+        guest_type = GuestType(name='Benchmark', household_id=household.id)
+        room = Room(name='Benchmark', capacity=1, household_id=household.id)
+        db.session.add_all([user, guest_type, room])
+        db.session.commit()
+
+        try:
+            rng = random.Random(0)
+            first_day = date.today() - timedelta(days=365)
+            db.session.execute(db.insert(Guest), [{
+                'household_id': household.id, 'room_id': room.id, 'guest_type_id': guest_type.id,
+                'inviter_id': user.id, 'coming_date': first_day + timedelta(days=i // 24 % 730),
+                'coming_time': day_time(i % 24), 'exit_time': day_time(i % 24, 30),
+                'comment': ' '.join(rng.sample(WORDS, 4)) + ' {}'.format(i)} for i in range(GUESTS)])
+            db.session.commit()
+
+            queries = [rng.sample(WORDS, 2) for _ in range(SEARCHES)]
+            for name, search in (('search', lambda terms: search_guests(terms, 10, household_id=household.id)),
+                                 ('like', lambda terms: db.session.execute(
+                                     db.select(Guest).where(Guest.household_id == household.id,
+                                                            *[Guest.comment.contains(term) for term in terms])
+                                     .order_by(Guest.id).limit(11)).all())):
+                timings = []
+                for terms in queries:
+                    started = time.perf_counter()
+                    search(terms)
+                    timings.append(time.perf_counter() - started)
+                print('{:>6}: {}'.format(name, percentiles(timings)))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
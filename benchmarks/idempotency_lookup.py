@@ -0,0 +1,33 @@
+"""
+Lookup cost of the in-process idempotency store against the number of stored keys
+
+    python -m benchmarks.idempotency_lookup
+
+A lookup is a dict access and the expired keys are evicted from the front of the
+dict in bounded batches, so the cost per lookup stays flat as the store grows.
+"""
+import time
+
+from app.idempotency import MemoryIdempotencyStore, StoredResponse
+
+LOOKUPS = 100000
+
+
+def main():
+    response = StoredResponse('fingerprint', 201, b'{}', 'application/json')
+    for keys in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        store = MemoryIdempotencyStore(ttl=3600, max_keys=keys + 1)
+        for i in range(keys):
+            key = 'key{}'.format(i)
+            store.reserve(key, 'fingerprint')
+            store.complete(key, response)
+
+        started = time.perf_counter()
+        for i in range(LOOKUPS):
+            store.reserve('key{}'.format(i * 7919 % keys), 'fingerprint')
+        elapsed = time.perf_counter() - started
+        print('{:>8} keys: {:6.2f} us/lookup'.format(keys, elapsed / LOOKUPS * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Guest listing latency during a flood of failed logins, with and without the login throttling
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=sqlite:///:memory: python -m benchmarks.login_flood
+
+Every login attempt hashes the password with bcrypt. Without the throttling the flood keeps
+the CPU busy and the latency of the other endpoints grows, with it the attempts over the
+limit are rejected before the user query, so the latency stays close to the idle one.
+The CPU time spent per login attempt of the flood is printed as well.
+"""
+import statistics
+import threading
+import time
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Household, User, GuestType
+from app.throttling import MemoryRateLimiter
+
+FLOOD_WORKERS = 4
+ROUND_TRIP = 0.02  # seconds
+REQUESTS = 2000
+
+
+def measure(app, headers) -> list[float]:
+    """
+    List the guests REQUESTS times
+    :return: Latencies in milliseconds
+    :rtype: list[float]
+    """
+    client = app.test_client()
+    latencies = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        assert client.get('/api/guests', headers=headers).status_code == 200
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def flood(app, stop, cpu_times) -> None:
+    """
+    Guess the password of the existing user from one client until stopped
+    """
+    client = app.test_client()
+    i = 0
+    started = time.thread_time()
+    while not stop.is_set():
+        client.post('/api/authentication/login', json={'username': 'benchmark_user', 'password': 'guess{}'.format(i)},
+                    environ_base={'REMOTE_ADDR': '203.0.113.7'})
+        i += 1
+        # Network round trip of the attacker
+        time.sleep(ROUND_TRIP)
+    cpu_times.append((i, time.thread_time() - started))
+
+
+def run(app, headers, name) -> None:
+    stop = threading.Event()
+    cpu_times = []
+    workers = [threading.Thread(target=flood, args=(app, stop, cpu_times)) for _ in range(FLOOD_WORKERS)]
+    for worker in workers:
+        worker.start()
+    try:
+        latencies = sorted(measure(app, headers))
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    attempts = sum(attempts for attempts, _ in cpu_times)
+    cpu_time = sum(cpu_time for _, cpu_time in cpu_times)
+    print('{:>14}: p50 {:7.2f} ms, p95 {:7.2f} ms, {:5d} login attempts, {:7.2f} CPU ms/attempt'.format(
+        name, statistics.median(latencies), latencies[int(len(latencies) * 0.95)], attempts,
+        cpu_time / attempts * 1000))
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        household = Household(name='Benchmark')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='benchmark_user', email='benchmark@example.com', household_id=household.id)
+        user.set_password('0000')
+        guest_type = GuestType(name='Benchmark', household_id=household.id)
+        db.session.add_all([user, guest_type])
+        db.session.commit()
+        headers = {'Authorization': 'Bearer {}'.format(create_access_token(identity=user.id))}
+
+        try:
+            latencies = sorted(measure(app, headers))
+            print('{:>14}: p50 {:7.2f} ms, p95 {:7.2f} ms'.format('idle', statistics.median(latencies),
+                                                                 latencies[int(len(latencies) * 0.95)]))
+            run(app, headers, 'throttled')
+
+            # Buckets which never run out
+            app.extensions['login_ip_limiter'] = MemoryRateLimiter(burst=10 ** 9)
+            app.extensions['login_username_limiter'] = MemoryRateLimiter(burst=10 ** 9)
+            run(app, headers, 'not throttled')
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Write stalls of a guest table rebuild, batch_alter_table against rebuild_table_online
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=sqlite:////tmp/migration.db python -m benchmarks.online_migration
+
+Both rebuild a table of a million guests while another connection keeps booking guests.
+The batch mode copies the whole table in one transaction, so the bookings wait for all of
+it, the online rebuild only holds the lock for one chunk at a time and for the swap.
+"""
+import statistics
+import threading
+import time
+import warnings
+from datetime import date, time as day_time, timedelta
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, Room
+from app.online_migration import rebuild_table_online
+
+GUESTS = 1000000
+CHUNK_SIZE = 10000
+
+
+class Writer(threading.Thread):
+    """
+    Books guests one by one on its own connection and records how long every booking took
+    """
+
+    def __init__(self, engine, guest):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.guest = guest
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        with self.engine.connect() as connection:
+            while not self.stopped.is_set():
+                started = time.perf_counter()
+                connection.execute(sa.insert(Guest.__table__), self.guest)
+                connection.commit()
+                self.latencies.append(time.perf_counter() - started)
+                time.sleep(0.005)
+
+
+def measure(engine, guest, rebuild) -> str:
+    """
+    Run the rebuild while a writer books guests
+    :return: Duration of the rebuild and the latencies of the bookings
+    :rtype: str
+    """
+    writer = Writer(engine, guest)
+    writer.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    rebuild()
+    elapsed = time.perf_counter() - started
+    writer.stopped.set()
+    writer.join()
+    return '{:6.1f} s, {:5d} bookings, p50 {:7.1f} ms, max {:8.1f} ms'.format(
+        elapsed, len(writer.latencies), statistics.median(writer.latencies) * 1000, max(writer.latencies) * 1000)
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        household = Household(name='Benchmark')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='benchmark_user', email='benchmark@example.com', password='0000',
+                    household_id=household.id)
+        guest_type = GuestType(name='Benchmark', household_id=household.id)
+        room = Room(name='Benchmark', capacity=1, household_id=household.id)
+        db.session.add_all([user, guest_type, room])
+        db.session.commit()
+
+        guest = {'household_id': household.id, 'room_id': room.id, 'guest_type_id': guest_type.id,
+                 'inviter_id': user.id, 'coming_date': date.today(), 'coming_time': day_time(10),
+                 'exit_time': day_time(11), 'comment': 'benchmark', 'updated_at': date.today()}
+        first_day = date.today() - timedelta(days=3650)
+        for start in range(0, GUESTS, 100000):
+            db.session.execute(db.insert(Guest), [dict(guest, coming_date=first_day + timedelta(days=i // 300))
+                                                  for i in range(start, start + 100000)])
+            db.session.commit()
+
+        # The bookings wait for the lock instead of failing
+        engine = sa.create_engine(app.config['SQLALCHEMY_DATABASE_URI'], connect_args={'timeout': 600})
+        table = Guest.__table__.to_metadata(sa.MetaData())
+        table.append_column(sa.Column('checked_in', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+        def online():
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                rebuild_table_online(connection, table, chunk_size=CHUNK_SIZE, progress=lambda *args: None)
+
+        def batch():
+            with engine.begin() as connection:
+                operations = Operations(MigrationContext.configure(connection))
+                with operations.batch_alter_table('guest', table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+                    batch_op.drop_column('checked_in')
+
+        # The batch mode reflects the tables, including the expression indexes it can't
+        warnings.filterwarnings('ignore', 'Skipped unsupported reflection')
+        try:
+            print('online: {}'.format(measure(engine, guest, online)))
+            print(' batch: {}'.format(measure(engine, guest, batch)))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Overhead of the access and audit logs on the request threads
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=sqlite:////tmp/request_log.db REQUEST_LOG_FILE=/tmp/requests.log \
+        python -m benchmarks.request_log
+
+Times a guest listing and a guest booking with the logs disabled and enabled with both policies
+for a full queue, then the cost of one record on the request thread: written and flushed inline
+against put into the queue of the listener.
+"""
+import itertools
+import os
+import queue
+import tempfile
+import time
+from datetime import date, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Room
+from app.request_log import BoundedQueueHandler, FieldsRecord, JsonFormatter, JsonLinesHandler
+
+REQUESTS = 2000
+RECORDS = 100000
+MODES = [('disabled', False, 'drop'), ('drop', True, 'drop'), ('block', True, 'block')]
+
+
+def measure(app, name, send, count) -> None:
+    """
+    Send the requests with the logs disabled and with both policies
+    """
+    request_log = app.extensions['request_log']
+    send()
+    for mode, enabled, policy in MODES:
+        app.config.update(REQUEST_LOG_ENABLED=enabled, REQUEST_LOG_FULL_POLICY=policy)
+        started = time.perf_counter()
+        for _ in range(count):
+            send()
+        elapsed = (time.perf_counter() - started) / count * 10 ** 6
+        dropped = request_log.dropped
+        request_log.stop()
+        print('{:>8} {:>8}: {:7.1f} us/request, {} dropped'.format(name, mode, elapsed, dropped))
+
+
+def record_cost(handler) -> float:
+    """
+    :return: Microseconds per record
+    :rtype: float
+    """
+    fields = {'method': 'GET', 'path': '/api/guests', 'endpoint': 'guests.get_guests', 'user_id': 1,
+              'status': 200, 'latency_ms': 1.234, 'queries': 2}
+    started = time.perf_counter()
+    for _ in range(RECORDS):
+        handler(FieldsRecord('access', fields))
+    return (time.perf_counter() - started) / RECORDS * 10 ** 6
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        household = Household(name='Benchmark')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='benchmark_user', email='benchmark@example.com', password='0000',
+                    household_id=household.id)
+        guest_type = GuestType(name='Benchmark', household_id=household.id)
+        room = Room(name='Benchmark', capacity=1, household_id=household.id)
+        db.session.add_all([user, guest_type, room])
+        db.session.commit()
+        guest = {'guest_type_id': guest_type.id, 'inviter_id': user.id, 'room_id': room.id,
+                 'coming_time': '10:00:00', 'stay_time': '00:30:00', 'comment': 'Benchmark'}
+        headers = {'Authorization': 'Bearer {}'.format(create_access_token(
+            identity=user.id, additional_claims={'household_id': household.id}))}
+
+    client = app.test_client()
+    measure(app, 'listing', lambda: client.get('/api/guests?per_page=10', headers=headers), REQUESTS)
+    days = itertools.count(1)
+    measure(app, 'booking', lambda: client.post('/api/guests', headers=headers, json=dict(
+        guest, coming_date=(date.today() + timedelta(days=next(days))).strftime('%Y-%m-%d'))), REQUESTS // 10)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'inline.log'), 'a', encoding='utf-8') as stream:
+            writer = JsonLinesHandler(stream)
+            writer.setFormatter(JsonFormatter())
+            print('  inline: {:6.2f} us/record'.format(record_cost(lambda record: writer.emit_batch([record]))))
+        handler = BoundedQueueHandler(queue.Queue())
+        print('  queued: {:6.2f} us/record'.format(record_cost(handler.emit)))
+
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Per call cost of the hot statements: built and compiled every time, built every time and found
+in the compiled cache, and the prebuilt statements of app.statements
+
+    DATABASE_URL=sqlite:// BENCHMARK_DATABASE_URL=sqlite:// python -m benchmarks.statement_cache
+
+A statement built per call has to compute its cache key before the compiled cache can answer,
+a prebuilt statement keeps its key and only binds the values of its parameters. The tables are empty, so
+the numbers are the Python side of every execution.
+"""
+import time
+from datetime import date
+
+from sqlalchemy.orm import Session
+
+from app import create_app, db
+from app.models import Guest, User
+from app.statements import OTHER_ROOM_STAYS, USER_BY_LOGIN, guest_page_statements
+
+CALLS = 5000
+
+
+def built(i):
+    """
+    The statements as they were built by the routes before app.statements
+    """
+    return [
+        (db.select(Guest).where(Guest.household_id == i % 7, Guest.inviter_id == i % 5 + 1,
+                                Guest.coming_date >= date(2023, 1, 1)).limit(10).offset(i % 3 * 10), None),
+        (db.select(Guest.coming_date, Guest.coming_time, Guest.exit_time)
+         .where(Guest.household_id == i % 7, Guest.room_id == i % 3,
+                Guest.coming_date.between(date(2023, 5, 31), date(2023, 6, 2)), Guest.id != i), None),
+        (db.select(User).where(db.or_(User.username_key == 'user{}'.format(i),
+                                      User.email_key == 'user{}'.format(i))), None),
+    ]
+
+
+def prebuilt(i):
+    items, _, params = guest_page_statements(i % 7, 10, i % 3 * 10, inviter_id=i % 5 + 1,
+                                             start_date=date(2023, 1, 1))
+    return [(items, params),
+            (OTHER_ROOM_STAYS, {'household_id': i % 7, 'room_id': i % 3, 'first_date': date(2023, 5, 31),
+                                'last_date': date(2023, 6, 2), 'guest_id': i}),
+            (USER_BY_LOGIN, {'login': 'user{}'.format(i)})]
+
+
+def run(session, statements) -> float:
+    """
+    :return: Microseconds per execution
+    :rtype: float
+    """
+    started = time.perf_counter()
+    for i in range(CALLS):
+        for statement, params in statements(i):
+            session.execute(statement, params).all()
+    return (time.perf_counter() - started) / CALLS / 3 * 10 ** 6
+
+
+def main():
+    app = create_app('benchmark')
+    with app.app_context():
+        db.create_all()
+        with db.engine.connect() as connection:
+            uncached = Session(connection.execution_options(compiled_cache=None))
+            print('built, compiled every time: {:6.1f} us/statement'.format(run(uncached, built)))
+        print('built, compiled once:       {:6.1f} us/statement'.format(run(db.session, built)))
+        print('prebuilt statements:        {:6.1f} us/statement'.format(run(db.session, prebuilt)))
+        print('statement cache: {}'.format(app.extensions['statement_cache'].snapshot()))
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,64 @@ class Config:
     DEBUG = False
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    BLUEPRINTS = ['guests', 'users', 'guest_types', 'authentication']
+    BLUEPRINTS = ['guests', 'users', 'guest_types', 'rooms', 'authentication', 'sync']
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
     JWT_REFRESH_TOKEN_EXPIRES = 604800  # 1 week
+    TOKEN_BLOCKLIST = 'app.token_blocklist:MemoryTokenBlocklist'
+    REFRESH_TOKEN_PRUNE_INTERVAL = 3600  # seconds, 0 disables the background pruning
+    REFRESH_TOKEN_PRUNE_BATCH = 1000
+    LOGIN_RATE_LIMITER = 'app.throttling:MemoryRateLimiter'
+    LOGIN_RATE_LIMIT_MAX_KEYS = 100000
+    LOGIN_IP_BURST = 20
+    LOGIN_IP_REFILL = 3  # seconds per attempt
+    LOGIN_USERNAME_BURST = 5
+    LOGIN_USERNAME_REFILL = 60  # seconds per attempt
+    IDEMPOTENCY_STORE = 'app.idempotency:MemoryIdempotencyStore'
+    IDEMPOTENCY_KEY_TTL = 86400  # 1 day
+    IDEMPOTENCY_MAX_KEYS = 100000
+    SYNC_TOKEN_OVERLAP = 5  # seconds
+    SYNC_TOMBSTONE_RETENTION_DAYS = 30  # older tombstones are pruned, older sync tokens need a full resync
+    SYNC_TOMBSTONE_PRUNE_BATCH = 1000
+    SYNC_PAGE_SIZE = 1000  # rows and deleted IDs per response, the rest follows with has_more
+    BATCH_FETCH_MAX_IDS = 1000
+    BATCH_FETCH_CHUNK_SIZE = 500  # IDs per IN list
+    GUEST_PAGE_MAX_SIZE = 100  # larger per_page values of the guest listing are capped
+    GUEST_ARCHIVE_DAYS = 90  # guests who came earlier are moved to the history table
+    GUEST_ARCHIVE_CHUNK_SIZE = 1000
+    EVENT_BROKER = 'app.events:MemoryEventBroker'
+    EVENT_BUFFER_SIZE = 1000
+    EVENT_KEEPALIVE = 15  # seconds
+    COMPRESS_ENABLED = True
+    COMPRESS_MIMETYPES = ['application/json', 'text/csv', 'text/event-stream']
+    COMPRESS_MIN_SIZE = 500  # bytes
+    COMPRESS_LEVEL = 6  # gzip and deflate, 1-9
+    COMPRESS_BROTLI_LEVEL = 4  # 0-11, used when the brotli package is installed
+    STATEMENT_CACHE_LOG_EVERY = 10000  # statements between the logged cache hit rates, 0 disables the logging
+    JOB_BACKEND = 'app.jobs:MemoryJobBackend'
+    JOB_QUEUE_SIZE = 1000
+    JOB_WORKERS = 2  # 0 runs the jobs inline when they are enqueued
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 1  # seconds before the first retry, doubled by every next one
+    REQUEST_LOG_ENABLED = True
+    REQUEST_LOG_FILE = None  # JSON lines of the access and audit logs, None writes them to stderr
+    REQUEST_LOG_QUEUE_SIZE = 10000
+    REQUEST_LOG_BATCH_SIZE = 100
+    REQUEST_LOG_FLUSH_INTERVAL = 0.5  # seconds the records gather before a batch is written
+    REQUEST_LOG_FULL_POLICY = 'drop'  # or 'block' the request until there is room in the queue
+    REQUEST_LOG_BLOCK_TIMEOUT = 1  # seconds, the record is dropped after
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     JWT_SECRET_KEY = os.environ.get('SECRET_KEY')
+    REQUEST_LOG_FILE = os.environ.get('REQUEST_LOG_FILE')
+
+
+class BenchmarkConfig(ProductionConfig):
+    # The benchmarks create and drop their schema, so they never run on the DATABASE_URL of the deployment
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCHMARK_DATABASE_URL',
+                                             'sqlite:///' + os.path.join(home_dir, 'Databases/benchmark_db.db'))
+    JWT_SECRET_KEY = 'benchmark-secret-key'
 
 
 class DevelopmentConfig(Config):
@@ -25,5 +75,8 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    REFRESH_TOKEN_PRUNE_INTERVAL = 0
+    JOB_WORKERS = 0
+    REQUEST_LOG_ENABLED = False
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(home_dir, 'Databases/testing_db.db')
     JWT_SECRET_KEY = 'super-secret-key'
@@ -0,0 +1,103 @@
+"""Households partition the users, guest types and guests
+
+Revision ID: a3d7e1c94b58
+Revises: e5a2c8f06b14
+Create Date: 2023-06-02 11:08:37.615204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d7e1c94b58'
+down_revision = 'e5a2c8f06b14'
+branch_labels = None
+depends_on = None
+
+# The rows which existed before the households belong to this one
+DEFAULT_HOUSEHOLD_ID = 1
+# Tables getting household_id, whether it references the household table and the index it leads
+PARTITIONED_TABLES = [
+    ('user', True, 'ix_user_updated_at', ['updated_at']),
+    ('guest_type', True, 'ix_guest_type_updated_at', ['updated_at']),
+    ('guest', True, 'ix_guest_updated_at', ['updated_at']),
+    ('guest_history', True, 'ix_guest_history_coming_date_coming_time', ['coming_date', 'coming_time']),
+    ('guest_series', True, 'ix_guest_series_start_date_until', ['start_date', 'until']),
+    ('guest_stats', True, None, ['date']),
+    ('tombstone', False, 'ix_tombstone_deleted_at', ['deleted_at']),
+]
+
+
+def table_kwargs(table_name):
+    # The guest table keeps AUTOINCREMENT when SQLite recreates it
+    if table_name == 'guest' and op.get_bind().dialect.name == 'sqlite':
+        return {'sqlite_autoincrement': True}
+    return {}
+
+
+def upgrade():
+    op.create_table('household',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(sa.table('household', sa.column('id', sa.Integer), sa.column('name', sa.String)),
+                   [{'id': DEFAULT_HOUSEHOLD_ID, 'name': 'Default'}])
+
+    for table_name, references, old_index, columns in PARTITIONED_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('household_id', sa.Integer(), nullable=True))
+        op.execute(sa.table(table_name, sa.column('household_id', sa.Integer))
+                   .update().values(household_id=DEFAULT_HOUSEHOLD_ID))
+        with op.batch_alter_table(table_name, schema=None, table_kwargs=table_kwargs(table_name)) as batch_op:
+            batch_op.alter_column('household_id', existing_type=sa.Integer(), nullable=False)
+            if references:
+                batch_op.create_foreign_key('fk_{}_household_id_household'.format(table_name), 'household',
+                                            ['household_id'], ['id'])
+            if old_index is not None:
+                batch_op.drop_index(old_index)
+            batch_op.create_index('ix_{}_household_id_{}'.format(table_name, '_'.join(columns)),
+                                  ['household_id'] + columns, unique=False)
+            if table_name == 'guest':
+                batch_op.drop_index('ix_guest_coming_date_coming_time')
+                batch_op.create_index('ix_guest_household_id_coming_date_coming_time',
+                                      ['household_id', 'coming_date', 'coming_time'], unique=False)
+            if table_name == 'guest_type':
+                batch_op.drop_constraint('uq_name', type_='unique')
+                batch_op.create_unique_constraint('uq_guest_type_household_id_name', ['household_id', 'name'])
+
+    # The booking days only hold the lock versions, they are recreated on demand
+    op.drop_table('booking_day')
+    op.create_table('booking_day',
+    sa.Column('household_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('household_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('booking_day')
+    op.create_table('booking_day',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+    for table_name, references, old_index, columns in reversed(PARTITIONED_TABLES):
+        with op.batch_alter_table(table_name, schema=None, table_kwargs=table_kwargs(table_name)) as batch_op:
+            if table_name == 'guest_type':
+                batch_op.drop_constraint('uq_guest_type_household_id_name', type_='unique')
+                batch_op.create_unique_constraint('uq_name', ['name'])
+            if table_name == 'guest':
+                batch_op.drop_index('ix_guest_household_id_coming_date_coming_time')
+                batch_op.create_index('ix_guest_coming_date_coming_time', ['coming_date', 'coming_time'], unique=False)
+            batch_op.drop_index('ix_{}_household_id_{}'.format(table_name, '_'.join(columns)))
+            if old_index is not None:
+                batch_op.create_index(old_index, columns, unique=False)
+            if references:
+                batch_op.drop_constraint('fk_{}_household_id_household'.format(table_name), type_='foreignkey')
+            batch_op.drop_column('household_id')
+
+    op.drop_table('household')
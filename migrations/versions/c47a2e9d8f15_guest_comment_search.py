@@ -0,0 +1,45 @@
+"""Full-text index of the guest comments
+
+Revision ID: c47a2e9d8f15
+Revises: b6e3f9a05d21
+Create Date: 2023-06-09 18:03:29.740162
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a2e9d8f15'
+down_revision = 'b6e3f9a05d21'
+branch_labels = None
+depends_on = None
+
+# The same statements as app.search.SEARCH_DDL, other databases search with LIKE
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE guest_fts USING fts5(comment, content='guest', content_rowid='id')",
+    "CREATE TRIGGER guest_fts_insert AFTER INSERT ON guest BEGIN "
+    "INSERT INTO guest_fts(rowid, comment) VALUES (new.id, new.comment); END",
+    "CREATE TRIGGER guest_fts_delete AFTER DELETE ON guest BEGIN "
+    "INSERT INTO guest_fts(guest_fts, rowid, comment) VALUES ('delete', old.id, old.comment); END",
+    "CREATE TRIGGER guest_fts_update AFTER UPDATE OF comment ON guest BEGIN "
+    "INSERT INTO guest_fts(guest_fts, rowid, comment) VALUES ('delete', old.id, old.comment); "
+    "INSERT INTO guest_fts(rowid, comment) VALUES (new.id, new.comment); END",
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in SEARCH_DDL:
+        op.execute(statement)
+    # Index the existing comments
+    op.execute("INSERT INTO guest_fts(guest_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for trigger in ('guest_fts_update', 'guest_fts_delete', 'guest_fts_insert'):
+        op.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+    op.execute('DROP TABLE guest_fts')
@@ -0,0 +1,42 @@
+"""Usernames and emails are unique regardless of the case
+
+Revision ID: d2f8a4b71e36
+Revises: c47a2e9d8f15
+Create Date: 2023-06-09 14:05:52.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f8a4b71e36'
+down_revision = 'c47a2e9d8f15'
+branch_labels = None
+depends_on = None
+
+FOLDED_COLUMNS = ['username', 'email']
+
+
+def upgrade():
+    # The users differing only in the case have to be renamed before, the upgrade doesn't pick one
+    user = sa.table('user', *[sa.column(column, sa.String) for column in FOLDED_COLUMNS])
+    for column in FOLDED_COLUMNS:
+        folded = sa.func.lower(user.c[column])
+        duplicates = op.get_bind().scalars(sa.select(folded).group_by(folded).having(sa.func.count() > 1)).all()
+        if duplicates:
+            raise RuntimeError('Users differ only in the case of their {}: {}'.format(column, ', '.join(duplicates)))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        for column in FOLDED_COLUMNS:
+            batch_op.create_index('uq_user_lower_{}'.format(column), [sa.text('lower({})'.format(column))],
+                                  unique=True)
+        batch_op.create_index('ix_user_household_id_lower_username', ['household_id', sa.text('lower(username)')],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_household_id_lower_username')
+        for column in reversed(FOLDED_COLUMNS):
+            batch_op.drop_index('uq_user_lower_{}'.format(column))
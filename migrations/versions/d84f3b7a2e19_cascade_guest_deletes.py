@@ -0,0 +1,51 @@
+"""Guests are deleted with their inviter, guest types in use can't be deleted
+
+Revision ID: d84f3b7a2e19
+Revises: c9f1a6e3d278
+Create Date: 2023-05-29 13:47:21.904315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd84f3b7a2e19'
+down_revision = 'c9f1a6e3d278'
+branch_labels = None
+depends_on = None
+
+# Names of the reflected foreign keys which were created without one (SQLite)
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+FOREIGN_KEYS = [
+    ('guest', 'inviter_id', 'user', 'CASCADE'),
+    ('guest', 'guest_type_id', 'guest_type', 'RESTRICT'),
+    ('guest_series', 'inviter_id', 'user', 'CASCADE'),
+    ('guest_series', 'guest_type_id', 'guest_type', 'RESTRICT'),
+]
+
+
+def foreign_key_name(table, column, referred_table):
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if foreign_key['constrained_columns'] == [column] and foreign_key['name']:
+            return foreign_key['name']
+    return 'fk_{}_{}_{}'.format(table, column, referred_table)
+
+
+def replace_foreign_keys(with_ondelete):
+    for table in ('guest', 'guest_series'):
+        foreign_keys = [foreign_key for foreign_key in FOREIGN_KEYS if foreign_key[0] == table]
+        names = [foreign_key_name(table, column, referred_table) for _, column, referred_table, _ in foreign_keys]
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for (_, column, referred_table, ondelete), name in zip(foreign_keys, names):
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key('fk_{}_{}_{}'.format(table, column, referred_table), referred_table,
+                                            [column], ['id'], ondelete=ondelete if with_ondelete else None)
+
+
+def upgrade():
+    replace_foreign_keys(with_ondelete=True)
+
+
+def downgrade():
+    replace_foreign_keys(with_ondelete=False)
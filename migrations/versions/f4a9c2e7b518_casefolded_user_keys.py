@@ -0,0 +1,70 @@
+"""Usernames and emails are compared by their casefolded keys
+
+Revision ID: f4a9c2e7b518
+Revises: e9b4c1d7a352
+Create Date: 2023-06-15 11:42:07.318420
+
+"""
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c2e7b518'
+down_revision = 'e9b4c1d7a352'
+branch_labels = None
+depends_on = None
+
+FOLDED_COLUMNS = ['username', 'email']
+KEY_LENGTHS = {'username': 150, 'email': 360}
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        for column in FOLDED_COLUMNS:
+            batch_op.add_column(sa.Column('{}_key'.format(column), sa.String(length=KEY_LENGTHS[column]),
+                                          nullable=True))
+
+    # The keys are casefolded by Python, SQLite lower() folds only ASCII letters
+    connection = op.get_bind()
+    user = sa.table('user', sa.column('id', sa.Integer),
+                    *[sa.column(name, sa.String) for column in FOLDED_COLUMNS for name in (column, column + '_key')])
+    rows = connection.execute(sa.select(user.c.id, *[user.c[column] for column in FOLDED_COLUMNS])).all()
+
+    # The users differing only in the case have to be renamed before, the upgrade doesn't pick one
+    for column in FOLDED_COLUMNS:
+        keys = Counter(getattr(row, column).casefold() for row in rows)
+        duplicates = sorted(key for key, count in keys.items() if count > 1)
+        if duplicates:
+            raise RuntimeError('Users differ only in the case of their {}: {}'.format(column, ', '.join(duplicates)))
+
+    for row in rows:
+        connection.execute(sa.update(user).where(user.c.id == row.id).values(
+            {column + '_key': getattr(row, column).casefold() for column in FOLDED_COLUMNS}))
+
+    # The batch mode doesn't reflect the indexes of expressions, they are dropped outside of it
+    op.drop_index('ix_user_household_id_lower_username', table_name='user')
+    for column in FOLDED_COLUMNS:
+        op.drop_index('uq_user_lower_{}'.format(column), table_name='user')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        for column in FOLDED_COLUMNS:
+            batch_op.alter_column('{}_key'.format(column), existing_type=sa.String(length=KEY_LENGTHS[column]),
+                                  nullable=False)
+            batch_op.create_index('uq_user_{}_key'.format(column), ['{}_key'.format(column)], unique=True)
+        batch_op.create_index('ix_user_household_id_username_key', ['household_id', 'username_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_household_id_username_key')
+        for column in reversed(FOLDED_COLUMNS):
+            batch_op.drop_index('uq_user_{}_key'.format(column))
+            batch_op.drop_column('{}_key'.format(column))
+
+    for column in FOLDED_COLUMNS:
+        op.create_index('uq_user_lower_{}'.format(column), 'user', [sa.text('lower({})'.format(column))], unique=True)
+    op.create_index('ix_user_household_id_lower_username', 'user', ['household_id', sa.text('lower(username)')],
+                    unique=False)
@@ -1,15 +1,21 @@
+import threading
 from datetime import datetime, timedelta
 
-from marshmallow import Schema, fields, validate, validates_schema, ValidationError, types
-from sqlalchemy import and_, or_
+from marshmallow import Schema, fields, validate, validates_schema, pre_load, post_load, ValidationError
 
 from app import db
-from app.models import Guest
+from app.booking import lock_stay_days, peak_occupancy, stay_bounds
+from app.households import default_room_id
+from app.models import Guest, GuestSeries, GuestType, Room
+from app.recurrence import series_in_range, expand_series
+from app.statements import ROOM_STAYS, OTHER_ROOM_STAYS
 
 
 class GuestSchema(Schema):
     guest_type_id = fields.Int(required=True)
     inviter_id = fields.Int(required=True)
+    household_id = fields.Int(required=True)
+    room_id = fields.Int(required=True)
     coming_date = fields.Date(required=True)
     coming_time = fields.Time(required=True)
     stay_time = fields.Time(required=True)
@@ -17,13 +23,69 @@ class GuestSchema(Schema):
 
     def __init__(self):
         super().__init__()
-        self.existing_guest_id = None
+        # The schema is shared between request threads
+        self._local = threading.local()
 
-    def validate(self, data, many=None, partial=None, existing_guest_id=None) -> dict[str, list[str]]:
-        self.existing_guest_id = existing_guest_id
+    @property
+    def existing_guest(self):
+        return getattr(self._local, 'existing_guest', None)
 
-        result = super().validate(data, many=many, partial=partial)
-        return result
+    def load(self, data, many=None, partial=None, unknown=None, existing_guest=None) -> dict:
+        """
+        Deserialize and validate guest data in a single pass
+
+        :param data: Raw request data
+        :param existing_guest: (Optional) The guest being updated, used to skip the overlap check
+            when the stay did not move and to exclude the guest itself from it
+        :return: Dict with typed values and the precomputed exit_time
+        :rtype: dict
+        :raises ValidationError: If the data is invalid
+        """
+        self._local.existing_guest = existing_guest
+
+        return super().load(data, many=many, partial=partial, unknown=unknown)
+
+    @pre_load
+    def default_room(self, data, **kwargs):
+        """
+        Fill in the room of the clients which don't send room_id, the room of the updated guest
+        or else the default room of the household
+
+        :param data: Raw request data
+        :param kwargs: Additional parameters
+        """
+        if data.get('room_id') is None:
+            existing_guest = self.existing_guest
+            room_id = existing_guest.room_id if existing_guest is not None \
+                else default_room_id(data.get('household_id'))
+            if room_id is not None:
+                data = dict(data, room_id=room_id)
+        return data
+
+    @validates_schema
+    def validate_guest_type(self, data, **kwargs):
+        """
+        Validation for guest_type_id field, the guest type should belong to the household
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        household_id = db.session.scalar(db.select(GuestType.household_id)
+                                         .where(GuestType.id == data['guest_type_id']))
+        if household_id != data['household_id']:
+            raise ValidationError('Guest type not found', 'guest_type_id')
+
+    @validates_schema
+    def validate_room(self, data, **kwargs):
+        """
+        Validation for room_id field, the room should belong to the household
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        household_id = db.session.scalar(db.select(Room.household_id).where(Room.id == data['room_id']))
+        if household_id != data['household_id']:
+            raise ValidationError('Room not found', 'room_id')
 
     @validates_schema
     def validate_coming_date(self, data, **kwargs):
@@ -47,27 +109,52 @@ class GuestSchema(Schema):
         if data['coming_date'] == datetime.today().date() and data['coming_time'] < datetime.now().time():
             raise ValidationError('Time cannot be in the past')
 
-    @validates_schema()
+    @post_load
     def validate_time_match(self, data, **kwargs):
-        coming_time = datetime.combine(data['coming_date'], data['coming_time'])
-        stay_duration = timedelta(hours=data['stay_time'].hour,
-                                  minutes=data['stay_time'].minute,
-                                  seconds=data['stay_time'].second)
-        exit_time = coming_time + stay_duration
-
-        # Check if the guest is already checked in at this time
-        query = db.select(Guest).where(and_
-                                       (Guest.coming_date == data['coming_date'],
-                                        or_(
-                                            and_(Guest.coming_time <= data['coming_time'],
-                                                 Guest.exit_time >= data['coming_time']),
-                                            and_(Guest.coming_time <= exit_time.time(),
-                                                 Guest.exit_time >= exit_time.time())
-                                            )))
-
-        if self.existing_guest_id:
-            query = query.where(Guest.id != self.existing_guest_id)
-
-        # If there is another guest already checked in at this time, raise an error
-        if db.session.scalar(query):
-            raise ValidationError('Another guest is already checked in at this time')
+        """
+        Compute the exit time once and check that the room has a free place for the whole stay.
+        The booking day stays locked until the caller commits or rolls back the session
+
+        :param data: Deserialized data with fields
+        :param kwargs: Additional parameters
+        :return: Data extended with exit_time
+        :rtype: dict
+        """
+        data['exit_time'] = Guest.compute_exit_time(data['coming_date'], data['coming_time'], data['stay_time'])
+
+        # The stay of the updated guest did not move, so it can't collide with anything new
+        existing_guest = self.existing_guest
+        if existing_guest is not None \
+                and existing_guest.room_id == data['room_id'] \
+                and existing_guest.coming_date == data['coming_date'] \
+                and existing_guest.coming_time == data['coming_time'] \
+                and existing_guest.exit_time == data['exit_time']:
+            return data
+
+        # Serialize the check with the other bookings which may overlap this one
+        lock_stay_days(data['household_id'], data['coming_date'])
+
+        # Load the stays in the room with one indexed range query. The stays of the previous day may
+        # last over midnight and this one may last into the next day, peak_occupancy picks the overlapping ones
+        first_date, last_date = data['coming_date'] - timedelta(days=1), data['coming_date'] + timedelta(days=1)
+        params = {'household_id': data['household_id'], 'room_id': data['room_id'],
+                  'first_date': first_date, 'last_date': last_date}
+        if existing_guest is None:
+            rows = db.session.execute(ROOM_STAYS, params)
+        else:
+            rows = db.session.execute(OTHER_ROOM_STAYS, dict(params, guest_id=existing_guest.id))
+        stays = [stay_bounds(*row) for row in rows]
+
+        # Add the occurrences of the recurring guests in the room on the same days
+        series_query = series_in_range(data['household_id'], first_date, last_date) \
+            .where(GuestSeries.room_id == data['room_id'])
+        stays.extend(stay_bounds(day, series.coming_time, series.exit_time)
+                     for series, day in expand_series(db.session.scalars(series_query), first_date, last_date))
+
+        # The new guest stays for the whole interval, so the room is full when the peak fills it already
+        capacity = db.session.scalar(db.select(Room.capacity).where(Room.id == data['room_id']))
+        if stays and peak_occupancy(stays, *stay_bounds(data['coming_date'], data['coming_time'],
+                                                        data['exit_time'])) >= capacity:
+            raise ValidationError('The room is already full at this time')
+
+        return data
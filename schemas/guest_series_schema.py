@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from marshmallow import Schema, fields, validate, validates_schema, pre_load, post_load, ValidationError
+
+from app import db
+from app.booking import lock_series, peak_occupancy, stay_bounds, time_overlap
+from app.households import default_room_id
+from app.models import Guest, GuestSeries, GuestType, Room
+from app.recurrence import series_in_range, series_collide
+
+
+class GuestSeriesSchema(Schema):
+    guest_type_id = fields.Int(required=True)
+    inviter_id = fields.Int(required=True)
+    household_id = fields.Int(required=True)
+    room_id = fields.Int(required=True)
+    start_date = fields.Date(required=True)
+    coming_time = fields.Time(required=True)
+    stay_time = fields.Time(required=True)
+    frequency = fields.Str(required=True, validate=validate.OneOf(list(GuestSeries.FREQUENCIES)))
+    interval = fields.Int(required=False, load_default=1, validate=validate.Range(min=1, max=52))
+    until = fields.Date(required=False, load_default=None)
+    count = fields.Int(required=False, load_default=None, validate=validate.Range(min=1))
+    comment = fields.Str(required=False, validate=validate.Length(min=0, max=256))
+
+    @pre_load
+    def default_room(self, data, **kwargs):
+        """
+        Fill in the default room of the household for the clients which don't send room_id
+
+        :param data: Raw request data
+        :param kwargs: Additional parameters
+        """
+        if data.get('room_id') is None:
+            room_id = default_room_id(data.get('household_id'))
+            if room_id is not None:
+                data = dict(data, room_id=room_id)
+        return data
+
+    @validates_schema
+    def validate_guest_type(self, data, **kwargs):
+        """
+        Validation for guest_type_id field, the guest type should belong to the household
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        household_id = db.session.scalar(db.select(GuestType.household_id)
+                                         .where(GuestType.id == data['guest_type_id']))
+        if household_id != data['household_id']:
+            raise ValidationError('Guest type not found', 'guest_type_id')
+
+    @validates_schema
+    def validate_room(self, data, **kwargs):
+        """
+        Validation for room_id field, the room should belong to the household
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        household_id = db.session.scalar(db.select(Room.household_id).where(Room.id == data['room_id']))
+        if household_id != data['household_id']:
+            raise ValidationError('Room not found', 'room_id')
+
+    @validates_schema
+    def validate_start_date(self, data, **kwargs):
+        """
+        Validation for start_date field
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        if data['start_date'] < datetime.today().date():
+            raise ValidationError('Date cannot be in the past')
+
+    @validates_schema
+    def validate_end(self, data, **kwargs):
+        """
+        Validation for until and count fields
+
+        :param data: Data with fields
+        :param kwargs: Additional parameters
+        """
+        if data['until'] is not None and data['count'] is not None:
+            raise ValidationError('Series can end either by until date or by count')
+        if data['until'] is not None and data['until'] < data['start_date']:
+            raise ValidationError('Until date cannot be before start date')
+
+    @post_load
+    def validate_time_match(self, data, **kwargs):
+        """
+        Compute the exit time and check that the room has a free place for every occurrence of the series.
+        The recurring guests and the booking days of the series stay locked until the caller
+        commits or rolls back the session
+
+        :param data: Deserialized data with fields
+        :param kwargs: Additional parameters
+        :return: Data extended with exit_time
+        :rtype: dict
+        """
+        data['exit_time'] = Guest.compute_exit_time(data['start_date'], data['coming_time'], data['stay_time'])
+        series = GuestSeries(start_date=data['start_date'], coming_time=data['coming_time'],
+                             exit_time=data['exit_time'], frequency=data['frequency'], interval=data['interval'],
+                             until=data['until'], count=data['count'])
+        last_date = series.last_date
+
+        # Serialize the check with the other series and the bookings of its days. A guest coming
+        # the day after the last occurrence may overlap it, the bookings lock their next day too
+        one_day = timedelta(days=1)
+        lock_series(data['household_id'], data['start_date'], last_date + one_day if last_date else None)
+
+        # Stays over midnight overlap the occurrences of the previous or the next day, so every stay
+        # is compared with the occurrences a day before and after it as well
+        capacity = db.session.scalar(db.select(Room.capacity).where(Room.id == data['room_id']))
+        first_date, end_date = data['start_date'] - one_day, last_date + one_day if last_date else date.max
+        series_query = series_in_range(data['household_id'], first_date, end_date) \
+            .where(GuestSeries.room_id == data['room_id'],
+                   time_overlap(GuestSeries, data['coming_time'], data['exit_time']))
+        others = [(other, days) for other in db.session.scalars(series_query) for days in (-1, 0, 1)
+                  if overlap_later(series, other, days) and series_collide(series, other, days)]
+
+        # Check the dates of the series with guests in the room, only their stays are loaded
+        query = db.select(Guest.coming_date, Guest.coming_time, Guest.exit_time) \
+            .where(Guest.household_id == data['household_id'],
+                   Guest.room_id == data['room_id'],
+                   Guest.coming_date >= first_date,
+                   time_overlap(Guest, data['coming_time'], data['exit_time']))
+        if last_date is not None:
+            query = query.where(Guest.coming_date <= end_date)
+        stays_by_date = defaultdict(list)
+        for coming_date, coming_time, exit_time in db.session.execute(query):
+            for day in (coming_date - one_day, coming_date, coming_date + one_day):
+                if series.occurs_on(day):
+                    stays_by_date[day].append(stay_bounds(coming_date, coming_time, exit_time))
+        for day, stays in stays_by_date.items():
+            stays.extend(stay_bounds(day + timedelta(days=days), other.coming_time, other.exit_time)
+                         for other, days in others if other.occurs_on(day + timedelta(days=days)))
+            if peak_occupancy(stays, *stay_bounds(day, data['coming_time'], data['exit_time'])) >= capacity:
+                raise ValidationError('The room is already full at this time')
+
+        # Check the other series without expanding any of them. Two of them colliding with this one
+        # may do so on different dates, counting them together keeps the check on the safe side
+        if others:
+            day = data['start_date']
+            stays = [stay_bounds(day + timedelta(days=days), other.coming_time, other.exit_time)
+                     for other, days in others]
+            if peak_occupancy(stays, *stay_bounds(day, data['coming_time'], data['exit_time'])) >= capacity:
+                raise ValidationError('The room is already full at this time')
+
+        return data
+
+
+def overlap_later(series, other, days) -> bool:
+    """
+    Check whether an occurrence of the other series days after an occurrence of the series overlaps it
+    :type series: GuestSeries
+    :type other: GuestSeries
+    :type days: int
+    :rtype: bool
+    """
+    day = date.min + timedelta(days=1)
+    start, end = stay_bounds(day, series.coming_time, series.exit_time)
+    return peak_occupancy([stay_bounds(day + timedelta(days=days), other.coming_time, other.exit_time)], start, end) > 0
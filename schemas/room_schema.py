@@ -0,0 +1,6 @@
+from marshmallow import Schema, fields, validate
+
+
+class RoomSchema(Schema):
+    name = fields.Str(required=True, validate=validate.Length(min=1, max=50))
+    capacity = fields.Int(required=True, validate=validate.Range(min=1, max=100))
@@ -0,0 +1,180 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app, db
+from app.models import Household, RefreshToken, User
+from app.refresh_tokens import prune_refresh_tokens
+from app.throttling import DatabaseRateLimiter, MemoryRateLimiter
+from app.token_blocklist import BloomFilter, DatabaseTokenBlocklist, MemoryTokenBlocklist
+
+
+class TestAuthenticationBlueprint(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Create a test user in a household
+        self.household = Household(name='Test household')
+        db.session.add(self.household)
+        db.session.flush()
+        self.test_user = User(username='testAuthUser', email='testauthuser@example.com', household_id=self.household.id)
+        self.test_user.set_password('0000')
+        db.session.add(self.test_user)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self):
+        response = self.client.post('/api/authentication/login', json={'username': 'testAuthUser', 'password': '0000'})
+        self.assertEqual(response.status_code, 200)
+        return response.json['access_token'], response.json['refresh_token']
+
+    def test_logout(self):
+        access_token, refresh_token = self.login()
+        access_headers = {'Authorization': 'Bearer {}'.format(access_token)}
+        refresh_headers = {'Authorization': 'Bearer {}'.format(refresh_token)}
+        self.assertEqual(self.client.get('/api/guests', headers=access_headers).status_code, 200)
+
+        # Test logout revokes the refresh token and the access token from the body
+        response = self.client.post('/api/authentication/logout', headers=refresh_headers,
+                                    json={'access_token': access_token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/authentication/refresh', headers=refresh_headers).status_code, 401)
+        self.assertEqual(self.client.get('/api/guests', headers=access_headers).status_code, 401)
+
+        # Test the tokens of another login still work
+        access_token, _ = self.login()
+        response = self.client.get('/api/guests', headers={'Authorization': 'Bearer {}'.format(access_token)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_rotation(self):
+        _, first_token = self.login()
+        _, other_login_token = self.login()
+
+        # Test refresh replaces the refresh token
+        response = self.client.get('/api/authentication/refresh',
+                                   headers={'Authorization': 'Bearer {}'.format(first_token)})
+        self.assertEqual(response.status_code, 200)
+        second_token = response.json['refresh_token']
+        self.assertNotEqual(second_token, first_token)
+
+        # Test reusing the replaced token revokes its whole family, but not the other login
+        response = self.client.get('/api/authentication/refresh',
+                                   headers={'Authorization': 'Bearer {}'.format(first_token)})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/api/authentication/refresh',
+                                   headers={'Authorization': 'Bearer {}'.format(second_token)})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/api/authentication/refresh',
+                                   headers={'Authorization': 'Bearer {}'.format(other_login_token)})
+        self.assertEqual(response.status_code, 200)
+
+        # Test pruning deletes only the expired tokens
+        db.session.execute(db.update(RefreshToken).where(RefreshToken.used_at.is_not(None))
+                           .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        self.assertEqual(prune_refresh_tokens(batch_size=1), 2)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(RefreshToken)), 2)
+
+    def test_login_in_any_case(self):
+        # Test logging in with the username and with the email in another case
+        for login in ('TESTAUTHUSER', 'TestAuthUser@Example.com'):
+            response = self.client.post('/api/authentication/login', json={'username': login, 'password': '0000'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['user_id'], self.test_user.id)
+
+        # Test a username differing only in the case can't be taken
+        db.session.add(User(username='TestAuthUSER', email='other@example.com', password='0000',
+                            household_id=self.household.id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # Test the case of the letters SQLite lower() doesn't fold
+        user = User(username='Straße', email='ДРУГОЙ@example.com', household_id=self.household.id)
+        user.set_password('0000')
+        db.session.add(user)
+        db.session.commit()
+        for login in ('STRASSE', 'другой@example.com'):
+            response = self.client.post('/api/authentication/login', json={'username': login, 'password': '0000'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['user_id'], user.id)
+        db.session.add(User(username='strasse', email='third@example.com', password='0000',
+                            household_id=self.household.id))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_login_throttling(self):
+        # Test a username is locked after its burst of attempts, even with the right password
+        for _ in range(self.app.config['LOGIN_USERNAME_BURST']):
+            response = self.client.post('/api/authentication/login',
+                                        json={'username': 'TESTAUTHUSER', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/authentication/login', json={'username': 'testAuthUser', 'password': '0000'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+
+        # Test the client IP is locked after its burst of attempts with any username
+        for i in range(self.app.config['LOGIN_IP_BURST'] - self.app.config['LOGIN_USERNAME_BURST'] - 1):
+            response = self.client.post('/api/authentication/login', json={'username': 'user{}'.format(i),
+                                                                            'password': 'wrong'})
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/authentication/login', json={'username': 'other', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+
+        for limiter in (MemoryRateLimiter(burst=2, refill=0.05, max_keys=2), DatabaseRateLimiter(burst=2, refill=0.05)):
+            self.assertEqual(limiter.consume('a'), 0)
+            self.assertEqual(limiter.consume('a'), 0)
+            self.assertGreater(limiter.consume('a'), 0)
+            # Test the bucket refills
+            time.sleep(0.06)
+            self.assertEqual(limiter.consume('a'), 0)
+
+        # Test the least recently used buckets are dropped
+        limiter = MemoryRateLimiter(burst=1, refill=60, max_keys=2)
+        limiter.consume('a')
+        limiter.consume('b')
+        limiter.consume('c')
+        self.assertEqual(limiter.consume('a'), 0)
+        self.assertGreater(limiter.consume('c'), 0)
+
+    def test_token_blocklists(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('token-{}'.format(i))
+        # Test there are no false negatives and few false positives
+        self.assertTrue(all('token-{}'.format(i) in bloom for i in range(1000)))
+        self.assertLess(sum('other-{}'.format(i) in bloom for i in range(1000)), 50)
+
+        now = int(time.time())
+        for blocklist in (MemoryTokenBlocklist(), DatabaseTokenBlocklist(sync_interval=0)):
+            blocklist.revoke('revoked', now + 60)
+            blocklist.revoke('expired', now - 60)
+            self.assertTrue(blocklist.is_revoked('revoked'))
+            self.assertFalse(blocklist.is_revoked('expired'))
+            self.assertFalse(blocklist.is_revoked('valid'))
+
+            # Test pruning forgets only the expired tokens
+            self.assertEqual(blocklist.prune(), 1)
+            self.assertTrue(blocklist.is_revoked('revoked'))
+
+        # Test a token revoked by another process is seen after the sync
+        first, second = DatabaseTokenBlocklist(sync_interval=0), DatabaseTokenBlocklist(sync_interval=0)
+        self.assertFalse(second.is_revoked('shared'))
+        first.revoke('shared', now + 60)
+        self.assertTrue(second.is_revoked('shared'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,722 @@
+import json
+import unittest
+import zlib
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, Room, GuestHistory, GuestSeries, GuestSeriesException, \
+    GuestStats, Tombstone
+from app.booking import peak_occupancy, stay_bounds
+from app.idempotency import IdempotencyStore, MemoryIdempotencyStore, DatabaseIdempotencyStore, StoredResponse
+from app.recurrence import series_collide
+from app.stats import rebuild_stats
+
+
+class TestGuestBlueprint(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Create a test user and a guest type in their household
+        self.household = Household(name='Test household')
+        db.session.add(self.household)
+        db.session.flush()
+        self.test_user = User(username='testGuestUser', email='testguestuser@example.com', password="0000",
+                              household_id=self.household.id)
+        self.test_guest_type = GuestType(name='Friend', household_id=self.household.id)
+        self.test_room = Room(name='Guest room', capacity=1, household_id=self.household.id)
+        db.session.add_all([self.test_user, self.test_guest_type, self.test_room])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        access_token = create_access_token(identity=self.test_user.id,
+                                           additional_claims={'household_id': self.household.id})
+        self.headers = {'Authorization': 'Bearer {}'.format(access_token)}
+        self.tomorrow = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def guest_data(self, coming_time='10:00:00', stay_time='02:00:00', coming_date=None):
+        return {
+            'guest_type_id': self.test_guest_type.id,
+            'room_id': self.test_room.id,
+            'inviter_id': self.test_user.id,
+            'coming_date': coming_date or self.tomorrow,
+            'coming_time': coming_time,
+            'stay_time': stay_time,
+            'comment': 'Test guest'
+        }
+
+    def test_create_guest(self):
+        # Test posting a new guest with correct data
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        guest = db.session.get(Guest, response.json['id'])
+        self.assertEqual(guest.exit_time.strftime('%H:%M:%S'), '12:00:00')
+        self.assertEqual(response.json['stay_time'], '2:00:00')
+
+        # Test posting a guest overlapping the existing one
+        response = self.client.post('/api/guests', json=self.guest_data(coming_time='11:00:00'),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('_schema', response.json)
+
+        # Test posting a guest with the date in the past
+        yesterday = (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests', json=self.guest_data(coming_date=yesterday),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_guest(self):
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        guest_id = response.json['id']
+
+        # Test updating only the comment of the guest keeps its stay
+        data = self.guest_data()
+        data['comment'] = 'Updated comment'
+        response = self.client.put('/api/guests/{}'.format(guest_id), json=data, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['comment'], 'Updated comment')
+
+        # Test moving the guest recomputes the exit time
+        response = self.client.put('/api/guests/{}'.format(guest_id),
+                                   json=self.guest_data(coming_time='15:00:00', stay_time='01:30:00'),
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        guest = db.session.get(Guest, guest_id)
+        self.assertEqual(guest.exit_time.strftime('%H:%M:%S'), '16:30:00')
+
+    def test_get_guests_by_ids(self):
+        guest_ids = []
+        for coming_time in ('08:00:00', '11:00:00', '14:00:00'):
+            response = self.client.post('/api/guests', json=self.guest_data(coming_time=coming_time),
+                                        headers=self.headers)
+            guest_ids.append(response.json['id'])
+
+        # Test the guests come in the requested order over several chunks, missing ones are reported
+        self.app.config['BATCH_FETCH_CHUNK_SIZE'] = 2
+        ids = [guest_ids[2], 999, guest_ids[0], guest_ids[1], guest_ids[0]]
+        response = self.client.get('/api/guests?ids=' + ','.join(map(str, ids)), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([guest['id'] for guest in response.json['guests']], [guest_ids[2], guest_ids[0], guest_ids[1]])
+        self.assertEqual(response.json['missing_ids'], [999])
+
+        # Test the same for users and guest types
+        response = self.client.get('/api/users?ids={}'.format(self.test_user.id), headers=self.headers)
+        self.assertEqual([user['id'] for user in response.json['users']], [self.test_user.id])
+        response = self.client.get('/api/guest_types?ids=5,{}'.format(self.test_guest_type.id), headers=self.headers)
+        self.assertEqual(len(response.json['guest_types']), 1)
+        self.assertEqual(response.json['missing_ids'], [5])
+
+        # Test invalid IDs
+        response = self.client.get('/api/guests?ids=1,a', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_archive_guests(self):
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        for days_ago in (3, 10, 40):
+            db.session.add(Guest(household_id=self.household.id, room_id=self.test_room.id,
+                                 guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id,
+                                 coming_date=date.today() - timedelta(days=days_ago),
+                                 coming_time=time(10), exit_time=time(12)))
+        db.session.commit()
+
+        # Test the command moves only the guests older than the horizon, one chunk at a time
+        result = self.app.test_cli_runner().invoke(args=['guests', 'archive', '--days', '5', '--chunk-size', '1'])
+        self.assertIn('Archived 2 guests', result.output)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Guest)), 2)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(GuestHistory)), 2)
+
+        # Test the listing reaching into the archived days includes the archived guests in order of the stays
+        response = self.client.get('/api/guests?per_page=3', headers=self.headers)
+        self.assertEqual(response.json['total_guests'], 4)
+        self.assertEqual(response.json['next_page'], 2)
+        coming_dates = [guest['coming_date'] for guest in response.json['guests']]
+        self.assertEqual(coming_dates, sorted(coming_dates))
+        archived_id = response.json['guests'][0]['id']
+        response = self.client.get('/api/guests/{}'.format(archived_id), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        # Test the pages of the archive are checked and capped like the other pages
+        for query in ('per_page=0', 'per_page=-1', 'page=0'):
+            response = self.client.get('/api/guests?' + query, headers=self.headers)
+            self.assertEqual(response.status_code, 404, query)
+        self.app.config['GUEST_PAGE_MAX_SIZE'] = 3
+        response = self.client.get('/api/guests?per_page=1000', headers=self.headers)
+        self.assertEqual((len(response.json['guests']), response.json['next_page']), (3, 2))
+
+        # Test the listing of the coming days doesn't
+        response = self.client.get('/api/guests?start_date={}'.format(self.tomorrow), headers=self.headers)
+        self.assertEqual(response.json['total_guests'], 1)
+
+        # Test the aggregates are rebuilt from both tables
+        self.assertEqual(rebuild_stats(), 4)
+
+    def test_delete_inviter_and_guest_type(self):
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/guests/series', json=self.series_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        for i in range(30):
+            db.session.add(Guest(household_id=self.household.id, room_id=self.test_room.id,
+                                 guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id,
+                                 coming_date=date.today() - timedelta(days=i + 1),
+                                 coming_time=time(10), exit_time=time(12)))
+        db.session.commit()
+
+        # Test a guest type with guests can't be deleted
+        response = self.client.delete('/api/guest_types/{}'.format(self.test_guest_type.id), headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+
+        # Test the inviter is deleted with a fixed number of statements, whatever the number of guests
+        statements = []
+
+        def count_statement(connection, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        response = self.client.delete('/api/users/{}'.format(self.test_user.id), headers=self.headers)
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+        self.assertEqual(response.status_code, 204)
+        self.assertLess(len(statements), 20)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Guest)), 0)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(GuestSeries)), 0)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(GuestStats)), 0)
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Tombstone)
+                                           .where(Tombstone.table_name == 'guest')), 31)
+
+        # Test the guest type can be deleted without guests
+        response = self.client.delete('/api/guest_types/{}'.format(self.test_guest_type.id), headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+
+    def test_delete_used_type_and_room_race(self):
+        # A guest booked between the check and the commit of the delete is caught by the foreign keys
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        with mock.patch('app.routes.guest_types.guest_type_in_use', return_value=False), \
+                mock.patch('app.routes.rooms.room_in_use', return_value=False):
+            response = self.client.delete('/api/guest_types/{}'.format(self.test_guest_type.id),
+                                          headers=self.headers)
+            self.assertEqual(response.status_code, 409)
+            response = self.client.delete('/api/rooms/{}'.format(self.test_room.id), headers=self.headers)
+            self.assertEqual(response.status_code, 409)
+        self.assertIsNotNone(db.session.get(GuestType, self.test_guest_type.id))
+        self.assertIsNotNone(db.session.get(Room, self.test_room.id))
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Tombstone)), 0)
+
+    def test_concurrent_bookings(self):
+        # Test that concurrent posts of the same slot never double book it
+        def book(data):
+            client = self.app.test_client()
+            return client.post('/api/guests', json=data, headers=self.headers).status_code
+
+        days = [(date.today() + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(1, 5)]
+        bookings = [self.guest_data(coming_date=day) for day in days] * 8
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(book, bookings))
+
+        # Exactly one booking per day succeeds
+        self.assertEqual(statuses.count(201), len(days))
+        self.assertEqual(statuses.count(400), len(statuses) - len(days))
+        for day in days:
+            coming_date = datetime.strptime(day, '%Y-%m-%d').date()
+            count = db.session.scalar(db.select(db.func.count(Guest.id)).where(Guest.coming_date == coming_date))
+            self.assertEqual(count, 1)
+
+    def test_households(self):
+        # Create a second household with its own user and guest type
+        other_household = Household(name='Other household')
+        db.session.add(other_household)
+        db.session.flush()
+        other_user = User(username='otherGuestUser', email='otherguestuser@example.com', password="0000",
+                          household_id=other_household.id)
+        other_guest_type = GuestType(name='Friend', household_id=other_household.id)
+        other_room = Room(name='Guest room', capacity=1, household_id=other_household.id)
+        db.session.add_all([other_user, other_guest_type, other_room])
+        db.session.commit()
+        access_token = create_access_token(identity=other_user.id,
+                                           additional_claims={'household_id': other_household.id})
+        other_headers = {'Authorization': 'Bearer {}'.format(access_token)}
+
+        # Test the households don't block each other's bookings
+        response = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        guest_id = response.json['id']
+        other_data = dict(self.guest_data(), guest_type_id=other_guest_type.id, room_id=other_room.id)
+        response = self.client.post('/api/guests', json=other_data, headers=other_headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test a household can't use the guest type of another one
+        other_data = dict(self.guest_data(coming_time='14:00:00'), room_id=other_room.id)
+        response = self.client.post('/api/guests', json=other_data, headers=other_headers)
+        self.assertEqual(response.status_code, 400)
+
+        # Test the households don't see each other's guests
+        response = self.client.get('/api/guests', headers=other_headers)
+        self.assertEqual([guest['id'] for guest in response.json['guests']], [guest_id + 1])
+        response = self.client.get('/api/guests/{}'.format(guest_id), headers=other_headers)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/guests?ids={}'.format(guest_id), headers=other_headers)
+        self.assertEqual(response.json['missing_ids'], [guest_id])
+        response = self.client.get('/api/users', headers=other_headers)
+        self.assertEqual([user['id'] for user in response.json['users']], [other_user.id])
+
+    def test_room_capacity(self):
+        # Test a room for two takes two overlapping guests but not a third one at their common time
+        response = self.client.post('/api/rooms', json={'name': 'Living room', 'capacity': 2}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        room_id = response.json['id']
+        for coming_time, status_code in (('10:00:00', 201), ('11:00:00', 201), ('11:30:00', 400), ('12:30:00', 201)):
+            data = dict(self.guest_data(coming_time=coming_time), room_id=room_id)
+            response = self.client.post('/api/guests', json=data, headers=self.headers)
+            self.assertEqual(response.status_code, status_code, coming_time)
+
+        # Test the weekly guests are counted on their dates only
+        for coming_time, status_code in (('15:00:00', 201), ('16:00:00', 201), ('17:00:00', 400)):
+            data = self.series_data(room_id=room_id, coming_time=coming_time)
+            response = self.client.post('/api/guests/series', json=data, headers=self.headers)
+            self.assertEqual(response.status_code, status_code, coming_time)
+        in_a_week = (date.today() + timedelta(days=8)).strftime('%Y-%m-%d')
+        in_two_days = (date.today() + timedelta(days=2)).strftime('%Y-%m-%d')
+        for coming_date, status_code in ((in_a_week, 400), (in_two_days, 201)):
+            data = dict(self.guest_data(coming_time='15:30:00', coming_date=coming_date), room_id=room_id)
+            response = self.client.post('/api/guests', json=data, headers=self.headers)
+            self.assertEqual(response.status_code, status_code, coming_date)
+
+        # Test a room with guests can't be deleted
+        response = self.client.delete('/api/rooms/{}'.format(room_id), headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+
+    def test_default_room(self):
+        guest = self.guest_data()
+        del guest['room_id']
+
+        # Test a guest without a room stays in the only room of the household
+        response = self.client.post('/api/guests', json=guest, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['room_id'], self.test_room.id)
+
+        # Test a household with several rooms needs the room unless it has the Main room
+        attic = Room(name='Attic', capacity=1, household_id=self.household.id)
+        db.session.add(attic)
+        db.session.commit()
+        response = self.client.post('/api/guests', json=dict(guest, coming_time='14:00:00'), headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('room_id', response.json)
+        main_room = Room(name='Main room', capacity=1, household_id=self.household.id)
+        db.session.add(main_room)
+        db.session.commit()
+        response = self.client.post('/api/guests/series', json={key: value for key, value in self.series_data().items()
+                                                                if key != 'room_id'}, headers=self.headers)
+        self.assertEqual((response.status_code, response.json['room_id']), (201, main_room.id))
+
+        # Test an updated guest without a room stays in its room
+        guest_id = self.client.post('/api/guests', json=dict(guest, room_id=attic.id, coming_time='14:00:00'),
+                                    headers=self.headers).json['id']
+        response = self.client.put('/api/guests/{}'.format(guest_id), json=dict(guest, coming_time='15:00:00'),
+                                   headers=self.headers)
+        self.assertEqual((response.status_code, response.json['room_id']), (200, attic.id))
+
+    def test_overnight_capacity(self):
+        # Book a stay over midnight in the room for one
+        day_after = (date.today() + timedelta(days=2)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests', json=self.guest_data(coming_time='23:00:00', stay_time='03:00:00'),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test the guests of the same day and of the next day during the stay, and the ones after it
+        for coming_date, coming_time, stay_time, status_code in (
+                (self.tomorrow, '23:30:00', '00:10:00', 400), (day_after, '00:30:00', '01:00:00', 400),
+                (self.tomorrow, '22:00:00', '00:30:00', 201), (day_after, '02:30:00', '01:00:00', 201)):
+            data = self.guest_data(coming_time=coming_time, stay_time=stay_time, coming_date=coming_date)
+            response = self.client.post('/api/guests', json=data, headers=self.headers)
+            self.assertEqual(response.status_code, status_code, (coming_date, coming_time))
+
+        # Test a guest of the previous day staying over midnight into the booked stay
+        today = date.today().strftime('%Y-%m-%d')
+        data = self.guest_data(coming_time='22:00:00', stay_time='02:00:00', coming_date=today)
+        response = self.client.post('/api/guests', json=data, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test the weekly guests staying over midnight against the guests of their next day
+        in_a_week = (date.today() + timedelta(days=7)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests/series',
+                                    json=self.series_data(start_date=in_a_week, coming_time='22:00:00'),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        in_three_weeks = date.today() + timedelta(days=21)
+        data = self.guest_data(coming_time='00:15:00',
+                               coming_date=(in_three_weeks + timedelta(days=1)).strftime('%Y-%m-%d'))
+        response = self.client.post('/api/guests', json=data, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        in_two_days = (in_three_weeks + timedelta(days=2)).strftime('%Y-%m-%d')
+        data = self.guest_data(coming_time='00:15:00', coming_date=in_two_days)
+        response = self.client.post('/api/guests', json=data, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test series over midnight into the next guest and after midnight of the weekly series
+        in_three_weeks_after = (in_three_weeks + timedelta(days=1)).strftime('%Y-%m-%d')
+        in_a_week_after = (date.today() + timedelta(days=8)).strftime('%Y-%m-%d')
+        for start_date, coming_time, status_code in ((in_three_weeks_after, '23:00:00', 400),
+                                                     (in_a_week_after, '00:30:00', 400),
+                                                     (in_a_week_after, '01:30:00', 201)):
+            response = self.client.post('/api/guests/series',
+                                        json=self.series_data(start_date=start_date, coming_time=coming_time),
+                                        headers=self.headers)
+            self.assertEqual(response.status_code, status_code, (start_date, coming_time))
+
+    def test_peak_occupancy(self):
+        day = date.today()
+        stays = [stay_bounds(day, time(10), time(12)), stay_bounds(day, time(11), time(13)),
+                 stay_bounds(day, time(13), time(14)), stay_bounds(day, time(20), time(1))]
+        self.assertEqual(peak_occupancy(stays, *stay_bounds(day, time(9), time(10, 30))), 1)
+        self.assertEqual(peak_occupancy(stays, *stay_bounds(day, time(9), time(23))), 2)
+        # Stays touching at a moment are counted together
+        self.assertEqual(peak_occupancy(stays[1:3], *stay_bounds(day, time(12), time(15))), 2)
+        self.assertEqual(peak_occupancy(stays, *stay_bounds(day, time(15), time(19))), 0)
+
+    def test_get_free_slots(self):
+        # Book two stays on the searched day
+        for coming_time in ('10:00:00', '15:00:00'):
+            response = self.client.post('/api/guests', json=self.guest_data(coming_time=coming_time),
+                                        headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        # Test the windows around the stays
+        query = 'start_date={0}&end_date={0}&duration=01:00:00'.format(self.tomorrow)
+        response = self.client.get('/api/guests/free_slots?' + query, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_free_slots'], 3)
+        self.assertEqual([(s['start'][11:], s['end'][11:]) for s in response.json['free_slots']],
+                         [('00:00:00', '10:00:00'), ('12:00:00', '15:00:00'), ('17:00:00', '00:00:00')])
+
+        # Test that windows shorter than the duration are skipped and pages are applied
+        query = 'start_date={0}&end_date={0}&duration=04:00:00&per_page=1'.format(self.tomorrow)
+        response = self.client.get('/api/guests/free_slots?' + query, headers=self.headers)
+        self.assertEqual(response.json['total_free_slots'], 2)
+        self.assertEqual(len(response.json['free_slots']), 1)
+        self.assertEqual(response.json['next_page'], 2)
+
+        # Test the request without the duration
+        response = self.client.get('/api/guests/free_slots?start_date=' + self.tomorrow, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_current_guests(self):
+        occupancy = self.app.extensions['occupancy']
+        day = date.today() + timedelta(days=3)
+        guest = Guest(household_id=self.household.id, room_id=self.test_room.id,
+                      guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id, coming_date=day,
+                      coming_time=time(10, 0), exit_time=time(12, 0), comment='Test guest')
+        db.session.add(guest)
+        db.session.commit()
+
+        # Test the guest is checked in and the answer expires at the exit time
+        guests, expires_at = occupancy.get(self.household.id, now=datetime.combine(day, time(11, 0)))
+        self.assertEqual([g['id'] for g in guests], [guest.id])
+        self.assertEqual(expires_at, datetime.combine(day, time(12, 0)))
+
+        # Test the answer is served from the cache until it expires
+        db.session.delete(guest)
+        db.session.commit()
+        guests, _ = occupancy.get(self.household.id, now=datetime.combine(day, time(11, 30)))
+        self.assertEqual(len(guests), 1)
+
+        # Test that an invalidation drops the cached answer
+        occupancy.invalidate(self.household.id)
+        guests, expires_at = occupancy.get(self.household.id, now=datetime.combine(day, time(11, 30)))
+        self.assertEqual(guests, [])
+        self.assertEqual(expires_at, datetime.combine(day + timedelta(days=1), time()))
+
+        # Test the endpoint and the invalidation by guest writes, the job of the write loads the answer again
+        response = self.client.get('/api/guests/now', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        cached = occupancy._entries[self.household.id]
+        self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertIsNot(occupancy._entries[self.household.id], cached)
+
+    def test_guest_stats(self):
+        # Book two guests, move one and delete another
+        first = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers).json
+        self.client.post('/api/guests', json=self.guest_data(coming_time='15:00:00', stay_time='00:30:00'),
+                         headers=self.headers)
+        self.client.put('/api/guests/{}'.format(first['id']),
+                        json=self.guest_data(coming_time='09:00:00', stay_time='01:15:00'), headers=self.headers)
+        third = self.client.post('/api/guests', json=self.guest_data(coming_time='20:00:00'), headers=self.headers).json
+        response = self.client.delete('/api/guests/{}'.format(third['id']), headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+
+        # Test the report of the inviter
+        query = 'start_date={0}&end_date={0}'.format(self.tomorrow)
+        response = self.client.get('/api/guests/stats?' + query, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        expected = [{'inviter_id': self.test_user.id, 'guest_count': 2, 'occupied_minutes': 105}]
+        self.assertEqual(response.json['stats'], expected)
+
+        # Test that the rebuilt aggregates match the incremental ones
+        result = self.app.test_cli_runner().invoke(args=['guests', 'rebuild-stats'])
+        self.assertIn('Rebuilt 1 aggregate rows', result.output)
+        response = self.client.get('/api/guests/stats?' + query, headers=self.headers)
+        self.assertEqual(response.json['stats'], expected)
+
+        # Test the occurrences of a weekly guest are counted on their dates
+        self.client.post('/api/guests/series', json=self.series_data(coming_time='22:00:00', stay_time='04:00:00'),
+                         headers=self.headers)
+        in_a_week = (date.today() + timedelta(days=8)).strftime('%Y-%m-%d')
+        response = self.client.get('/api/guests/stats?group_by=date&start_date={}&end_date={}'.format(
+            self.tomorrow, in_a_week), headers=self.headers)
+        self.assertEqual(response.json['stats'], [
+            {'date': self.tomorrow, 'guest_count': 3, 'occupied_minutes': 345},
+            {'date': in_a_week, 'guest_count': 1, 'occupied_minutes': 240}])
+
+        # Test grouping by a field that is not allowed
+        response = self.client.get('/api/guests/stats?group_by=comment&' + query, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def series_data(self, **kwargs):
+        data = {
+            'guest_type_id': self.test_guest_type.id,
+            'room_id': self.test_room.id,
+            'start_date': self.tomorrow,
+            'coming_time': '18:00:00',
+            'stay_time': '03:00:00',
+            'frequency': 'weekly',
+            'comment': 'Test recurring guest'
+        }
+        data.update(kwargs)
+        return data
+
+    def test_guest_series(self):
+        tomorrow = datetime.strptime(self.tomorrow, '%Y-%m-%d').date()
+        response = self.client.post('/api/guests/series', json=self.series_data(count=4), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        series_id = response.json['id']
+
+        # Test a single guest on an occurrence and between the occurrences
+        in_two_weeks = (tomorrow + timedelta(days=14)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests', json=self.guest_data(coming_date=in_two_weeks,
+                                                                        coming_time='19:00:00'),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        in_ten_days = (tomorrow + timedelta(days=10)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests', json=self.guest_data(coming_date=in_ten_days,
+                                                                        coming_time='19:00:00'),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test series which meet the existing one on some date and which never meet it
+        response = self.client.post('/api/guests/series',
+                                    json=self.series_data(start_date=in_two_weeks, frequency='daily', interval=3),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        in_four_weeks = (tomorrow + timedelta(days=28)).strftime('%Y-%m-%d')
+        response = self.client.post('/api/guests/series',
+                                    json=self.series_data(start_date=in_four_weeks, until=in_four_weeks),
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # Test that a cancelled occurrence is not listed
+        response = self.client.post('/api/guests/series/{}/exceptions'.format(series_id),
+                                    json={'date': (tomorrow + timedelta(days=7)).strftime('%Y-%m-%d')},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        query = 'start_date={}&end_date={}'.format(self.tomorrow, in_two_weeks)
+        response = self.client.get('/api/guests?' + query, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_guests'], 1)
+        self.assertEqual([g['coming_date'] for g in response.json['recurring_guests']], [self.tomorrow, in_two_weeks])
+
+    def test_series_collide(self):
+        # Test the computed collision against the expanded occurrences
+        start = date.today() + timedelta(days=1)
+        first = GuestSeries(start_date=start, frequency='daily', interval=4, count=20)
+        first.exceptions = [GuestSeriesException(date=start + timedelta(days=12))]
+        for offset in range(0, 30):
+            for frequency, interval in (('daily', 6), ('weekly', 1), ('weekly', 2)):
+                second = GuestSeries(start_date=start + timedelta(days=offset), frequency=frequency, interval=interval)
+                end = start + timedelta(days=200)
+                expected = bool(set(first.occurrences(start, end)) & set(second.occurrences(start, end)))
+                self.assertEqual(series_collide(first, second), expected)
+                self.assertEqual(series_collide(second, first), expected)
+                # Test the collision of the occurrences of the second series a day later
+                later = {day - timedelta(days=1) for day in second.occurrences(start, end)}
+                self.assertEqual(series_collide(first, second, 1), bool(set(first.occurrences(start, end)) & later))
+                self.assertEqual(series_collide(second, first, -1), bool(set(first.occurrences(start, end)) & later))
+
+    def test_idempotent_create_guest(self):
+        headers = dict(self.headers, **{'Idempotency-Key': 'create-guest-1'})
+        first = self.client.post('/api/guests', json=self.guest_data(), headers=headers)
+        self.assertEqual(first.status_code, 201)
+
+        # Test that a retry replays the first response instead of failing the overlap check
+        retry = self.client.post('/api/guests', json=self.guest_data(), headers=headers)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json, first.json)
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+        self.assertEqual(db.session.scalar(db.select(db.func.count(Guest.id))), 1)
+
+        # Test the same key with another request
+        response = self.client.post('/api/guests', json=self.guest_data(coming_time='20:00:00'), headers=headers)
+        self.assertEqual(response.status_code, 422)
+
+    def test_idempotency_stores(self):
+        for store in (MemoryIdempotencyStore(ttl=60, max_keys=3), DatabaseIdempotencyStore(ttl=60)):
+            self.assertIsNone(store.reserve('key', 'fingerprint'))
+            self.assertIsNone(store.reserve('key', 'fingerprint').status)
+            store.complete('key', StoredResponse('fingerprint', 201, b'{}', 'application/json'))
+            self.assertEqual(store.reserve('key', 'fingerprint').status, 201)
+            store.release('key')
+            self.assertIsNone(store.reserve('key', 'fingerprint'))
+
+        # Test that the memory store keeps at most max_keys keys
+        store = MemoryIdempotencyStore(ttl=60, max_keys=3)
+        for i in range(10):
+            store.reserve('key{}'.format(i), 'fingerprint')
+        self.assertEqual(list(store._entries), ['key7', 'key8', 'key9'])
+
+        # Test that a store missing a method can't be created
+        class PartialStore(IdempotencyStore):
+            def reserve(self, key, fingerprint):
+                return None
+
+        with self.assertRaises(TypeError):
+            PartialStore()
+
+    def test_guest_events(self):
+        guest_id = self.client.post('/api/guests', json=self.guest_data(), headers=self.headers).json['id']
+        self.client.delete('/api/guests/{}'.format(guest_id), headers=self.headers)
+
+        # Test resuming the stream after the first event
+        headers = dict(self.headers, **{'Last-Event-ID': '1'})
+        response = self.client.get('/api/guests/events', headers=headers, buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), 'id: 2\nevent: guest_deleted\ndata: {{"id": {}}}\n\n'.format(guest_id).encode())
+        response.close()
+
+        # Test resuming from the event which is no longer buffered
+        broker = self.app.extensions['events']
+        broker._buffer.clear()
+        self.assertIsNone(broker.events_since(1))
+
+        # Test that a live event reaches the subscribers
+        subscription = broker.subscribe()
+        self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        self.assertEqual(subscription.get_nowait().type, 'guest_created')
+        broker.unsubscribe(subscription)
+
+    def test_compressed_guest_list(self):
+        for hour in range(0, 24, 3):
+            self.client.post('/api/guests', json=self.guest_data(coming_time='{:02d}:00:00'.format(hour),
+                                                                 stay_time='01:00:00'),
+                             headers=self.headers)
+
+        # Test that a large listing is compressed with the accepted encoding
+        headers = dict(self.headers, **{'Accept-Encoding': 'gzip;q=0.5, deflate;q=1.0'})
+        response = self.client.get('/api/guests?per_page=50', headers=headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(len(json.loads(zlib.decompress(response.data))['guests']), 8)
+
+        # Test that a small response is sent as it is
+        response = self.client.get('/api/guests?per_page=1', headers=headers)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+        # Test that a streamed response is compressed chunk by chunk
+        headers = dict(self.headers, **{'Accept-Encoding': 'gzip', 'Last-Event-ID': '0'})
+        response = self.client.get('/api/guests/events', headers=headers, buffered=False)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self.assertTrue(decompressor.decompress(next(iter(response.response))).startswith(b'id: 1\n'))
+        response.close()
+
+    def test_search_guests(self):
+        comments = ['Birthday party', 'Board games', 'Birthday party birthday cake', 'Movie night', 'Birthday present for a flatmate']
+        ids = []
+        for hour, comment in enumerate(comments):
+            data = dict(self.guest_data(coming_time='{:02d}:00:00'.format(hour * 2), stay_time='01:00:00'),
+                        comment=comment)
+            ids.append(self.client.post('/api/guests', json=data, headers=self.headers).json['id'])
+
+        # Test that the best matches come first and the words are matched by prefix
+        response = self.client.get('/api/guests/search?q=birth', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['guests'][0]['id'], ids[2])
+        self.assertEqual({guest['id'] for guest in response.json['guests']}, {ids[0], ids[2], ids[4]})
+        self.assertIsNone(response.json['next_cursor'])
+        response = self.client.get('/api/guests/search?q=PARTY+birthday', headers=self.headers)
+        self.assertEqual({guest['id'] for guest in response.json['guests']}, {ids[0], ids[2]})
+
+        # Test that the pages follow the cursor without repeating a guest
+        found = []
+        url = '/api/guests/search?q=birthday&limit=1'
+        while url:
+            response = self.client.get(url, headers=self.headers)
+            found += [guest['id'] for guest in response.json['guests']]
+            cursor = response.json['next_cursor']
+            url = cursor and '/api/guests/search?q=birthday&limit=1&cursor=' + cursor
+        self.assertEqual(sorted(found), [ids[0], ids[2], ids[4]])
+
+        # Test that the index follows the updates and the deletes of the guests
+        data = dict(self.guest_data(coming_time='02:00:00', stay_time='01:00:00'), comment='Birthday games')
+        self.client.put('/api/guests/{}'.format(ids[1]), json=data, headers=self.headers)
+        self.client.delete('/api/guests/{}'.format(ids[0]), headers=self.headers)
+        response = self.client.get('/api/guests/search?q=birthday', headers=self.headers)
+        self.assertEqual({guest['id'] for guest in response.json['guests']}, {ids[1], ids[2], ids[4]})
+
+        # Test that the guests of the other households and of the other days are left out
+        other_household = Household(name='Other household')
+        db.session.add(other_household)
+        db.session.flush()
+        other_room = Room(name='Guest room', capacity=1, household_id=other_household.id)
+        db.session.add(other_room)
+        db.session.flush()
+        db.session.add(Guest(household_id=other_household.id, room_id=other_room.id,
+                             guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id,
+                             coming_date=date.today(), coming_time=time(10), exit_time=time(11), comment='Birthday'))
+        db.session.commit()
+        response = self.client.get('/api/guests/search?q=birthday&end_date=' + date.today().strftime('%Y-%m-%d'),
+                                   headers=self.headers)
+        self.assertEqual(response.json['guests'], [])
+
+        # Test searching without words and with a malformed cursor
+        response = self.client.get('/api/guests/search?q=+%2A', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/guests/search?q=birthday&cursor=abc', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_statement_cache(self):
+        self.client.post('/api/guests', json=self.guest_data(), headers=self.headers)
+        statement_cache = self.app.extensions['statement_cache']
+
+        # Test the listing and the overlap check only miss the cache the first time
+        for hour in (13, 17):
+            self.client.get('/api/guests?inviter_id={}'.format(self.test_user.id), headers=self.headers)
+            self.client.post('/api/guests', json=self.guest_data(coming_time='{}:00:00'.format(hour)),
+                             headers=self.headers)
+            if hour == 13:
+                misses = statement_cache.snapshot()['misses']
+        self.assertEqual(statement_cache.snapshot()['misses'], misses)
+
+        # Test the pages and the filters of the cached listing
+        response = self.client.get('/api/guests?per_page=2&page=2', headers=self.headers)
+        self.assertEqual(len(response.json['guests']), 1)
+        self.assertEqual((response.json['total_guests'], response.json['prev_page'], response.json['next_page']),
+                         (3, 1, None))
+        response = self.client.get('/api/guests?per_page=2&guest_type_id={}'.format(self.test_guest_type.id),
+                                   headers=self.headers)
+        self.assertEqual((response.json['total_guests'], response.json['next_page']), (3, 2))
+        response = self.client.get('/api/guests?page=3&per_page=2', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertGreater(statement_cache.snapshot()['hit_rate'], 0)
@@ -0,0 +1,127 @@
+import threading
+import time
+import unittest
+
+from app import create_app, db
+from app.jobs import JobQueue, MemoryJobBackend, DatabaseJobBackend, JobQueueFull
+from app.models import Household
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.runs = []
+        self.release = threading.Event()
+        self.release.set()
+
+        def record(number, failures=0):
+            self.release.wait(5)
+            self.runs.append(number)
+            if self.runs.count(number) <= failures:
+                raise RuntimeError('Job {} failed'.format(number))
+
+        self.handlers = {'record': record}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_memory_job_queue(self):
+        jobs = JobQueue(self.app, MemoryJobBackend(max_jobs=3), workers=2, max_attempts=3, retry_delay=0.01,
+                        handlers=self.handlers)
+
+        # Test that a full queue drops the new jobs while the workers are busy
+        self.release.clear()
+        self.assertIsNotNone(jobs.enqueue('record', number=1))
+        self.assertIsNotNone(jobs.enqueue('record', number=2, failures=1))
+        self.assertIsNotNone(jobs.enqueue('record', number=3, failures=5))
+        self.assertIsNone(jobs.enqueue('record', number=4))
+        with self.assertRaises(KeyError):
+            jobs.enqueue('unknown')
+
+        # Test that the failed jobs are retried up to max_attempts runs and the stop waits for them
+        self.release.set()
+        wait_until(lambda: not jobs.backend.pending())
+        jobs.stop()
+        self.assertEqual(sorted(self.runs), [1, 2, 2, 3, 3, 3])
+        self.assertEqual(jobs.backend.pending(), 0)
+
+    def test_inline_jobs(self):
+        jobs = JobQueue(self.app, MemoryJobBackend(), workers=0, handlers=self.handlers)
+        self.assertIsNone(jobs.enqueue('record', number=1))
+        self.assertIsNone(jobs.enqueue('record', number=2, failures=1))
+        self.assertEqual(self.runs, [1, 2])
+        self.assertEqual(jobs.backend.pending(), 0)
+
+    def test_database_job_backend(self):
+        backend = DatabaseJobBackend(max_jobs=2, lease=60, poll_interval=0.01)
+        first = backend.put('record', {'number': 1})
+        # Test that a put leaves the transaction of the caller's session to the caller
+        db.session.add(Household(name='Uncommitted household'))
+        backend.put('record', {'number': 2})
+        db.session.rollback()
+        self.assertEqual(db.session.scalar(db.select(db.func.count()).select_from(Household)), 0)
+        with self.assertRaises(JobQueueFull):
+            backend.put('record', {'number': 3})
+
+        # Test that the jobs are taken in order and not again during their lease
+        self.assertEqual(backend.take(0), first)
+        second = backend.take(0)
+        self.assertEqual(second.kwargs, {'number': 2})
+        self.assertIsNone(backend.take(0.05))
+
+        # Test that a retried job outlives its backend and is taken again after the lease of a dead worker
+        backend.retry(first, 0)
+        backend = DatabaseJobBackend(max_jobs=2, lease=0, poll_interval=0.01)
+        retried = backend.take(0)
+        self.assertEqual((retried.id, retried.attempts), (first.id, 1))
+        self.assertEqual(backend.take(0), retried)
+        backend.complete(retried)
+        backend.complete(second)
+        self.assertEqual(backend.pending(), 0)
+
+        # Test the queue running the stored jobs
+        jobs = JobQueue(self.app, DatabaseJobBackend(lease=60, poll_interval=0.01), workers=1, retry_delay=0.01,
+                        handlers=self.handlers)
+        jobs.enqueue('record', number=3, failures=1)
+        wait_until(lambda: not jobs.backend.pending())
+        jobs.stop()
+        self.assertEqual(self.runs, [3, 3])
+
+    def test_local_jobs(self):
+        def warm():
+            self.runs.append('warm')
+
+        # Test a job working on the memory of the process isn't given to the workers of a shared backend
+        warm.local = True
+        handlers = dict(self.handlers, warm=warm)
+        shared = JobQueue(self.app, DatabaseJobBackend(poll_interval=0.01), workers=1, handlers=handlers)
+        self.assertFalse(shared.accepts('warm'))
+        self.assertTrue(shared.accepts('record'))
+        with self.assertRaises(ValueError):
+            shared.enqueue('warm')
+        self.assertEqual(shared.backend.pending(), 0)
+
+        # Test it runs inline or on the workers of the process
+        for backend, workers in ((DatabaseJobBackend(), 0), (MemoryJobBackend(), 1)):
+            jobs = JobQueue(self.app, backend, workers=workers, handlers=handlers)
+            self.assertTrue(jobs.accepts('warm'))
+            jobs.enqueue('warm')
+            wait_until(lambda: not jobs.backend.pending())
+            jobs.stop()
+        self.assertEqual(self.runs, ['warm', 'warm'])
+
+
+if __name__ == '__main__':
+    unittest.main()
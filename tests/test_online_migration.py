@@ -0,0 +1,127 @@
+import unittest
+from datetime import date, time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, Room
+from app.online_migration import rebuild_table_online
+
+
+class Stopped(Exception):
+    pass
+
+
+class TestOnlineMigration(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        household = Household(name='Test household')
+        db.session.add(household)
+        db.session.flush()
+        user = User(username='testMigrationUser', email='testmigrationuser@example.com', password='0000',
+                    household_id=household.id)
+        guest_type = GuestType(name='Friend', household_id=household.id)
+        room = Room(name='Guest room', capacity=1, household_id=household.id)
+        db.session.add_all([user, guest_type, room])
+        db.session.flush()
+        self.guest = {'household_id': household.id, 'room_id': room.id, 'guest_type_id': guest_type.id,
+                      'inviter_id': user.id, 'coming_date': date(2023, 6, 1), 'coming_time': time(10),
+                      'exit_time': time(11), 'updated_at': date(2023, 6, 1)}
+        db.session.execute(db.insert(Guest), [dict(self.guest, comment='Guest {}'.format(i)) for i in range(50)])
+        db.session.commit()
+
+        # The new shape of the guest table has a column computed from the old ones
+        self.table = Guest.__table__.to_metadata(sa.MetaData())
+        self.table.append_column(sa.Column('comment_length', sa.Integer(), nullable=False, server_default='0'))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rebuild_table_online(self):
+        def write_between_chunks(table_name, last_id, max_id):
+            # The writes of the backfill reach the new table through the triggers
+            if last_id == 10:
+                connection.execute(sa.insert(Guest.__table__), dict(self.guest, comment='New guest'))
+                connection.execute(sa.update(Guest.__table__).where(Guest.id.in_([5, 30]))
+                                   .values(comment='Updated'))
+                connection.execute(sa.delete(Guest.__table__).where(Guest.id.in_([6, 40])))
+            # An interrupted rebuild continues from its last chunk
+            if last_id == 20 and not interrupted:
+                interrupted.append(last_id)
+                raise KeyboardInterrupt
+
+        interrupted = []
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            with self.assertRaises(KeyboardInterrupt):
+                rebuild_table_online(connection, self.table, {'comment_length': 'length(comment)'}, chunk_size=10, pause=0,
+                                     progress=write_between_chunks)
+            copied = rebuild_table_online(connection, self.table, {'comment_length': 'length(comment)'},
+                                          chunk_size=10, pause=0, progress=write_between_chunks)
+            self.assertEqual(copied, 28)
+
+            rows = connection.execute(sa.text('SELECT id, comment, comment_length FROM guest ORDER BY id')).all()
+            self.assertEqual(len(rows), 49)
+            self.assertNotIn(6, [row.id for row in rows])
+            self.assertIn((30, 'Updated', 7), rows)
+            self.assertEqual(rows[-1], (51, 'New guest', 9))
+
+            # The indexes, the search triggers and the sequence are kept
+            indexes = {index['name'] for index in sa.inspect(connection).get_indexes('guest')}
+            self.assertEqual(indexes, {index.name for index in Guest.__table__.indexes})
+            self.assertEqual(connection.execute(sa.text("SELECT rowid FROM guest_fts WHERE guest_fts MATCH 'updated' "
+                                                        "ORDER BY rowid")).scalars().all(), [5, 30])
+            connection.execute(sa.delete(Guest.__table__).where(Guest.id == 51))
+            connection.execute(sa.insert(Guest.__table__), dict(self.guest, comment='Last guest'))
+            self.assertEqual(connection.execute(sa.text('SELECT max(id) FROM guest')).scalar(), 52)
+            self.assertFalse(sa.inspect(connection).has_table('online_rebuild'))
+
+    def test_unique_indexes_during_rebuild(self):
+        def stop_after_swap(connection, cursor, statement, *args):
+            # The rebuild stops after the commit of the swap, before the indexes take their names
+            if statement.startswith('ALTER TABLE'):
+                swapped.append(statement)
+            elif statement == 'COMMIT' and swapped:
+                raise Stopped
+
+        swapped = []
+        user = {'household_id': 1, 'username': 'secondUser', 'username_key': 'seconduser',
+                'email': 'TESTMIGRATIONUSER@example.com', 'email_key': 'testmigrationuser@example.com',
+                'password': '0000', 'updated_at': date(2023, 6, 1)}
+        table = User.__table__.to_metadata(sa.MetaData())
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            event.listen(connection, 'after_cursor_execute', stop_after_swap)
+            with self.assertRaises(Stopped):
+                rebuild_table_online(connection, table, pause=0)
+            event.remove(connection, 'after_cursor_execute', stop_after_swap)
+
+            # Test the new table refuses an email key taken through the temporary index
+            with self.assertRaises(sa.exc.IntegrityError):
+                connection.execute(sa.insert(User.__table__), user)
+
+            # Test the indexes get their names and keep refusing it
+            rebuild_table_online(connection, table, pause=0)
+            indexes = set(connection.execute(sa.text("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                                     "AND tbl_name = 'user'")).scalars())
+            self.assertTrue({'uq_user_username_key', 'uq_user_email_key'} <= indexes)
+            self.assertFalse([name for name in indexes if name.startswith('_new_')])
+            with self.assertRaises(sa.exc.IntegrityError):
+                connection.execute(sa.insert(User.__table__), user)
+            self.assertEqual(connection.execute(sa.text('SELECT count(*) FROM user')).scalar(), 1)
+
+    def test_rebuild_referenced_table(self):
+        # Test the guests keep their room and their reference to the room table, with the foreign keys on
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            rebuild_table_online(connection, Room.__table__.to_metadata(sa.MetaData()), pause=0)
+            self.assertEqual(connection.exec_driver_sql('PRAGMA foreign_keys').scalar(), 1)
+            referred = {key['referred_table'] for key in sa.inspect(connection).get_foreign_keys('guest')}
+            self.assertIn('room', referred)
+            joined = sa.text('SELECT count(*) FROM guest JOIN room ON room.id = guest.room_id')
+            self.assertEqual(connection.execute(joined).scalar(), 50)
+            self.assertEqual(connection.exec_driver_sql('PRAGMA foreign_key_check').all(), [])
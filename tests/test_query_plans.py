@@ -0,0 +1,191 @@
+import re
+import unittest
+from datetime import date, time, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, GuestHistory, GuestSeries, Room
+from app.stats import rebuild_stats
+
+# Plan rows of a full scan of the guest tables or the user table, with or without an index. The
+# FTS5 index of the comments is a virtual table, it is searched by MATCH and shows as a scan
+FULL_SCAN = re.compile(r'^SCAN (guest\w*|user)\b(?! VIRTUAL TABLE)')
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every statement issued by every route and fails on full scans
+    of the guest tables and the user table, so a query which lost its index is caught before deploy
+    """
+
+    def setUp(self):
+        self.app = create_app('testing')
+        # The event stream starts with a keepalive instead of waiting for an event
+        self.app.config['EVENT_KEEPALIVE'] = 0.01
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Seed two households, so the household filters have something to skip
+        for name in ('Test household', 'Other household'):
+            household = Household(name=name)
+            db.session.add(household)
+            db.session.flush()
+            self.household = household
+            users = [User(username='{}{}'.format(name[:5], i), email='{}{}@example.com'.format(name[:5], i),
+                          password='0000', household_id=household.id) for i in range(20)]
+            guest_types = [GuestType(name='Type {}'.format(i), household_id=household.id) for i in range(3)]
+            self.room = Room(name='Guest room', capacity=2, household_id=household.id)
+            db.session.add_all(users + guest_types + [self.room])
+            db.session.flush()
+            for i in range(200):
+                model = GuestHistory if i % 4 == 0 else Guest
+                db.session.add(model(id=household.id * 1000 + i if model is GuestHistory else None,
+                                     household_id=household.id, room_id=self.room.id,
+                                     guest_type_id=guest_types[i % 3].id, inviter_id=users[i % 20].id,
+                                     coming_date=date.today() + timedelta(days=i % 60 - 30),
+                                     coming_time=time(i % 24), exit_time=time(i % 24, 30),
+                                     comment='Test guest {}'.format(i)))
+        self.user, self.other_user = users[0], users[1]
+        self.guest_type = guest_types[0]
+        self.user.set_password('0000')
+        db.session.add(GuestSeries(household_id=self.household.id, room_id=self.room.id,
+                                   guest_type_id=self.guest_type.id, inviter_id=self.user.id,
+                                   start_date=date.today(), coming_time=time(22), exit_time=time(23),
+                                   frequency='weekly', interval=1))
+        db.session.commit()
+        rebuild_stats()
+
+        self.client = self.app.test_client()
+        access_token = create_access_token(identity=self.user.id, additional_claims={'household_id': self.household.id})
+        self.headers = {'Authorization': 'Bearer {}'.format(access_token)}
+        self.tomorrow = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def route_requests(self):
+        """
+        Yield the endpoint and the response of one request to every route, the destructive ones last
+        """
+        guest = {'guest_type_id': self.guest_type.id, 'room_id': self.room.id, 'inviter_id': self.user.id,
+                 'coming_date': self.tomorrow,
+                 'coming_time': '23:40:00', 'stay_time': '00:10:00'}
+        series = {'guest_type_id': self.guest_type.id, 'room_id': self.room.id, 'start_date': self.tomorrow,
+                  'coming_time': '05:40:00', 'stay_time': '00:10:00', 'frequency': 'daily', 'count': 3}
+        user = {'username': 'planUser', 'email': 'planuser@example.com', 'password': 'Password1!'}
+        month = 'start_date={}&end_date={}'.format(date.today() - timedelta(days=40), date.today() + timedelta(days=40))
+
+        response = self.client.post('/api/authentication/login', json={'username': self.user.username.upper(),
+                                                                       'password': '0000'})
+        yield 'authentication.login', response
+        refresh_headers = {'Authorization': 'Bearer {}'.format(response.json['refresh_token'])}
+        response = self.client.get('/api/authentication/refresh', headers=refresh_headers)
+        yield 'authentication.refresh', response
+        refresh_headers = {'Authorization': 'Bearer {}'.format(response.json['refresh_token'])}
+
+        yield 'users.get_users', self.client.get('/api/users', headers=self.headers)
+        yield 'users.get_users', self.client.get('/api/users?ids=1,2,3', headers=self.headers)
+        yield 'users.search_users', self.client.get('/api/users/search?prefix=Test', headers=self.headers)
+        yield 'users.get_user', self.client.get('/api/users/{}'.format(self.user.id), headers=self.headers)
+        yield 'users.create_user', self.client.post('/api/users', json=user, headers=self.headers)
+        yield 'users.update_user', self.client.put('/api/users/{}'.format(self.user.id), headers=self.headers,
+                                                   json=dict(user, username='planUser2', email='plan2@example.com'))
+        yield 'users.patch_user', self.client.patch('/api/users/{}'.format(self.user.id), headers=self.headers,
+                                                    json={'username': self.user.username, 'password': 'Password2!'})
+
+        yield 'guest_types.get_guest_types', self.client.get('/api/guest_types', headers=self.headers)
+        response = self.client.post('/api/guest_types', json={'name': 'Neighbour'}, headers=self.headers)
+        yield 'guest_types.create_guest_type', response
+        guest_type_url = '/api/guest_types/{}'.format(response.json['id'])
+        yield 'guest_types.get_guest_type', self.client.get(guest_type_url, headers=self.headers)
+        yield 'guest_types.update_guest_type', self.client.put(guest_type_url, json={'name': 'Neighbours'},
+                                                               headers=self.headers)
+
+        yield 'rooms.get_rooms', self.client.get('/api/rooms', headers=self.headers)
+        response = self.client.post('/api/rooms', json={'name': 'Attic', 'capacity': 1}, headers=self.headers)
+        yield 'rooms.create_room', response
+        room_url = '/api/rooms/{}'.format(response.json['id'])
+        yield 'rooms.get_room', self.client.get(room_url, headers=self.headers)
+        yield 'rooms.update_room', self.client.put(room_url, json={'name': 'Attic', 'capacity': 2},
+                                                   headers=self.headers)
+
+        response = self.client.post('/api/guests', json=guest, headers=self.headers)
+        yield 'guests.create_guest', response
+        guest_url = '/api/guests/{}'.format(response.json['id'])
+        yield 'guests.get_guests', self.client.get('/api/guests', headers=self.headers)
+        yield 'guests.get_guests', self.client.get('/api/guests?{}&inviter_id={}&guest_type_id={}'.format(
+            month, self.user.id, self.guest_type.id), headers=self.headers)
+        yield 'guests.get_guests', self.client.get('/api/guests?start_date=' + self.tomorrow, headers=self.headers)
+        yield 'guests.get_guests', self.client.get('/api/guests?ids=1,2,3', headers=self.headers)
+        yield 'guests.get_guest', self.client.get(guest_url, headers=self.headers)
+        response = self.client.get('/api/guests/search?q=test&limit=1', headers=self.headers)
+        yield 'guests.search_guest_comments', response
+        yield 'guests.search_guest_comments', self.client.get(
+            '/api/guests/search?q=test&limit=1&cursor={}&{}'.format(response.json['next_cursor'], month),
+            headers=self.headers)
+        yield 'guests.update_guest', self.client.put(guest_url, json=dict(guest, coming_time='23:30:00'),
+                                                     headers=self.headers)
+        yield 'guests.get_free_slots', self.client.get('/api/guests/free_slots?{}&duration=00:30:00'.format(month),
+                                                       headers=self.headers)
+        yield 'guests.get_current_guests', self.client.get('/api/guests/now', headers=self.headers)
+        yield 'guests.get_guest_stats', self.client.get('/api/guests/stats?{}&group_by=date,guest_type_id'.format(
+            month), headers=self.headers)
+        response = self.client.get('/api/guests/events', headers=self.headers, buffered=False)
+        response.close()
+        yield 'guests.get_guest_events', response
+
+        response = self.client.post('/api/guests/series', json=series, headers=self.headers)
+        yield 'guests.create_guest_series', response
+        series_url = '/api/guests/series/{}'.format(response.json['id'])
+        yield 'guests.get_guest_series', self.client.get(series_url, headers=self.headers)
+        yield 'guests.create_guest_series_exception', self.client.post(series_url + '/exceptions',
+                                                                       json={'date': self.tomorrow},
+                                                                       headers=self.headers)
+
+        yield 'sync.sync', self.client.get('/api/sync', headers=self.headers)
+        response = self.client.get('/api/sync', headers=self.headers)
+        yield 'sync.sync', self.client.get('/api/sync?since=' + response.json['next_token'], headers=self.headers)
+
+        yield 'guests.delete_guest_series', self.client.delete(series_url, headers=self.headers)
+        yield 'guests.delete_guest', self.client.delete(guest_url, headers=self.headers)
+        yield 'guest_types.delete_guest_type', self.client.delete(guest_type_url, headers=self.headers)
+        yield 'rooms.delete_room', self.client.delete(room_url, headers=self.headers)
+        yield 'authentication.logout', self.client.post('/api/authentication/logout', headers=refresh_headers)
+        yield 'users.delete_user', self.client.delete('/api/users/{}'.format(self.user.id), headers=self.headers)
+
+    def test_query_plans(self):
+        statements = []
+
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+        covered = set()
+        full_scans = []
+        event.listen(db.engine, 'before_cursor_execute', record_statement)
+        try:
+            for endpoint, response in self.route_requests():
+                self.assertLess(response.status_code, 400, endpoint)
+                covered.add(endpoint)
+
+                # Explain the statements of the request, the plans themselves are recorded too and skipped
+                recorded = list(statements)
+                for statement, parameters in recorded:
+                    if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+                        continue
+                    plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+                    full_scans.extend((endpoint, detail, statement)
+                                      for *_, detail in plan if FULL_SCAN.match(detail))
+                statements.clear()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+        self.assertEqual(full_scans, [])
+
+        # Every route of the app has to be covered, so a new route gets its plans checked as well
+        endpoints = {rule.endpoint for rule in self.app.url_map.iter_rules() if rule.endpoint != 'static'}
+        self.assertEqual(endpoints - covered, set())
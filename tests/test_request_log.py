@@ -0,0 +1,137 @@
+import json
+import os
+import queue
+import tempfile
+import unittest
+from datetime import date, time, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Guest, GuestStats, Room
+from app.request_log import BoundedQueueHandler
+
+
+class TestRequestLog(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.household = Household(name='Test household')
+        db.session.add(self.household)
+        db.session.flush()
+        self.test_user = User(username='testLogUser', email='testloguser@example.com', password='0000',
+                              household_id=self.household.id)
+        self.test_guest_type = GuestType(name='Friend', household_id=self.household.id)
+        self.test_room = Room(name='Guest room', capacity=1, household_id=self.household.id)
+        db.session.add_all([self.test_user, self.test_guest_type, self.test_room])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        access_token = create_access_token(identity=self.test_user.id,
+                                           additional_claims={'household_id': self.household.id})
+        self.headers = {'Authorization': 'Bearer {}'.format(access_token)}
+
+        log_file, self.log_path = tempfile.mkstemp(suffix='.log')
+        os.close(log_file)
+        self.app.config.update(REQUEST_LOG_ENABLED=True, REQUEST_LOG_FILE=self.log_path, REQUEST_LOG_FLUSH_INTERVAL=0)
+
+    def tearDown(self):
+        self.app.extensions['request_log'].stop()
+        os.remove(self.log_path)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def read_log(self) -> list[dict]:
+        self.app.extensions['request_log'].stop()
+        with open(self.log_path, encoding='utf-8') as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_access_and_audit_log(self):
+        guest = {
+            'guest_type_id': self.test_guest_type.id,
+            'inviter_id': self.test_user.id,
+            'room_id': self.test_room.id,
+            'coming_date': (date.today() + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'coming_time': '10:00:00',
+            'stay_time': '02:00:00',
+            'comment': 'Logged guest'
+        }
+        # The app context of the test is shared by the requests, the one without a JWT goes first
+        self.client.get('/api/guests')
+        guest_id = self.client.post('/api/guests', json=guest, headers=self.headers).json['id']
+        self.client.put('/api/guests/{}'.format(guest_id), json=dict(guest, comment='Changed'), headers=self.headers)
+        # The rejected booking writes nothing
+        self.client.post('/api/guests', json=guest, headers=self.headers)
+        self.client.get('/api/guests', headers=self.headers)
+        records = self.read_log()
+
+        # Test an access record for every request
+        access = [record for record in records if record['log'] == 'access']
+        self.assertEqual([(record['endpoint'], record['status']) for record in access],
+                         [('guests.get_guests', 401), ('guests.create_guest', 201), ('guests.update_guest', 200),
+                          ('guests.create_guest', 400), ('guests.get_guests', 200)])
+        self.assertEqual([record['user_id'] for record in access], [None] + [self.test_user.id] * 4)
+        self.assertTrue(all(record['queries'] > 0 for record in access[1:]))
+        self.assertTrue(all(record['latency_ms'] > 0 for record in access))
+
+        # Test the audit records of the committed writes
+        audit = [record for record in records if record['log'] == 'audit']
+        self.assertEqual([(record['action'], record['table'], record['row_id'], record['user_id']) for record in audit],
+                         [('insert', 'guest', guest_id, self.test_user.id),
+                          ('update', 'guest', guest_id, self.test_user.id)])
+        self.assertIn('comment', audit[1]['changed'])
+
+        # Test that a disabled log writes nothing
+        self.app.config['REQUEST_LOG_ENABLED'] = False
+        self.client.get('/api/guests', headers=self.headers)
+        self.assertEqual(len(self.read_log()), len(records))
+
+    def test_bulk_audit_log(self):
+        for days_ago in (10, 20, 30):
+            db.session.add(Guest(household_id=self.household.id, room_id=self.test_room.id,
+                                 guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id,
+                                 coming_date=date.today() - timedelta(days=days_ago),
+                                 coming_time=time(10), exit_time=time(12)))
+        db.session.add(Guest(household_id=self.household.id, room_id=self.test_room.id,
+                             guest_type_id=self.test_guest_type.id, inviter_id=self.test_user.id,
+                             coming_date=date.today() + timedelta(days=1), coming_time=time(10), exit_time=time(12)))
+        unused_type = GuestType(name='Unused', household_id=self.household.id)
+        db.session.add(unused_type)
+        db.session.flush()
+        db.session.add(GuestStats(date=date.today(), inviter_id=self.test_user.id, guest_type_id=unused_type.id,
+                                  household_id=self.household.id))
+        db.session.commit()
+
+        # Test one record per bulk statement of the archive and of the deletions of a guest type and the user
+        self.app.test_cli_runner().invoke(args=['guests', 'archive', '--days', '5'])
+        response = self.client.delete('/api/guest_types/{}'.format(unused_type.id), headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+        response = self.client.delete('/api/users/{}'.format(self.test_user.id), headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+        bulk = [record for record in self.read_log() if record['log'] == 'audit' and 'rowcount' in record]
+        self.assertEqual([(record['action'], record['table'], record['rowcount'], record['user_id'])
+                          for record in bulk],
+                         [('bulk_delete', 'guest', 3, None), ('bulk_delete', 'guest_stats', 1, self.test_user.id),
+                          ('bulk_delete', 'guest_history', 3, self.test_user.id),
+                          ('bulk_delete', 'guest', 1, self.test_user.id)])
+        self.assertIn('inviter_id', bulk[2]['filter'])
+        self.assertEqual(list(bulk[2]['params'].values()), [self.test_user.id])
+
+    def test_full_queue_policies(self):
+        dropping = BoundedQueueHandler(queue.Queue(2), policy='drop')
+        blocking = BoundedQueueHandler(queue.Queue(2), policy='block', block_timeout=0.01)
+        for handler in (dropping, blocking):
+            for message in range(5):
+                handler.handle(self.app.logger.makeRecord('access', 20, __file__, 0, message, (), None))
+            self.assertEqual(handler.queue.qsize(), 2)
+            self.assertEqual(handler.dropped, 3)
+        with self.assertRaises(ValueError):
+            BoundedQueueHandler(queue.Queue(2), policy='wait')
+
+
+if __name__ == '__main__':
+    unittest.main()
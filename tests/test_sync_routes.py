@@ -0,0 +1,160 @@
+import unittest
+from datetime import date, datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import Household, User, GuestType, Room, Tombstone
+from app.routes.sync import encode_token
+
+
+class TestSyncBlueprint(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # Every change is newer than the previous token
+        self.app.config['SYNC_TOKEN_OVERLAP'] = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # Create a test user and a guest type in their household
+        self.household = Household(name='Test household')
+        db.session.add(self.household)
+        db.session.flush()
+        self.test_user = User(username='testSyncUser', email='testsyncuser@example.com', password="0000",
+                              household_id=self.household.id)
+        self.test_guest_type = GuestType(name='Friend', household_id=self.household.id)
+        self.test_room = Room(name='Guest room', capacity=1, household_id=self.household.id)
+        db.session.add_all([self.test_user, self.test_guest_type, self.test_room])
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        access_token = create_access_token(identity=self.test_user.id,
+                                           additional_claims={'household_id': self.household.id})
+        self.headers = {'Authorization': 'Bearer {}'.format(access_token)}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sync(self):
+        # Test the first sync returns every row
+        response = self.client.get('/api/sync', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['users']), 1)
+        self.assertEqual(len(response.json['guest_types']), 1)
+        self.assertEqual(len(response.json['rooms']), 1)
+        token = response.json['next_token']
+
+        # Test that nothing is returned when nothing changed
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual(response.json['users'], [])
+        self.assertEqual(response.json['guests'], [])
+
+        # Test that only the changes are returned
+        guest = {
+            'guest_type_id': self.test_guest_type.id,
+            'room_id': self.test_room.id,
+            'coming_date': (date.today() + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'coming_time': '10:00:00',
+            'stay_time': '02:00:00'
+        }
+        guest_id = self.client.post('/api/guests', json=guest, headers=self.headers).json['id']
+        self.client.put('/api/guest_types/{}'.format(self.test_guest_type.id), json={'name': 'Best friend'},
+                        headers=self.headers)
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual([g['id'] for g in response.json['guests']], [guest_id])
+        self.assertEqual([t['name'] for t in response.json['guest_types']], ['Best friend'])
+        self.assertEqual(response.json['users'], [])
+        token = response.json['next_token']
+
+        # Test that deletes are returned as tombstones
+        self.client.delete('/api/guests/{}'.format(guest_id), headers=self.headers)
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual(response.json['guests'], [])
+        self.assertEqual(response.json['deleted']['guests'], [guest_id])
+
+        # Test the recurring guests are synced with their exceptions and deletes
+        series = dict(guest, start_date=guest['coming_date'], frequency='weekly')
+        del series['coming_date']
+        series_id = self.client.post('/api/guests/series', json=series, headers=self.headers).json['id']
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual([s['id'] for s in response.json['guest_series']], [series_id])
+        token = response.json['next_token']
+        self.client.post('/api/guests/series/{}/exceptions'.format(series_id), json={'date': guest['coming_date']},
+                         headers=self.headers)
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual([s['exceptions'] for s in response.json['guest_series']], [[guest['coming_date']]])
+        token = response.json['next_token']
+        self.client.delete('/api/guests/series/{}'.format(series_id), headers=self.headers)
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual(response.json['guest_series'], [])
+        self.assertEqual(response.json['deleted']['guest_series'], [series_id])
+
+        # Test the malformed token
+        response = self.client.get('/api/sync?since=yesterday', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_tombstone_retention(self):
+        # Tombstones of a delete before the retention and of a recent one
+        retention = self.app.config['SYNC_TOMBSTONE_RETENTION_DAYS']
+        db.session.add_all([
+            Tombstone(household_id=self.household.id, table_name='guest', row_id=1,
+                      deleted_at=datetime.utcnow() - timedelta(days=retention + 1)),
+            Tombstone(household_id=self.household.id, table_name='guest', row_id=2, deleted_at=datetime.utcnow())])
+        db.session.commit()
+
+        # Test that only the old one is pruned
+        result = self.app.test_cli_runner().invoke(args=['sync', 'prune'])
+        self.assertIn('Pruned 1 tombstones', result.output)
+        self.assertEqual(db.session.scalars(db.select(Tombstone.row_id)).all(), [2])
+
+        # Test a token older than the retention requires a full resync and a recent one doesn't
+        old_token = encode_token(datetime.utcnow() - timedelta(days=retention, minutes=1))
+        response = self.client.get('/api/sync?since=' + old_token, headers=self.headers)
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json['full_resync_required'])
+        recent_token = encode_token(datetime.utcnow() - timedelta(days=retention - 1))
+        response = self.client.get('/api/sync?since=' + recent_token, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['deleted']['guests'], [2])
+
+    def test_sync_pages(self):
+        self.app.config['SYNC_PAGE_SIZE'] = 2
+        db.session.add_all([GuestType(name='Type {}'.format(i), household_id=self.household.id) for i in range(4)] +
+                           [Room(name='Room {}'.format(i), capacity=1, household_id=self.household.id)
+                            for i in range(2)])
+        db.session.commit()
+
+        # Test the first sync is split into pages with every row sent once
+        seen = {'users': [], 'guest_types': [], 'rooms': []}
+        token = None
+        while True:
+            response = self.client.get('/api/sync' + ('?since=' + token if token else ''), headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(sum(len(response.json[name]) for name in seen), 2)
+            for name in seen:
+                seen[name] += [row['id'] for row in response.json[name]]
+            token = response.json['next_token']
+            if not response.json['has_more']:
+                break
+        self.assertEqual(sorted(seen['guest_types']), [t.id for t in GuestType.query.order_by(GuestType.id)])
+        self.assertEqual(sorted(seen['rooms']), [r.id for r in Room.query.order_by(Room.id)])
+        self.assertEqual(seen['users'], [self.test_user.id])
+
+        # Test the token of the last page is a sync token and the deletes are paged too
+        self.assertTrue(token.isdigit())
+        db.session.add_all([Tombstone(household_id=self.household.id, table_name='guest', row_id=row_id)
+                            for row_id in range(1, 4)])
+        db.session.commit()
+        response = self.client.get('/api/sync?since=' + token, headers=self.headers)
+        self.assertEqual(response.json['deleted']['guests'], [1, 2])
+        self.assertTrue(response.json['has_more'])
+        response = self.client.get('/api/sync?since=' + response.json['next_token'], headers=self.headers)
+        self.assertEqual(response.json['deleted']['guests'], [3])
+        self.assertFalse(response.json['has_more'])
+
+        # Test a malformed page token is refused
+        response = self.client.get('/api/sync?since=notatoken', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
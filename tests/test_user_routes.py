@@ -3,8 +3,10 @@ import os
 import unittest
 from random import randint
 
+from flask_jwt_extended import create_access_token
+
 from app import create_app, db
-from app.models import User
+from app.models import Household, User
 
 
 class TestUserBlueprint(unittest.TestCase):
@@ -14,8 +16,12 @@ class TestUserBlueprint(unittest.TestCase):
         self.app_context.push()
         db.create_all()
 
-        # Create a test user
-        self.first_test_user = User(username='testUse2', email='testuser1@example.com', password="0000")
+        # Create a test user in a household
+        self.household = Household(name='Test household')
+        db.session.add(self.household)
+        db.session.flush()
+        self.first_test_user = User(username='testUse2', email='testuser1@example.com', password="0000",
+                                    household_id=self.household.id)
         db.session.add(self.first_test_user)
         db.session.commit()
 
@@ -89,3 +95,29 @@ class TestUserBlueprint(unittest.TestCase):
         for u in test_users_invalid_username:
             response = self.client.post('/api/users', json=u)
             self.assertEqual(response.status_code, 400)
+
+    def test_search_users(self):
+        other_household = Household(name='Other household')
+        db.session.add(other_household)
+        db.session.flush()
+        db.session.add_all([User(username='Alice', email='wonderland@example.com', password='0000',
+                                 household_id=self.household.id),
+                            User(username='bob', email='ALBERT@example.com', password='0000',
+                                 household_id=self.household.id),
+                            User(username='alan', email='alan@example.com', password='0000',
+                                 household_id=other_household.id)])
+        db.session.commit()
+        access_token = create_access_token(identity=self.first_test_user.id,
+                                           additional_claims={'household_id': self.household.id})
+        headers = {'Authorization': 'Bearer {}'.format(access_token)}
+
+        # Test the prefix matches the usernames and the emails in any case, in the household only
+        response = self.client.get('/api/users/search?prefix=AL', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['username'] for user in response.json['users']], ['Alice', 'bob'])
+        response = self.client.get('/api/users/search?prefix=wonder&limit=1', headers=headers)
+        self.assertEqual([user['username'] for user in response.json['users']], ['Alice'])
+
+        # Test searching without a prefix
+        response = self.client.get('/api/users/search?prefix=', headers=headers)
+        self.assertEqual(response.status_code, 400)